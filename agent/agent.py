@@ -1,50 +1,43 @@
 #!/usr/bin/env python3
-import os, time, requests
+import os
 from pathlib import Path
 from dotenv import load_dotenv
+from shipper import Shipper, OffsetStore
+from tailer import Tailer
 load_dotenv(dotenv_path=Path(__file__).parent / ".env")
 
 SIEM_API_URL = os.getenv("SIEM_API_URL", "http://127.0.0.1:8000/logs")
 SIEM_API_KEY = os.getenv("SIEM_API_KEY", "testkey123")
-AUTH_LOG = os.getenv("AUTH_LOG", "./agent/test_auth.log")
+AUTH_LOG = os.getenv("AUTH_LOG", "./agent/test_auth.log")  # comma-separated paths/globs
 SOURCE = os.getenv("SOURCE", "agent-host")
 POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "0.5"))
-headers = {"x-api-key": SIEM_API_KEY, "Content-Type": "application/json"}
-
-def tail_file(path):
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    if not path.exists():
-        path.write_text("")
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        f.seek(0, 2)
-        while True:
-            line = f.readline()
-            if not line:
-                time.sleep(POLL_INTERVAL)
-                continue
-            yield line.rstrip("\n")
-
-def build_payload(line):
-    from datetime import datetime
-    return {"source": SOURCE, "timestamp": datetime.utcnow().isoformat() + "Z", "message": line}
-
-def post_line(line):
-    try:
-        r = requests.post(SIEM_API_URL, headers=headers, json=build_payload(line), timeout=5)
-        if r.status_code not in (200,201):
-            print(f"[agent] WARN status={r.status_code} body={r.text}")
-        else:
-            print(f"[agent] posted: {line[:120]}")
-    except Exception as e:
-        print("[agent] ERROR posting:", e)
+ROTATE_GRACE = float(os.getenv("ROTATE_GRACE", "2.0"))  # seconds a rotated file is still read
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "1.0"))
+SPOOL_PATH = os.getenv("SPOOL_PATH", str(Path(__file__).parent / "agent.spool"))
+OFFSETS_PATH = os.getenv("OFFSETS_PATH", str(Path(__file__).parent / "agent.offsets.json"))
 
 def main():
-    print(f"[agent] tailing {AUTH_LOG}, posting to {SIEM_API_URL}")
-    for ln in tail_file(AUTH_LOG):
-        if ln.strip():
-            post_line(ln)
+    patterns = [p.strip() for p in AUTH_LOG.split(",") if p.strip()]
+    for p in patterns:
+        if "*" not in p and not Path(p).exists():
+            Path(p).parent.mkdir(parents=True, exist_ok=True)
+            Path(p).write_text("")
+    offsets = OffsetStore(OFFSETS_PATH)
+    tailer = Tailer(patterns, offsets, poll_interval=POLL_INTERVAL, rotate_grace=ROTATE_GRACE)
+    print(f"[agent] tailing {patterns} ({tailer.mode}), posting to {SIEM_API_URL}")
+    shipper = Shipper(SIEM_API_URL, SIEM_API_KEY, batch_size=BATCH_SIZE,
+                      flush_interval=FLUSH_INTERVAL, spool_path=SPOOL_PATH, offsets=offsets)
+    shipper.start()
+    try:
+        for path, ln, inode, offset in tailer.follow():
+            if ln.strip():
+                shipper.add(SOURCE, ln, (path, inode, offset))
+    except KeyboardInterrupt:
+        print("[agent] stopping")
+    finally:
+        shipper.close()
+        tailer.close()
 
 if __name__ == "__main__":
     main()
-
@@ -7,6 +7,9 @@ Usage examples:
   # Tail a log file and send new lines
   python agent.py /var/log/auth.log
 
+  # Follow several files / globs from one process
+  python agent.py /var/log/auth.log '/var/log/nginx/*.log'
+
   # Tail with explicit options
   python agent.py /var/log/auth.log \
       --api-url http://127.0.0.1:8000/logs \
@@ -14,107 +17,40 @@ Usage examples:
       --source home-lab
 
 The agent:
-  - Follows the file (like `tail -F`)
+  - Follows one or more files or globs (like `tail -F`) via inotify, with a
+    polling fallback; handles logrotate and truncation and resumes from the
+    last saved offset
   - Wraps each line into JSON {source, timestamp, message}
-  - Sends it to the backend /logs with x-api-key
+  - Sends gzip'd NDJSON batches to the backend /logs/batch with x-api-key
+    over one keep-alive session
+  - Spools batches to disk while the backend is down and replays them in order
 """
 
 import argparse
-import json
 import os
-import time
-from datetime import datetime, timezone
-from typing import Iterator
+import sys
 
-import requests
+# shared shipper/tailer live next to the top-level agent
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shipper import OffsetStore, Shipper  # noqa: E402
+from tailer import Tailer  # noqa: E402
 
 
 DEFAULT_API_URL = "http://127.0.0.1:8000/logs"
 DEFAULT_API_KEY = "testkey123"   # change if you changed backend settings
 DEFAULT_SOURCE = "home-lab"
-RETRY_SLEEP_SECONDS = 2.0
-
-
-def iso_utc_now() -> str:
-    """Return current time in ISO8601 with Z."""
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-
-
-def follow_file(path: str) -> Iterator[str]:
-    """
-    Follow a file forever, yielding new lines as they are written.
-    Similar to: tail -F
-    """
-    # Wait until file exists
-    while not os.path.exists(path):
-        print(f"[agent] Waiting for file {path} to appear...")
-        time.sleep(1.0)
-
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        # Jump to end of file
-        f.seek(0, os.SEEK_END)
-
-        while True:
-            line = f.readline()
-            if not line:
-                time.sleep(0.2)
-                continue
-
-            # Strip trailing newline
-            yield line.rstrip("\r\n")
-
-
-def send_log_line(
-    api_url: str,
-    api_key: str,
-    source: str,
-    line: str,
-    dry_run: bool = False,
-) -> None:
-    """
-    Wrap a single log line and send it to the mini-SIEM backend.
-    """
-    payload = {
-        "source": source,
-        "timestamp": iso_utc_now(),
-        "message": line,
-    }
-
-    if dry_run:
-        print(f"[dry-run] Would send: {json.dumps(payload)}")
-        return
-
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key,
-    }
-
-    while True:
-        try:
-            resp = requests.post(api_url, headers=headers, json=payload, timeout=5)
-        except Exception as exc:
-            print(f"[agent] Error sending log line: {exc!r}")
-            print(f"[agent] Retrying in {RETRY_SLEEP_SECONDS} seconds...")
-            time.sleep(RETRY_SLEEP_SECONDS)
-            continue
-
-        if resp.status_code >= 200 and resp.status_code < 300:
-            # Optional: comment this out if it becomes too noisy
-            print(f"[agent] Sent line (status {resp.status_code})")
-            return
-
-        print(
-            f"[agent] Backend returned {resp.status_code}: {resp.text!r}. "
-            f"Retrying in {RETRY_SLEEP_SECONDS} seconds..."
-        )
-        time.sleep(RETRY_SLEEP_SECONDS)
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_SPOOL = "agent.spool"
+DEFAULT_OFFSETS = "agent.offsets.json"
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="mini-SIEM log shipping agent")
     parser.add_argument(
-        "logfile",
-        help="Path to log file to follow (e.g. /var/log/auth.log)",
+        "logfiles",
+        nargs="+",
+        help="Log files or globs to follow (e.g. /var/log/auth.log '/var/log/*.log')",
     )
     parser.add_argument(
         "--api-url",
@@ -131,6 +67,33 @@ def main() -> None:
         default=DEFAULT_SOURCE,
         help=f'Source name to tag logs with (default: "{DEFAULT_SOURCE}")',
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Max lines per batch (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL,
+        help=f"Max seconds to hold a partial batch (default: {DEFAULT_FLUSH_INTERVAL})",
+    )
+    parser.add_argument(
+        "--spool",
+        default=DEFAULT_SPOOL,
+        help=f"Spool file used while the backend is down (default: {DEFAULT_SPOOL})",
+    )
+    parser.add_argument(
+        "--offsets",
+        default=DEFAULT_OFFSETS,
+        help=f"File storing the last shipped offset (default: {DEFAULT_OFFSETS})",
+    )
+    parser.add_argument(
+        "--no-gzip",
+        action="store_true",
+        help="Send batches uncompressed",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -140,28 +103,37 @@ def main() -> None:
     args = parser.parse_args()
 
     print("[agent] Starting mini-SIEM agent")
-    print(f"[agent]  Log file : {args.logfile}")
-    print(f"[agent]  API URL  : {args.api-url if hasattr(args, 'api-url') else args.api_url}")
+    print(f"[agent]  Log files: {', '.join(args.logfiles)}")
+    print(f"[agent]  API URL  : {args.api_url}")
     print(f"[agent]  Source   : {args.source}")
     if args.dry_run:
         print("[agent]  Mode     : DRY RUN (no data will be sent)")
     else:
         print("[agent]  Mode     : LIVE (sending to backend)")
 
-    # Fix for attr name with dash in debug print above
-    api_url = args.api_url
+    offsets = OffsetStore(args.offsets)
+    shipper = Shipper(
+        args.api_url,
+        args.api_key,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+        spool_path=args.spool,
+        offsets=offsets,
+        compress=not args.no_gzip,
+        dry_run=args.dry_run,
+    )
+    tailer = Tailer(args.logfiles, offsets)
+    print(f"[agent]  Watcher  : {tailer.mode}")
+    shipper.start()
 
     try:
-        for line in follow_file(args.logfile):
-            send_log_line(
-                api_url=api_url,
-                api_key=args.api_key,
-                source=args.source,
-                line=line,
-                dry_run=args.dry_run,
-            )
+        for path, line, inode, offset in tailer.follow():
+            shipper.add(args.source, line, (path, inode, offset))
     except KeyboardInterrupt:
         print("\n[agent] Stopping (Ctrl+C)")
+    finally:
+        shipper.close()
+        tailer.close()
 
 
 if __name__ == "__main__":
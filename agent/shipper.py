@@ -0,0 +1,318 @@
+"""
+Batching log shipper shared by the mini-SIEM agents.
+
+  - One keep-alive requests.Session (pooled connections) for all sends
+  - Lines are buffered and sent to /logs/batch as gzip'd NDJSON when the
+    buffer reaches batch_size or flush_interval seconds have passed
+  - If the backend is unreachable, batches are appended to a local spool
+    file and replayed in order once it comes back
+  - File offsets are persisted only after a batch is delivered or spooled,
+    so a restart resumes exactly where the last durable batch ended
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (path, inode, byte offset just past the line)
+Cursor = Tuple[str, int, int]
+
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def iso_utc_now() -> str:
+    """Return current time in ISO8601 with Z."""
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def batch_url_for(api_url: str) -> str:
+    """Map the single-log endpoint (.../logs) to the batch endpoint."""
+    api_url = api_url.rstrip("/")
+    if api_url.endswith("/logs/batch"):
+        return api_url
+    if api_url.endswith("/logs"):
+        return api_url + "/batch"
+    return api_url + "/logs/batch"
+
+
+def _write_atomic(path: str, data: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class OffsetStore:
+    """
+    Persists {path: {"inode": ..., "offset": ...}} as JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, int]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def get(self, file_path: str) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            entry = self._data.get(os.path.abspath(file_path))
+        if not entry:
+            return None
+        return entry["inode"], entry["offset"]
+
+    def update(self, cursors: Dict[str, Tuple[int, int]]) -> None:
+        if not cursors:
+            return
+        with self._lock:
+            for file_path, (inode, offset) in cursors.items():
+                self._data[os.path.abspath(file_path)] = {"inode": inode, "offset": offset}
+            _write_atomic(self.path, json.dumps(self._data))
+
+
+class Spool:
+    """
+    Append-only NDJSON spool with a persisted read position.
+    The file is truncated once every spooled record has been replayed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pos_path = path + ".pos"
+        try:
+            with open(self.pos_path, "r", encoding="utf-8") as f:
+                self.pos = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            self.pos = 0
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def pending(self) -> bool:
+        return self.size() > self.pos
+
+    def append(self, lines: List[bytes]) -> None:
+        with open(self.path, "ab") as f:
+            for ln in lines:
+                f.write(ln + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, max_records: int) -> Tuple[List[bytes], int]:
+        """Return up to max_records lines from the read position and the new position."""
+        lines: List[bytes] = []
+        with open(self.path, "rb") as f:
+            f.seek(self.pos)
+            while len(lines) < max_records:
+                ln = f.readline()
+                if not ln.endswith(b"\n"):
+                    break
+                lines.append(ln.rstrip(b"\n"))
+            return lines, f.tell() if lines else self.pos
+
+    def commit(self, new_pos: int) -> None:
+        if new_pos >= self.size():
+            # fully replayed: start over with an empty spool
+            open(self.path, "wb").close()
+            self.pos = 0
+        else:
+            self.pos = new_pos
+        _write_atomic(self.pos_path, str(self.pos))
+
+
+class Shipper:
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        *,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        spool_path: str = "agent.spool",
+        offsets: Optional[OffsetStore] = None,
+        compress: bool = True,
+        timeout: float = 5.0,
+        dry_run: bool = False,
+    ):
+        self.url = batch_url_for(api_url)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = batch_size * 10
+        self.spool = Spool(spool_path)
+        self.offsets = offsets
+        self.compress = compress
+        self.timeout = timeout
+        self.dry_run = dry_run
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "x-api-key": api_key,
+            "Content-Type": "application/x-ndjson",
+        })
+        if compress:
+            self.session.headers["Content-Encoding"] = "gzip"
+
+        self._buf: List[Tuple[bytes, Optional[Cursor]]] = []
+        self._first_at = 0.0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+    # ---------- producer side ----------
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="shipper", daemon=True)
+        self._thread.start()
+
+    def add(self, source: str, line: str, cursor: Optional[Cursor] = None) -> None:
+        """
+        Queue one line. Blocks only if the in-memory buffer is full, which
+        can't last long because the sender spools when the backend is down.
+        """
+        record = {"source": source, "timestamp": iso_utc_now(), "message": line}
+        if cursor is not None:
+            # per-file tag so one agent can follow many files
+            record["file"] = cursor[0]
+        encoded = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        with self._cond:
+            while len(self._buf) >= self.max_buffer and not self._stopping:
+                self._cond.wait()
+            if not self._buf:
+                self._first_at = time.monotonic()
+            self._buf.append((encoded, cursor))
+            if len(self._buf) >= self.batch_size:
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        """Flush everything buffered, then stop the sender thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.session.close()
+
+    # ---------- sender thread ----------
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._stopping or len(self._buf) >= self.batch_size:
+                        break
+                    if self._buf and now - self._first_at >= self.flush_interval:
+                        break
+                    timeout = self.flush_interval
+                    if self._buf:
+                        timeout = self._first_at + self.flush_interval - now
+                    if self.spool.pending():
+                        if now >= self._retry_at:
+                            break
+                        timeout = min(timeout, self._retry_at - now)
+                    self._cond.wait(timeout)
+
+                batch = self._buf[:self.batch_size]
+                del self._buf[:self.batch_size]
+                if self._buf:
+                    self._first_at = time.monotonic()
+                self._cond.notify_all()
+                stopping = self._stopping
+
+            self._deliver(batch, final=stopping)
+            if stopping and not batch:
+                return
+
+    def _deliver(self, batch: List[Tuple[bytes, Optional[Cursor]]], final: bool = False) -> None:
+        lines = [enc for enc, _ in batch]
+
+        # older spooled data must go out first to keep ordering
+        if self.spool.pending() and not final and time.monotonic() >= self._retry_at:
+            self._replay_spool()
+
+        if lines:
+            if self.spool.pending() or not self._send(lines):
+                self.spool.append(lines)
+            self._commit_offsets(batch)
+
+    def _replay_spool(self) -> None:
+        while self.spool.pending():
+            lines, new_pos = self.spool.read(self.batch_size)
+            if not lines:
+                # torn trailing write from a crash: skip it
+                self.spool.commit(self.spool.size())
+                return
+            if not self._send(lines):
+                return
+            self.spool.commit(new_pos)
+            print(f"[agent] Replayed {len(lines)} spooled lines")
+
+    def _send(self, lines: List[bytes]) -> bool:
+        """
+        POST one batch. Returns False if the batch should be spooled and retried.
+        """
+        if self.dry_run:
+            for ln in lines:
+                print(f"[dry-run] Would send: {ln.decode('utf-8')}")
+            return True
+
+        body = b"\n".join(lines)
+        if self.compress:
+            body = gzip.compress(body, compresslevel=5)
+        try:
+            resp = self.session.post(self.url, data=body, timeout=self.timeout)
+        except requests.RequestException as exc:
+            return self._failed(f"Error sending batch: {exc!r}")
+
+        if 200 <= resp.status_code < 300:
+            self._backoff = 0.0
+            self._retry_at = 0.0
+            try:
+                rejected = resp.json().get("rejected", 0)
+            except ValueError:
+                rejected = 0
+            print(f"[agent] Sent {len(lines)} lines (status {resp.status_code}, rejected {rejected})")
+            return True
+
+        if resp.status_code in (400, 413, 422):
+            # the batch itself is bad; retrying would loop forever
+            print(f"[agent] Backend rejected batch {resp.status_code}: {resp.text!r}. Dropping it.")
+            return True
+
+        return self._failed(f"Backend returned {resp.status_code}: {resp.text!r}")
+
+    def _failed(self, reason: str) -> bool:
+        self._backoff = min(max(self._backoff * 2, 1.0), MAX_BACKOFF_SECONDS)
+        self._retry_at = time.monotonic() + self._backoff
+        print(f"[agent] {reason}. Spooling, retry in {self._backoff:.0f}s")
+        return False
+
+    def _commit_offsets(self, batch: List[Tuple[bytes, Optional[Cursor]]]) -> None:
+        if self.offsets is None:
+            return
+        latest: Dict[str, Tuple[int, int]] = {}
+        for _, cursor in batch:
+            if cursor is not None:
+                path, inode, offset = cursor
+                latest[path] = (inode, offset)
+        self.offsets.update(latest)
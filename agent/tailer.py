@@ -0,0 +1,283 @@
+"""
+Multi-file, rotation-aware tailer for the mini-SIEM agents.
+
+  - Follows any number of paths or globs (e.g. /var/log/*.log); files that
+    appear later are picked up automatically
+  - Waits on inotify (Linux, via ctypes) and falls back to polling elsewhere
+  - Detects logrotate (inode change) and truncation; the rotated file is
+    kept open for a grace period so writers that haven't reopened yet are
+    not lost, and a trailing line without newline is flushed before
+    switching to the new one
+  - Reads in large chunks and splits lines itself instead of readline()
+"""
+
+import ctypes
+import ctypes.util
+import glob
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from shipper import OffsetStore
+
+CHUNK_SIZE = 256 * 1024
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_LAYOUT_CHANGE = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_Q_OVERFLOW
+_EVENT_HDR = struct.Struct("iIII")
+
+# (path, line, inode, offset just past the line)
+TailEvent = Tuple[str, str, int, int]
+
+
+class _Inotify:
+    """Minimal ctypes binding; construct() returns None if unavailable."""
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self.fd = fd
+        self._dirs: Dict[int, str] = {}
+
+    @classmethod
+    def construct(cls) -> Optional["_Inotify"]:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def watch_dir(self, directory: str) -> None:
+        if directory in self._dirs.values():
+            return
+        wd = self._libc.inotify_add_watch(self.fd, directory.encode(), _WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = directory
+
+    def wait(self, timeout: float) -> Optional[List[Tuple[str, int]]]:
+        """
+        Block until events arrive or timeout. Returns [(path, mask), ...],
+        or None on timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return None
+        events: List[Tuple[str, int]] = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            i = 0
+            while i + _EVENT_HDR.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT_HDR.unpack_from(buf, i)
+                i += _EVENT_HDR.size
+                name = buf[i:i + length].rstrip(b"\0").decode(errors="ignore")
+                i += length
+                directory = self._dirs.get(wd)
+                if directory is not None:
+                    events.append((os.path.join(directory, name), mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _TailedFile:
+    def __init__(self, path: str, start: Optional[int]):
+        """start=None means seek to end of file."""
+        self.path = path
+        self.fh = open(path, "rb", buffering=0)
+        st = os.fstat(self.fh.fileno())
+        self.inode = st.st_ino
+        if start is None or start > st.st_size:
+            start = st.st_size
+        self.fh.seek(start)
+        self.pos = start          # offset up to which lines have been emitted
+        self.partial = b""
+        self.rotated_at: Optional[float] = None   # monotonic time the path got a new inode
+
+    def read_lines(self) -> Iterator[Tuple[str, int]]:
+        """Read everything available in large chunks; yield (line, offset_after)."""
+        while True:
+            chunk = self.fh.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            data = self.partial + chunk
+            start = 0
+            while True:
+                nl = data.find(b"\n", start)
+                if nl < 0:
+                    break
+                self.pos += nl + 1 - start
+                yield data[start:nl].decode("utf-8", errors="ignore").rstrip("\r"), self.pos
+                start = nl + 1
+            self.partial = data[start:]
+
+    def flush_partial(self) -> Optional[Tuple[str, int]]:
+        """The unterminated tail as a final (line, offset_after), if any."""
+        if not self.partial:
+            return None
+        self.pos += len(self.partial)
+        line = self.partial.decode("utf-8", errors="ignore").rstrip("\r")
+        self.partial = b""
+        return line, self.pos
+
+    def rewind(self) -> None:
+        self.fh.seek(0)
+        self.pos = 0
+        self.partial = b""
+
+    def close(self) -> None:
+        self.fh.close()
+
+
+class Tailer:
+    def __init__(
+        self,
+        patterns: List[str],
+        offsets: OffsetStore,
+        *,
+        poll_interval: float = 0.5,
+        use_inotify: bool = True,
+        rotate_grace: float = 2.0,
+    ):
+        """
+        rotate_grace: seconds a rotated file keeps being read before the
+            tailer switches to the new file at the same path.
+        """
+        self.patterns = patterns
+        self.offsets = offsets
+        self.poll_interval = poll_interval
+        self.rotate_grace = rotate_grace
+        self._files: Dict[str, _TailedFile] = {}
+        self._inotify = _Inotify.construct() if use_inotify else None
+        self._started = False
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "polling"
+
+    def _expand(self) -> List[str]:
+        paths: List[str] = []
+        for pattern in self.patterns:
+            matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+            paths.extend(os.path.abspath(p) for p in matches if os.path.isfile(p))
+        return paths
+
+    def _discover(self) -> None:
+        if self._inotify is not None:
+            for pattern in self.patterns:
+                directory = os.path.dirname(os.path.abspath(pattern))
+                if os.path.isdir(directory):
+                    self._inotify.watch_dir(directory)
+
+        for path in self._expand():
+            if path in self._files:
+                continue
+            saved = self.offsets.get(path)
+            try:
+                inode = os.stat(path).st_ino
+            except OSError:
+                continue
+            if saved and saved[0] == inode:
+                start: Optional[int] = saved[1]
+            elif saved or self._started:
+                # rotated while we were down, or created after startup
+                start = 0
+            else:
+                # first time we ever see this file: behave like tail -F
+                start = None
+            try:
+                self._files[path] = _TailedFile(path, start)
+            except OSError:
+                continue
+            print(f"[agent] Following {path}")
+
+    def _check(self, tf: _TailedFile) -> Iterator[TailEvent]:
+        for line, offset in tf.read_lines():
+            yield tf.path, line, tf.inode, offset
+
+        try:
+            st = os.stat(tf.path)
+        except OSError:
+            # removed (rotation in progress); keep draining until it reappears
+            return
+        if st.st_ino != tf.inode:
+            # rotated: writers may still append to the old file until they
+            # reopen, so keep draining it for the grace period
+            now = time.monotonic()
+            if tf.rotated_at is None:
+                tf.rotated_at = now
+            if now - tf.rotated_at < self.rotate_grace:
+                return
+            last = tf.flush_partial()
+            if last is not None:
+                yield tf.path, last[0], tf.inode, last[1]
+            tf.close()
+            del self._files[tf.path]
+            try:
+                self._files[tf.path] = _TailedFile(tf.path, 0)
+            except OSError:
+                return
+            print(f"[agent] {tf.path} rotated, following new file")
+            yield from self._check(self._files[tf.path])
+        elif st.st_size < tf.pos:
+            print(f"[agent] {tf.path} truncated, reading from start")
+            tf.rewind()
+            yield from self._check(tf)
+
+    def follow(self) -> Iterator[TailEvent]:
+        """Yield (path, line, inode, offset_after_line) forever."""
+        self._discover()
+        self._started = True
+        if not self._files:
+            print(f"[agent] Waiting for files matching {self.patterns} to appear...")
+
+        for tf in list(self._files.values()):
+            yield from self._check(tf)
+
+        while True:
+            rotating = any(tf.rotated_at is not None for tf in self._files.values())
+            if self._inotify is not None:
+                # writes to a rotated file arrive under its new name, so
+                # wake up often enough to drain it and end the grace period
+                events = self._inotify.wait(self.poll_interval * (1 if rotating else 10))
+            else:
+                time.sleep(self.poll_interval)
+                events = None
+
+            if events is None or any(mask & _LAYOUT_CHANGE for _, mask in events):
+                # timeout / polling / files created or moved: full rescan
+                self._discover()
+                targets = list(self._files.values())
+            else:
+                touched = {path for path, _ in events}
+                targets = [tf for p, tf in list(self._files.items()) if p in touched]
+
+            for tf in targets:
+                if tf.path in self._files:
+                    yield from self._check(self._files[tf.path])
+
+    def close(self) -> None:
+        for tf in self._files.values():
+            tf.close()
+        self._files.clear()
+        if self._inotify is not None:
+            self._inotify.close()
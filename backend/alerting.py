@@ -0,0 +1,122 @@
+# backend/alerting.py
+# Alert aggregation in front of _create_alert. Alerts are keyed by
+# (type, ip, source): the first hit opens (inserts) an alert, further hits
+# inside the suppression window only bump an in-memory counter and
+# last_seen, and the aggregate is flushed with one update per dirty alert.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AlertKey = Tuple[str, Optional[str], str]
+
+# create_fn(**alert) -> inserted id ; flush_fn([(id, inc, last_seen, description), ...])
+CreateFn = Callable[..., Awaitable[Any]]
+FlushFn = Callable[[List[Tuple[Any, int, datetime, str]]], Awaitable[None]]
+
+
+class _Open:
+    __slots__ = ("alert_id", "opened", "last_seen", "count", "pending", "description", "touched")
+
+    def __init__(self, alert_id: Any, ts: datetime, description: str):
+        self.alert_id = alert_id
+        self.opened = ts
+        self.last_seen = ts
+        self.count = 1
+        self.pending = 0
+        self.description = description
+        self.touched = time.monotonic()
+
+
+class AlertAggregator:
+    def __init__(
+        self,
+        create: CreateFn,
+        flush: FlushFn,
+        *,
+        window_seconds: float = 300,
+        max_open: int = 50000,
+    ):
+        self._create = create
+        self._flush = flush
+        self.window = timedelta(seconds=window_seconds)
+        self.max_open = max_open
+        self._open: "OrderedDict[AlertKey, _Open]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+        self.opened = 0
+        self.suppressed = 0
+        self.flushes = 0
+
+    async def submit(self, **alert: Any) -> None:
+        """
+        alert: the _create_alert kwargs (source, timestamp, severity, type_,
+        description, ip). timestamp must be a datetime.
+        """
+        async with self._lock:
+            await self._submit(alert)
+
+    async def _submit(self, alert: Dict[str, Any]) -> None:
+        key: AlertKey = (alert["type_"], alert.get("ip"), alert.get("source", "unknown"))
+        ts: datetime = alert["timestamp"]
+
+        entry = self._open.get(key)
+        if entry is not None and ts - entry.opened <= self.window:
+            entry.count += 1
+            entry.pending += 1
+            if ts > entry.last_seen:
+                entry.last_seen = ts
+            entry.description = alert["description"]
+            entry.touched = time.monotonic()
+            self._open.move_to_end(key)
+            self.suppressed += 1
+            return
+
+        if entry is not None:
+            # window over: persist the final tally, then start a new alert
+            await self._flush_entries([entry])
+            del self._open[key]
+
+        alert_id = await self._create(**alert)
+        self._open[key] = _Open(alert_id, ts, alert["description"])
+        self.opened += 1
+
+        if len(self._open) > self.max_open:
+            _, cold = self._open.popitem(last=False)
+            await self._flush_entries([cold])
+
+    async def _flush_entries(self, entries: List[_Open]) -> None:
+        updates = []
+        for e in entries:
+            if e.pending and e.alert_id is not None:
+                updates.append((e.alert_id, e.pending, e.last_seen, e.description))
+                e.pending = 0
+        if updates:
+            await self._flush(updates)
+            self.flushes += 1
+
+    async def flush(self, idle_seconds: Optional[float] = None) -> None:
+        """
+        Write pending counters for every open alert. Entries idle for longer
+        than idle_seconds (wall clock) are dropped from memory afterwards.
+        """
+        async with self._lock:
+            await self._flush_entries(list(self._open.values()))
+            if idle_seconds is not None:
+                cutoff = time.monotonic() - idle_seconds
+                for key in [k for k, e in self._open.items() if e.touched < cutoff]:
+                    del self._open[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window.total_seconds(),
+            "open": len(self._open),
+            "opened": self.opened,
+            "suppressed": self.suppressed,
+            "flushes": self.flushes,
+        }
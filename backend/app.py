@@ -1,42 +1,46 @@
 # backend/app.py
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Any, Dict
 import requests
 import asyncio 
+import json
+import zlib
 
 from fastapi import (
     FastAPI, BackgroundTasks, Header, HTTPException, Depends,
-    WebSocket, WebSocketDisconnect, Query
+    WebSocket, WebSocketDisconnect, Query, Request, Response
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
 from backend.models import LogIn
-from backend.crud import insert_log, recent_logs, recent_alerts
-from backend.detector import analyze_log
+from backend.crud import recent_logs, recent_alerts
 from backend.config import settings
 from backend.auth import LoginRequest, Token, authenticate_user, create_access_token, get_current_user
-from backend.database import logs_coll, alerts_coll  # PyMongo sync collections
+from backend.indexes import ensure_indexes, index_report
+from backend.ingest import IngestQueue
+from backend.pipeline import stage as detection_stage
+from backend.replay import check_sink, replay_range
+from backend import export, rollups, tiering
+from backend.broadcast import ConnectionManager, MongoChannel, Subscription
+from backend.cache import ALERTS, response_cache
+from backend.database import ws_events_coll
+from backend.sketches import STREAMS, sketches
 
 # ==================== WebSocket Manager ====================
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
-        self.active_connections.append(ws)
-
-    def disconnect(self, ws: WebSocket):
-        self.active_connections = [c for c in self.active_connections if c != ws]
-
-    async def broadcast(self, message: dict):
-        for ws in self.active_connections[:]:
-            try:
-                await ws.send_json(message)
-            except:
-                self.disconnect(ws)
-
-manager = ConnectionManager()
+# Per-client send queues, subscriptions and coalesced frames
+# (backend/broadcast.py): ingest and detection only enqueue, whatever the
+# number or speed of clients. With WS_CHANNEL=mongo, events reach clients
+# connected to any worker.
+manager = ConnectionManager(
+    queue_size=settings.WS_QUEUE_SIZE,
+    policy=settings.WS_SLOW_POLICY,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+    coalesce=settings.WS_COALESCE_MS / 1000,
+    max_pending=settings.WS_MAX_PENDING,
+    channel=MongoChannel(ws_events_coll) if settings.WS_CHANNEL == "mongo" else None,
+)
 
 # ==================== Real-time Broadcasts ====================
 from backend import detector, crud
@@ -44,101 +48,223 @@ from backend import detector, crud
 # Alert broadcast
 orig_alert = detector._create_alert
 async def _ws_alert(**kwargs):
-    await orig_alert(**kwargs)
+    alert_id = await orig_alert(**kwargs)
     ts = kwargs.get("timestamp", datetime.utcnow())
     ts_str = ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
-    await manager.broadcast({
-        "type": "alert",
+    manager.publish_alert({
+        **kwargs,
         "timestamp": ts_str,
         "message": f"[{kwargs.get('severity','INFO')}] {kwargs.get('description','')}",
-        "data": kwargs
     })
+    return alert_id
 detector._create_alert = _ws_alert
 
-# Log broadcast
-orig_log = crud.insert_log
-async def _ws_log(log):
-    await orig_log(log)
-    log_dict = log if isinstance(log, dict) else log.model_dump()
-    ts = log_dict.get("timestamp", datetime.utcnow())
-    ts_str = ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
-    await manager.broadcast({
-        "type": "log",
-        "timestamp": ts_str,
-        "message": log_dict.get("message", ""),
-        "data": log_dict
-    })
-crud.insert_log = _ws_log
+def _ws_doc(doc: dict) -> dict:
+    out = {k: v for k, v in doc.items() if k not in ("_id", "terms")}
+    ts = out.get("timestamp")
+    if hasattr(ts, "isoformat"):
+        out["timestamp"] = ts.isoformat()
+    return out
+
+# Log broadcast: stored logs are coalesced into log_batch frames, published
+# from the documents store_logs() already prepared and wrote
+orig_store_logs = crud.store_logs
+async def _ws_logs(logs):
+    docs, errors = await orig_store_logs(logs)
+    if not manager.wants_events():
+        return docs, errors
+    stored = [_ws_doc(doc) for doc, err in zip(docs, errors) if err is None]
+    if stored:
+        manager.publish_logs(stored)
+    return docs, errors
+crud.store_logs = _ws_logs
+
+# ==================== Ingest Queue ====================
+# Single-log ingest is acknowledged once its batch is written; the writer
+# flushes batches through crud.insert_logs (one insert_many per batch) and
+# the detection stage picks the stored logs up from there.
+async def _flush_logs(batch):
+    return await crud.insert_logs(batch)
+
+ingest_queue = IngestQueue(
+    _flush_logs,
+    max_size=settings.INGEST_QUEUE_SIZE,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_MS / 1000,
+)
 
 # ==================== FastAPI App ====================
 app = FastAPI(title="mini-siem")
 
+# hot/cold tiering job (backend/tiering.py), when ARCHIVE_AFTER_DAYS > 0
+_archiver: Optional[asyncio.Task] = None
+# first start on data that predates rollups: seed them from stored documents
+_seeder: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def _start_ingest():
+    global _archiver, _seeder
+    try:
+        for warning in await ensure_indexes():
+            print(f"[startup] index warning: {warning}")
+    except Exception as exc:
+        # Mongo may still be starting; queries work without indexes, just slower
+        print(f"[startup] could not create indexes: {exc!r}")
+    detector.start_workers(settings.DETECTION_WORKERS)
+    # everything inserted from here on is counted by the rollup writers
+    seed_before = datetime.utcnow()
+    try:
+        seed_cutoff = await rollups.claim_seed(seed_before)
+        if seed_cutoff is not None:
+            _seeder = asyncio.create_task(asyncio.to_thread(rollups.seed, seed_cutoff))
+    except Exception as exc:
+        print(f"[startup] could not seed rollups: {exc!r}")
+    await rollups.writer.start()
+    await sketches.start()
+    await manager.start()
+    # also flushes aggregated alert counts with every checkpoint
+    await detection_stage.start()
+    await ingest_queue.start()
+    if settings.ARCHIVE_AFTER_DAYS > 0:
+        _archiver = asyncio.create_task(
+            tiering.run_archiver(settings.ARCHIVE_AFTER_DAYS, settings.ARCHIVE_INTERVAL_SECONDS)
+        )
+
+@app.on_event("shutdown")
+async def _stop_ingest():
+    if _archiver is not None:
+        _archiver.cancel()
+    # drain whatever is still queued before the process exits
+    await ingest_queue.stop()
+    await detection_stage.stop()
+    detector.stop_workers()
+    await rollups.writer.stop()
+    await sketches.stop()
+    await manager.stop()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
-# ==================== CHART ENDPOINTS – SYNC VERSION (PyMongo) ====================
-@app.get("/stats/alerts-over-time")
-async def alerts_over_time(_=Depends(get_current_user)):
+# ==================== CHART ENDPOINTS ====================
+# Served from the incremental rollups (backend/rollups.py): cost depends on
+# the number of buckets read, not on the number of stored logs/alerts. All
+# open dashboards share one cached body per URL (backend/cache.py).
+async def _alerts_over_time():
     now = datetime.utcnow()
     start = now - timedelta(hours=24)
 
-    pipeline = [
-        {"$match": {"timestamp": {"$gte": start}}},
-        {"$group": {"_id": {"$hour": {"date": "$timestamp", "timezone": "UTC"}}, "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    # PyMongo: aggregate returns iterable cursor → list() it
-    docs = list(alerts_coll.aggregate(pipeline))
-
     full = {f"{h:02d}:00": 0 for h in range(24)}
-    for doc in docs:
-        hour = str(doc["_id"]).zfill(2) + ":00"
-        full[hour] = doc["count"]
+    for bucket, count in await rollups.series(rollups.ALERTS, start):
+        full[f"{bucket.hour:02d}:00"] += count
 
     return [{"hour": h, "count": c} for h, c in full.items()]
 
 
+@app.get("/stats/alerts-over-time")
+async def alerts_over_time(request: Request, _=Depends(get_current_user)):
+    return await response_cache.respond(request, _alerts_over_time, tags=(ALERTS,))
+
+
+async def _severity_distribution():
+    docs = await rollups.top(rollups.ALERTS_SEVERITY, limit=None)
+    return [{"name": (severity or "UNKNOWN").upper(), "value": count} for severity, count in docs]
+
+
 @app.get("/stats/severity-distribution")
-async def severity_distribution(_=Depends(get_current_user)):
-    pipeline = [
-        {"$group": {"_id": "$severity", "value": {"$sum": 1}}},
-        {"$sort": {"value": -1}}
-    ]
-    docs = list(alerts_coll.aggregate(pipeline))
-    return [{"name": (d["_id"] or "UNKNOWN").upper(), "value": d["value"]} for d in docs]
+async def severity_distribution(request: Request, _=Depends(get_current_user)):
+    return await response_cache.respond(request, _severity_distribution, tags=(ALERTS,))
+
+
+async def _top_source_ips():
+    docs = await rollups.top(rollups.ALERTS_IP, limit=10)
+    return [{"ip": ip or "unknown", "count": count} for ip, count in docs]
 
 
 @app.get("/stats/top-source-ips")
-async def top_source_ips(_=Depends(get_current_user)):
-    pipeline = [
-        {"$match": {"$or": [{"source_ip": {"$ne": None}}, {"ip": {"$ne": None}}]}},
-        {"$project": {"ip": {"$ifNull": ["$source_ip", "$ip"]}}},
-        {"$group": {"_id": "$ip", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    docs = list(alerts_coll.aggregate(pipeline))
-    return [{"ip": d["_id"] or "unknown", "count": d["count"]} for d in docs]
+async def top_source_ips(request: Request, _=Depends(get_current_user)):
+    return await response_cache.respond(request, _top_source_ips, tags=(ALERTS,))
 
 
-@app.get("/stats")
-async def get_stats(_=Depends(get_current_user)):
+async def _stats():
     now = datetime.utcnow()
     last_24h = now - timedelta(hours=24)
 
+    total_logs, total_alerts, alerts_24h = await asyncio.gather(
+        rollups.total(rollups.LOGS),
+        rollups.total(rollups.ALERTS),
+        rollups.count_since(rollups.ALERTS, last_24h),
+    )
     return {
-        "total_logs": logs_coll.count_documents({}),
-        "total_alerts": alerts_coll.count_documents({}),
-        "alerts_last_24h": alerts_coll.count_documents({"timestamp": {"$gte": last_24h}}),
+        "total_logs": total_logs,
+        "total_alerts": total_alerts,
+        "alerts_last_24h": alerts_24h,
         "server_time": now.isoformat()
     }
 
 
+@app.get("/stats")
+async def get_stats(request: Request, _=Depends(get_current_user)):
+    # total_logs is only invalidated by alerts; the TTL bounds its staleness
+    return await response_cache.respond(request, _stats, tags=(ALERTS,))
+
+
+# Sliding-window answers from the in-memory sketches (backend/sketches.py):
+# approximate, but independent of how many logs/alerts the window holds.
+# stream=logs counts stored logs by src_ip, stream=alerts counts rule hits.
+def _check_stream(stream: str) -> None:
+    if stream not in STREAMS:
+        raise HTTPException(400, f"stream must be one of {', '.join(STREAMS)}")
+
+
+@app.get("/stats/heavy-hitters")
+async def heavy_hitters(stream: str = "alerts", window: str = "1h", limit: int = 10,
+                        _=Depends(get_current_user)):
+    """Top source IPs; each true count is within [count - error, count]."""
+    _check_stream(stream)
+    try:
+        return sketches.top(stream, window, max(1, min(limit, settings.SKETCH_TOP_K)))
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+
+
+@app.get("/stats/distinct-ips")
+async def distinct_ips(stream: str = "alerts", window: str = "1h", _=Depends(get_current_user)):
+    """Estimated number of distinct source IPs (HyperLogLog)."""
+    _check_stream(stream)
+    try:
+        return sketches.distinct(stream, window)
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+
+
+@app.get("/stats/detector")
+async def detector_stats(_=Depends(get_current_user)):
+    return await detector.stats()
+
+
+@app.get("/stats/indexes")
+async def index_stats(_=Depends(get_current_user)):
+    return await index_report()
+
+
+@app.get("/stats/ingest")
+async def ingest_stats(_=Depends(get_current_user)):
+    return {
+        **ingest_queue.stats(),
+        "detection": detection_stage.stats(),
+        "rollups": rollups.writer.stats(),
+        "response_cache": response_cache.stats(),
+        "sketches": sketches.stats(),
+        "websocket": manager.stats(),
+    }
+
+
 # ==================== Other Endpoints ====================
 @app.get("/")
 async def root():
@@ -152,42 +278,252 @@ async def login(body: LoginRequest):
     return Token(access_token=create_access_token({"sub": user["username"]}))
 
 @app.post("/logs", status_code=201)
-async def receive_log(log: LogIn, bg: BackgroundTasks, x_api_key: Optional[str] = Header(None)):
+async def receive_log(log: LogIn, x_api_key: Optional[str] = Header(None)):
     if x_api_key != settings.API_KEY:
         raise HTTPException(401, "Invalid API key")
-    await insert_log(log)
-    bg.add_task(analyze_log, log.model_dump())
+    try:
+        stored = ingest_queue.submit(log)
+    except asyncio.QueueFull:
+        raise HTTPException(
+            503, "Ingest queue full",
+            headers={"Retry-After": str(settings.INGEST_RETRY_AFTER)},
+        )
+    error = await stored
+    if error is not None:
+        raise HTTPException(500, f"Log not stored: {error}")
     return {"status": "ok"}
 
+def _parse_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """
+    Decode a batch body as either a JSON array or NDJSON (one object per line).
+    """
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(400, "Batch body must be UTF-8")
+
+    stripped = text.lstrip()
+    if "ndjson" not in content_type and stripped.startswith("["):
+        try:
+            records = json.loads(stripped)
+        except ValueError as exc:
+            raise HTTPException(400, f"Invalid JSON array: {exc}")
+        if not isinstance(records, list):
+            raise HTTPException(400, "Batch body must be a JSON array")
+        return records
+
+    records: List[Any] = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as exc:
+            # keep the slot so per-record results line up with the input
+            records.append(exc)
+    return records
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in exc.errors()
+    )
+
+
+@app.post("/logs/batch")
+async def receive_log_batch(request: Request, x_api_key: Optional[str] = Header(None)):
+    """
+    Ingest many logs in one request. Accepts a JSON array or NDJSON body,
+    optionally sent with Content-Encoding: gzip.
+    """
+    if x_api_key != settings.API_KEY:
+        raise HTTPException(401, "Invalid API key")
+
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            # bounded decompress so a tiny gzip bomb can't blow up memory
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            body = d.decompress(body, settings.MAX_BATCH_BYTES + 1)
+        except zlib.error:
+            raise HTTPException(400, "Invalid gzip body")
+        # an oversized body stops early on purpose and gets the 413 below
+        if len(body) <= settings.MAX_BATCH_BYTES:
+            if not d.eof:
+                raise HTTPException(400, "Truncated gzip body")
+            if d.unused_data:
+                raise HTTPException(400, "Trailing data after gzip body")
+    if len(body) > settings.MAX_BATCH_BYTES:
+        raise HTTPException(413, "Batch body too large")
+
+    records = _parse_batch_body(body, request.headers.get("content-type", ""))
+    if len(records) > settings.MAX_BATCH_RECORDS:
+        raise HTTPException(413, f"Batch exceeds {settings.MAX_BATCH_RECORDS} records")
+
+    results: List[Dict[str, Any]] = []
+    valid: List[LogIn] = []
+    valid_idx: List[int] = []
+    for i, rec in enumerate(records):
+        if isinstance(rec, ValueError):
+            results.append({"index": i, "status": "rejected", "error": f"invalid JSON: {rec}"})
+            continue
+        try:
+            valid.append(LogIn.model_validate(rec))
+            valid_idx.append(i)
+            results.append({"index": i, "status": "accepted"})
+        except ValidationError as exc:
+            results.append({"index": i, "status": "rejected", "error": _validation_message(exc)})
+
+    errors = await crud.insert_logs(valid)
+    for i, err in zip(valid_idx, errors):
+        if err is not None:
+            results[i] = {"index": i, "status": "rejected", "error": err}
+
+    accepted = sum(1 for r in results if r["status"] == "accepted")
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+def _cursor_headers(page: Dict[str, Any]) -> Dict[str, str]:
+    """Body stays a plain list; the keyset tokens travel in headers."""
+    headers = {}
+    if page["next"]:
+        headers["X-Next-Cursor"] = page["next"]
+    if page["prev"]:
+        headers["X-Prev-Cursor"] = page["prev"]
+    return headers
+
 @app.get("/logs")
-async def get_logs(limit: int = 100, page: int = 1, ip: Optional[str] = None,
+async def get_logs(response: Response, limit: int = 100, page: int = 1, ip: Optional[str] = None,
                    source: Optional[str] = None, contains: Optional[str] = None,
+                   cursor: Optional[str] = None, since: Optional[str] = None,
                    user=Depends(get_current_user)):
-    return await recent_logs(limit, page=page, ip=ip, source=source, contains=contains)
+    """
+    Newest first. Pass X-Next-Cursor back as `cursor` for the next (older)
+    page, X-Prev-Cursor as `cursor` for the previous one, or X-Prev-Cursor
+    as `since` to fetch only rows added after this page.
+    """
+    try:
+        result = await recent_logs(limit, page=page, ip=ip, source=source, contains=contains,
+                                   cursor=cursor, since=since)
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    response.headers.update(_cursor_headers(result))
+    return result["items"]
 
 @app.get("/alerts")
-async def get_alerts(limit: int = 100, page: int = 1, ip: Optional[str] = None,
+async def get_alerts(request: Request, limit: int = 100, page: int = 1, ip: Optional[str] = None,
                      type: Optional[str] = None, severity: Optional[str] = None,
-                     source: Optional[str] = None, user=Depends(get_current_user)):
-    return await recent_alerts(limit, page=page, ip=ip, type_=type, severity=severity, source=source)
+                     source: Optional[str] = None, cursor: Optional[str] = None,
+                     since: Optional[str] = None, user=Depends(get_current_user)):
+    """Same cursor/since contract as GET /logs. Cached until alerts change."""
+    async def compute():
+        return await recent_alerts(limit, page=page, ip=ip, type_=type, severity=severity,
+                                   source=source, cursor=cursor, since=since)
+    try:
+        return await response_cache.respond(
+            request, compute, tags=(ALERTS,), split=lambda p: (p["items"], _cursor_headers(p)),
+        )
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+
+def _export_response(stream, fmt: str, name: str) -> StreamingResponse:
+    ext = "csv" if fmt == export.CSV else "ndjson"
+    return StreamingResponse(
+        stream,
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{ext}"'},
+    )
+
+@app.get("/logs/export")
+async def export_logs(format: str = "ndjson", fields: Optional[str] = None,
+                      start: Optional[str] = None, end: Optional[str] = None,
+                      ip: Optional[str] = None, source: Optional[str] = None,
+                      contains: Optional[str] = None, limit: Optional[int] = None,
+                      user=Depends(get_current_user)):
+    """
+    Stream every matching log (hot and archived), oldest first, as NDJSON
+    or CSV. `fields` is a comma-separated projection; start/end bound the
+    timestamp as [start, end).
+    """
+    try:
+        stream = export.export_logs(format, fields=fields, start=start, end=end, ip=ip,
+                                    source=source, contains=contains, limit=limit)
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    return _export_response(stream, format, "logs")
+
+@app.get("/alerts/export")
+async def export_alerts(format: str = "ndjson", fields: Optional[str] = None,
+                        start: Optional[str] = None, end: Optional[str] = None,
+                        ip: Optional[str] = None, type: Optional[str] = None,
+                        severity: Optional[str] = None, source: Optional[str] = None,
+                        limit: Optional[int] = None, user=Depends(get_current_user)):
+    """Same contract as GET /logs/export with the /alerts filters."""
+    try:
+        stream = export.export_alerts(format, fields=fields, start=start, end=end, ip=ip, type_=type,
+                                      severity=severity, source=source, limit=limit)
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    return _export_response(stream, format, "alerts")
+
+@app.get("/rules")
+async def get_rules(_=Depends(get_current_user)):
+    return detector.engine.describe()
+
+@app.post("/rules/reload")
+async def reload_rules(_=Depends(get_current_user)):
+    if not detector.engine.load():
+        raise HTTPException(400, detector.engine.last_error)
+    return {"status": "ok", "rules": len(detector.engine.rules)}
+
+@app.post("/replay")
+async def replay(start: datetime, end: datetime, source: Optional[str] = None,
+                 sink: str = "dry_run", correlate: bool = True, diff: bool = True,
+                 _=Depends(get_current_user)):
+    """
+    Backtest the current rules over stored logs in [start, end), using the
+    logs' own timestamps. Alerts go to a dry-run sample or a separate
+    collection (sink=replay_<name>), never to the live alerts collection.
+    """
+    try:
+        check_sink(sink)
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    if diff:
+        # stored counts must include suppressed hits before we compare; the
+        # stage flushes them together with its checkpoint
+        await detection_stage.checkpoint_now()
+    # runs on its own thread + event loop so a long replay doesn't stall ingest
+    return await asyncio.to_thread(
+        lambda: asyncio.run(replay_range(
+            start, end, source=source, sink=sink, correlate=correlate, diff=diff,
+        ))
+    )
 
 @app.websocket("/ws")
-async def ws_endpoint(websocket: WebSocket, token: str = None):
+async def ws_endpoint(websocket: WebSocket, token: str = None, binary: bool = False,
+                      types: Optional[str] = None, min_severity: Optional[str] = None,
+                      source: Optional[str] = None):
+    """
+    Live alert_batch / log_batch frames. types (alerts,logs), min_severity
+    and source set the initial subscription; send {"subscribe": {...}} to
+    change it later.
+    """
     if not token:
         await websocket.close(code=1008)
         return
     # Verify token
     try:
-        if get_current_user(token) is None:
+        if await get_current_user(token) is None:
              await websocket.close(code=1008)
              return
     except:
         await websocket.close(code=1008)
         return
-
-    await manager.connect(websocket)
     try:
-        while True:
-            await asyncio.sleep(30)
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
\ No newline at end of file
+        subscription = Subscription.parse({"types": types, "min_severity": min_severity, "source": source})
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+
+    await manager.connect(websocket, binary=binary, subscription=subscription)
+    await manager.serve(websocket)
\ No newline at end of file
@@ -0,0 +1,448 @@
+# backend/broadcast.py
+# WebSocket fan-out for /ws. Publishing never waits on a client:
+#   - alerts and stored logs are collected and flushed every WS_COALESCE_MS
+#     as at most one "alert_batch" and one "log_batch" frame per client
+#   - each client has a subscription (alerts/logs, minimum alert severity,
+#     source); clients with the same subscription share one serialized frame
+#   - every connection has a bounded queue and its own writer task. A client
+#     that can't keep up either loses its oldest queued frames
+#     (WS_SLOW_POLICY=drop) or is disconnected (WS_SLOW_POLICY=disconnect);
+#     a send that stalls for WS_SEND_TIMEOUT_SECONDS always disconnects
+#   - events are relayed to the other worker processes through a channel:
+#     WS_CHANNEL=mongo uses a change stream on the ws_events collection
+#     (needs a replica set); the default in-process channel relays between
+#     managers sharing it, i.e. nothing with a single worker
+#
+# Frames are text JSON; clients connecting with ?binary=1 get the same
+# pre-encoded UTF-8 bytes as binary frames instead.
+
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+DROP = "drop"
+DISCONNECT = "disconnect"
+# "try again later": the server dropped a client that fell behind
+CLOSE_SLOW = 1013
+
+ALERTS = "alerts"
+LOGS = "logs"
+SEVERITIES = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+
+Events = Dict[str, List[Dict[str, Any]]]
+Receive = Callable[[Events], None]
+
+
+def _rank(severity: Any) -> int:
+    s = str(severity or "").upper()
+    return SEVERITIES.index(s) if s in SEVERITIES else 0
+
+
+class Subscription:
+    """What one client wants: event types, minimum alert severity, source."""
+
+    __slots__ = ("types", "min_severity", "source")
+
+    def __init__(self, types: Tuple[str, ...] = (ALERTS, LOGS), min_severity: Optional[str] = None,
+                 source: Optional[str] = None):
+        self.types = types
+        self.min_severity = min_severity
+        self.source = source
+
+    @classmethod
+    def parse(cls, spec: Dict[str, Any]) -> "Subscription":
+        """{"types": "alerts,logs" | [...], "min_severity": "HIGH", "source": "web1"}. Raises ValueError."""
+        types = spec.get("types") or (ALERTS, LOGS)
+        if isinstance(types, str):
+            types = [t.strip() for t in types.split(",") if t.strip()]
+        if not isinstance(types, (list, tuple)) or not types or any(t not in (ALERTS, LOGS) for t in types):
+            raise ValueError(f"types must be a subset of {ALERTS}, {LOGS}")
+        min_severity = spec.get("min_severity")
+        if min_severity is not None:
+            min_severity = str(min_severity).upper()
+            if min_severity not in SEVERITIES:
+                raise ValueError(f"min_severity must be one of {', '.join(SEVERITIES)}")
+        source = spec.get("source") or None
+        if source is not None and not isinstance(source, str):
+            raise ValueError("source must be a string")
+        return cls(tuple(sorted(set(types))), min_severity, source)
+
+    @property
+    def key(self) -> Tuple[Any, ...]:
+        return self.types, self.min_severity, self.source
+
+    def describe(self) -> Dict[str, Any]:
+        return {"types": list(self.types), "min_severity": self.min_severity, "source": self.source}
+
+    def select(self, alerts: List[Dict[str, Any]], logs: List[Dict[str, Any]]):
+        if ALERTS not in self.types:
+            alerts = []
+        elif self.min_severity or self.source:
+            floor = _rank(self.min_severity)
+            alerts = [a for a in alerts if _rank(a.get("severity")) >= floor
+                      and (not self.source or a.get("source") == self.source)]
+        if LOGS not in self.types:
+            logs = []
+        elif self.source:
+            logs = [d for d in logs if d.get("source") == self.source]
+        return alerts, logs
+
+
+class Frame:
+    """One message, serialized once and shared by every matching client's queue."""
+
+    __slots__ = ("text", "_data")
+
+    def __init__(self, message: Dict[str, Any]):
+        self.text = json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+        self._data: Optional[bytes] = None
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = self.text.encode()
+        return self._data
+
+
+class Client:
+    __slots__ = ("ws", "binary", "subscription", "queue", "task", "sent", "dropped")
+
+    def __init__(self, ws: WebSocket, *, binary: bool, subscription: Subscription, queue_size: int):
+        self.ws = ws
+        self.binary = binary
+        self.subscription = subscription
+        self.queue: "asyncio.Queue[Frame]" = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+
+    async def send(self, frame: Frame) -> None:
+        if self.binary:
+            await self.ws.send({"type": "websocket.send", "bytes": frame.data})
+        else:
+            await self.ws.send({"type": "websocket.send", "text": frame.text})
+
+
+# ---------- cross-worker channels ----------
+
+class LocalChannel:
+    """
+    In-process pub/sub: every manager started on the same instance receives
+    the others' events. One manager per process means nothing to relay.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Receive] = {}
+
+    @property
+    def relays(self) -> bool:
+        return len(self._subscribers) > 1
+
+    async def start(self, origin: str, receive: Receive) -> None:
+        self._subscribers[origin] = receive
+
+    async def publish(self, origin: str, events: Events) -> None:
+        for other, receive in list(self._subscribers.items()):
+            if other != origin:
+                receive(events)
+
+    async def stop(self, origin: str) -> None:
+        self._subscribers.pop(origin, None)
+
+
+class MongoChannel:
+    """
+    Each flush is one insert into ws_events; every worker watches the
+    collection with a change stream and takes the other workers' inserts.
+    Documents expire via the TTL index in indexes.py.
+    """
+
+    relays = True
+
+    def __init__(self, coll):
+        self.coll = coll
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, origin: str, receive: Receive) -> None:
+        self._task = asyncio.create_task(self._watch(origin, receive))
+
+    async def _watch(self, origin: str, receive: Receive) -> None:
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.origin": {"$ne": origin}}}]
+        token = None
+        while True:
+            try:
+                async with self.coll.watch(pipeline, resume_after=token) as stream:
+                    async for change in stream:
+                        token = stream.resume_token
+                        receive(change["fullDocument"]["events"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("ws relay: change stream failed (%r), retrying", exc)
+                await asyncio.sleep(1.0)
+
+    async def publish(self, origin: str, events: Events) -> None:
+        await self.coll.insert_one({"origin": origin, "at": datetime.utcnow(), "events": events})
+
+    async def stop(self, origin: str) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# ---------- manager ----------
+
+class ConnectionManager:
+    def __init__(
+        self,
+        *,
+        queue_size: int = 256,
+        policy: str = DROP,
+        send_timeout: float = 10.0,
+        coalesce: float = 0.25,
+        max_pending: int = 5000,
+        channel=None,
+    ):
+        if policy not in (DROP, DISCONNECT):
+            raise ValueError(f"WS_SLOW_POLICY must be {DROP} or {DISCONNECT}, not {policy!r}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.coalesce = coalesce
+        self.channel = channel if channel is not None else LocalChannel()
+        self.origin = uuid.uuid4().hex
+        self.clients: Dict[WebSocket, Client] = {}
+
+        # events from this process (delivered and relayed) and from others
+        # (delivered only); oldest are dropped beyond max_pending
+        self._local: Dict[str, Deque[Dict[str, Any]]] = {ALERTS: deque(maxlen=max_pending), LOGS: deque(maxlen=max_pending)}
+        self._remote: Dict[str, Deque[Dict[str, Any]]] = {ALERTS: deque(maxlen=max_pending), LOGS: deque(maxlen=max_pending)}
+        self._task: Optional[asyncio.Task] = None
+        self._relaying: Set[asyncio.Task] = set()
+
+        self.published = 0
+        self.relayed_in = 0
+        self.relayed_out = 0
+        self.dropped = 0
+        self.evicted = 0
+
+    # ---------- connections ----------
+
+    async def connect(self, ws: WebSocket, *, binary: bool = False,
+                      subscription: Optional[Subscription] = None) -> Client:
+        await ws.accept()
+        client = Client(ws, binary=binary, subscription=subscription or Subscription(),
+                        queue_size=self.queue_size)
+        self.clients[ws] = client
+        client.task = asyncio.create_task(self._writer(client))
+        return client
+
+    def disconnect(self, ws: WebSocket) -> None:
+        client = self.clients.pop(ws, None)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def _evict(self, client: Client, reason: str) -> None:
+        self.evicted += 1
+        logger.info("ws: dropping client (%s)", reason)
+        self.disconnect(client.ws)
+        asyncio.create_task(self._close(client.ws))
+
+    @staticmethod
+    async def _close(ws: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(ws.close(code=CLOSE_SLOW), timeout=1.0)
+        except Exception:
+            pass
+
+    async def _writer(self, client: Client) -> None:
+        while True:
+            frame = await client.queue.get()
+            try:
+                await asyncio.wait_for(client.send(frame), timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                self._evict(client, "send timed out")
+                return
+            except Exception:
+                # socket already gone; the /ws handler cleans up too
+                self.disconnect(client.ws)
+                return
+            client.sent += 1
+
+    def _enqueue(self, client: Client, frame: Frame) -> None:
+        try:
+            client.queue.put_nowait(frame)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.policy == DISCONNECT:
+            self._evict(client, "send queue full")
+            return
+        # drop the oldest frame: the client sees a gap, not stale data
+        client.queue.get_nowait()
+        client.queue.put_nowait(frame)
+        client.dropped += 1
+        self.dropped += 1
+
+    async def serve(self, ws: WebSocket) -> None:
+        """
+        Read until the client goes away, then release its queue and writer.
+        A client may change its subscription at any time by sending
+        {"subscribe": {...}} (see Subscription.parse).
+        """
+        try:
+            while True:
+                message = await ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("text"):
+                    self._command(ws, message["text"])
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            self.disconnect(ws)
+
+    def _command(self, ws: WebSocket, text: str) -> None:
+        client = self.clients.get(ws)
+        if client is None:
+            return
+        try:
+            command = json.loads(text)
+            if not isinstance(command, dict) or not isinstance(command.get("subscribe"), dict):
+                raise ValueError('expected {"subscribe": {...}}')
+            client.subscription = Subscription.parse(command["subscribe"])
+        except ValueError as exc:
+            self._enqueue(client, Frame({"type": "error", "message": str(exc)}))
+            return
+        self._enqueue(client, Frame({"type": "subscribed", "subscription": client.subscription.describe()}))
+
+    # ---------- publishing ----------
+
+    def wants_events(self) -> bool:
+        """False when nobody (here or in another worker) could receive an event."""
+        return bool(self.clients) or self.channel.relays
+
+    def publish_alert(self, alert: Dict[str, Any]) -> None:
+        if self.wants_events():
+            self._local[ALERTS].append(alert)
+            self._kick()
+
+    def publish_logs(self, logs: List[Dict[str, Any]]) -> None:
+        if self.wants_events():
+            self._local[LOGS].extend(logs)
+            self._kick()
+
+    def _receive(self, events: Events) -> None:
+        self.relayed_in += 1
+        self._remote[ALERTS].extend(events.get(ALERTS, ()))
+        self._remote[LOGS].extend(events.get(LOGS, ()))
+        self._kick()
+
+    def _kick(self) -> None:
+        # without coalescing every publish goes out at once
+        if self.coalesce <= 0:
+            self.flush()
+
+    def flush(self) -> None:
+        local = {kind: list(q) for kind, q in self._local.items()}
+        remote = {kind: list(q) for kind, q in self._remote.items()}
+        for q in (*self._local.values(), *self._remote.values()):
+            q.clear()
+
+        if (local[ALERTS] or local[LOGS]) and self.channel.relays:
+            self.relayed_out += 1
+            task = asyncio.create_task(self._relay(local))
+            self._relaying.add(task)
+            task.add_done_callback(self._relaying.discard)
+
+        alerts, logs = local[ALERTS] + remote[ALERTS], local[LOGS] + remote[LOGS]
+        if self.clients and (alerts or logs):
+            self._deliver(alerts, logs)
+
+    async def _relay(self, events: Events) -> None:
+        try:
+            await self.channel.publish(self.origin, events)
+        except Exception:
+            logger.exception("ws relay: publish failed")
+
+    def _deliver(self, alerts: List[Dict[str, Any]], logs: List[Dict[str, Any]]) -> None:
+        groups: Dict[Tuple[Any, ...], Tuple[Subscription, List[Client]]] = {}
+        for client in self.clients.values():
+            groups.setdefault(client.subscription.key, (client.subscription, []))[1].append(client)
+
+        now = datetime.utcnow().isoformat()
+        for subscription, clients in groups.values():
+            wanted_alerts, wanted_logs = subscription.select(alerts, logs)
+            frames = []
+            if wanted_alerts:
+                frames.append(Frame({
+                    "type": "alert_batch",
+                    "timestamp": now,
+                    "message": f"{len(wanted_alerts)} alerts",
+                    "data": wanted_alerts,
+                }))
+            if wanted_logs:
+                frames.append(Frame({
+                    "type": "log_batch",
+                    "timestamp": now,
+                    "message": f"{len(wanted_logs)} logs received",
+                    "data": wanted_logs,
+                }))
+            for frame in frames:
+                self.published += 1
+                for client in clients:
+                    self._enqueue(client, frame)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.coalesce)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("ws flush failed")
+
+    async def start(self) -> None:
+        await self.channel.start(self.origin, self._receive)
+        if self.coalesce > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+        if self._relaying:
+            await asyncio.gather(*self._relaying, return_exceptions=True)
+        await self.channel.stop(self.origin)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self.clients),
+            "subscriptions": len({c.subscription.key for c in self.clients.values()}),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "coalesce_ms": int(self.coalesce * 1000),
+            "channel": type(self.channel).__name__,
+            "published": self.published,
+            "relayed_in": self.relayed_in,
+            "relayed_out": self.relayed_out,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "max_queued": max((c.queue.qsize() for c in self.clients.values()), default=0),
+        }
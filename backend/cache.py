@@ -0,0 +1,156 @@
+# backend/cache.py
+# Response cache for the dashboard read endpoints (/stats*, /alerts). Every
+# open dashboard tab polls the same handful of URLs, so one computed body is
+# shared by all of them:
+#   - bounded LRU keyed by path + query string, entries live RESPONSE_CACHE_TTL_MS
+#   - entries are tagged; writes invalidate a tag (new/updated alerts -> "alerts")
+#   - concurrent misses for the same key share one computation (single-flight)
+#   - bodies carry an ETag; If-None-Match on an unchanged body returns 304
+# The cache is per process: other workers' writes are only bounded by the TTL.
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .config import settings
+
+ALERTS = "alerts"
+
+Compute = Callable[[], Awaitable[Any]]
+# splits a computed value into (JSON body, extra response headers)
+Split = Callable[[Any], Tuple[Any, Dict[str, str]]]
+
+
+class _Entry:
+    __slots__ = ("body", "headers", "etag", "expires")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], expires: float):
+        self.body = body
+        self.headers = headers
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.expires = expires
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak validators compare equal for our purposes
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class ResponseCache:
+    def __init__(self, *, max_entries: int = 512, ttl: float = 2.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._generation: Counter = Counter()
+        self._inflight: Dict[str, "asyncio.Task[_Entry]"] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def invalidate(self, tag: str) -> None:
+        """Drop every entry tagged `tag`; in-flight fills for it won't be stored."""
+        self._generation[tag] += 1
+        keys = self._tags.pop(tag, None)
+        if keys:
+            self.invalidations += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def _store(self, key: str, entry: _Entry, tags: Iterable[str]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old, _ = self._entries.popitem(last=False)
+            for keys in self._tags.values():
+                keys.discard(old)
+
+    async def _fill(self, key: str, compute: Compute, tags: Tuple[str, ...], split: Optional[Split]) -> _Entry:
+        generations = [self._generation[t] for t in tags]
+        value = await compute()
+        body, headers = split(value) if split else (value, {})
+        raw = json.dumps(jsonable_encoder(body), separators=(",", ":")).encode()
+        entry = _Entry(raw, headers, time.monotonic() + self.ttl)
+        # a write landed while we were computing: serve it, but don't keep it
+        if self.ttl > 0 and generations == [self._generation[t] for t in tags]:
+            self._store(key, entry, tags)
+        return entry
+
+    async def get(self, key: str, compute: Compute, *, tags: Iterable[str] = (), split: Optional[Split] = None) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._fill(key, compute, tuple(tags), split))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        # shield: a disconnecting client must not cancel the shared fill
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: "asyncio.Task[_Entry]") -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every waiter went away
+
+    async def respond(
+        self,
+        request: Request,
+        compute: Compute,
+        *,
+        tags: Iterable[str] = (),
+        split: Optional[Split] = None,
+    ) -> Response:
+        """
+        Cached JSON response for this request's path + query; 304 when the
+        client's If-None-Match still matches. Errors raised by compute
+        propagate (and are not cached).
+        """
+        # re-encoded so a value holding "&b=2" can't pose as a real b=2
+        key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+        entry = await self.get(key, compute, tags=tags, split=split)
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_SIZE,
+    ttl=settings.RESPONSE_CACHE_TTL_MS / 1000,
+)
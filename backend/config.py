@@ -3,6 +3,7 @@
 # Avoids pydantic BaseSettings to sidestep pydantic-settings dependency.
 
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()  # loads .env in current directory if present
@@ -20,6 +21,111 @@ SMTP_PORT = int(_env("SMTP_PORT", "587"))
 SMTP_USER = _env("SMTP_USER", "") or None
 SMTP_PASS = _env("SMTP_PASS", "") or None
 
+# MongoDB connection pool / timeouts (shared by the async and sync clients)
+MONGO_MAX_POOL_SIZE = int(_env("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(_env("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(_env("MONGO_MAX_IDLE_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(_env("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(_env("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+# how long a request may wait for a free pooled connection
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+# server-side limit for /stats queries, so one slow query fails fast
+STATS_MAX_TIME_MS = int(_env("STATS_MAX_TIME_MS", "10000"))
+
+# /stats rollups: buffered $inc counters, written every ROLLUP_FLUSH_MS
+# (0 = on every insert); minute buckets are kept this many hours
+ROLLUP_FLUSH_MS = int(_env("ROLLUP_FLUSH_MS", "1000"))
+ROLLUP_MINUTE_RETENTION_HOURS = float(_env("ROLLUP_MINUTE_RETENTION_HOURS", "48"))
+
+# Response cache for /stats* and /alerts: entries live RESPONSE_CACHE_TTL_MS
+# (0 = no caching, ETag/304 only) and are dropped when alerts are written
+RESPONSE_CACHE_TTL_MS = int(_env("RESPONSE_CACHE_TTL_MS", "2000"))
+RESPONSE_CACHE_SIZE = int(_env("RESPONSE_CACHE_SIZE", "512"))
+
+# Streaming sketches of source IPs (backend/sketches.py): Space-Saving top-K
+# size, HyperLogLog precision (2^p registers), and how often dirty buckets
+# are written to Mongo under SKETCH_OWNER (default: host:pid, so workers on
+# one host never share buckets; set it per worker to reload across restarts)
+SKETCH_TOP_K = int(_env("SKETCH_TOP_K", "100"))
+SKETCH_HLL_PRECISION = int(_env("SKETCH_HLL_PRECISION", "12"))
+SKETCH_PERSIST_SECONDS = float(_env("SKETCH_PERSIST_SECONDS", "30"))
+SKETCH_OWNER = _env("SKETCH_OWNER", f"{socket.gethostname()}:{os.getpid()}")
+
+# GET /logs/export and /alerts/export: cursor batch size and the size of
+# each streamed chunk
+EXPORT_BATCH_SIZE = int(_env("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = int(_env("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+# /ws fan-out: frames queued per client; a client whose queue is full loses
+# its oldest frames (drop) or is closed (disconnect). A send stalled for
+# WS_SEND_TIMEOUT_SECONDS always closes the client.
+WS_QUEUE_SIZE = int(_env("WS_QUEUE_SIZE", "256"))
+WS_SLOW_POLICY = _env("WS_SLOW_POLICY", "drop")
+WS_SEND_TIMEOUT_SECONDS = float(_env("WS_SEND_TIMEOUT_SECONDS", "10"))
+# events are coalesced into one frame per type every WS_COALESCE_MS (0 = send
+# each one at once); at most WS_MAX_PENDING are held between flushes
+WS_COALESCE_MS = int(_env("WS_COALESCE_MS", "250"))
+WS_MAX_PENDING = int(_env("WS_MAX_PENDING", "5000"))
+# cross-worker relay: "local" (single process) or "mongo" (change stream on
+# ws_events, needs a replica set; relayed events expire after the TTL)
+WS_CHANNEL = _env("WS_CHANNEL", "local")
+WS_EVENT_TTL_SECONDS = int(_env("WS_EVENT_TTL_SECONDS", "300"))
+
+# Batch ingest limits (POST /logs/batch)
+MAX_BATCH_RECORDS = int(_env("MAX_BATCH_RECORDS", "5000"))
+MAX_BATCH_BYTES = int(_env("MAX_BATCH_BYTES", str(16 * 1024 * 1024)))
+
+# Group-commit ingest queue (POST /logs). Requests wait for their batch's
+# write; INGEST_FLUSH_MS > 0 lingers that long to build bigger batches.
+INGEST_QUEUE_SIZE = int(_env("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(_env("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_MS = int(_env("INGEST_FLUSH_MS", "0"))
+INGEST_RETRY_AFTER = int(_env("INGEST_RETRY_AFTER", "1"))
+
+# Retention (TTL indexes on timestamp); 0 keeps documents forever
+LOG_RETENTION_DAYS = float(_env("LOG_RETENTION_DAYS", "0"))
+ALERT_RETENTION_DAYS = float(_env("ALERT_RETENTION_DAYS", "0"))
+
+# Hot/cold tiering: logs older than ARCHIVE_AFTER_DAYS (0 = never) move into
+# compressed segment files under ARCHIVE_DIR (backend/tiering.py)
+ARCHIVE_DIR = _env("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+ARCHIVE_AFTER_DAYS = float(_env("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_INTERVAL_SECONDS = float(_env("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_SEGMENT_ROWS = int(_env("ARCHIVE_SEGMENT_ROWS", "100000"))
+# auto = zstd if the zstandard package is installed, else gzip
+ARCHIVE_CODEC = _env("ARCHIVE_CODEC", "auto")
+ARCHIVE_COMPRESSION_LEVEL = int(_env("ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+# Detector in-memory window state: max tracked keys (IPs) per window
+DETECTOR_MAX_KEYS = int(_env("DETECTOR_MAX_KEYS", "100000"))
+
+# Declarative detection rules (hot-reloaded from this directory)
+RULES_DIR = _env("RULES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules"))
+RULES_RELOAD_SECONDS = float(_env("RULES_RELOAD_SECONDS", "2"))
+
+# Detection worker processes (sharded by source IP); 0 = run in the event loop.
+# A worker that doesn't answer a call within DETECTION_WORKER_TIMEOUT_SECONDS
+# is restarted and the batch fails (the detection stage retries it).
+DETECTION_WORKERS = int(_env("DETECTION_WORKERS", "0"))
+DETECTION_WORKER_TIMEOUT_SECONDS = float(_env("DETECTION_WORKER_TIMEOUT_SECONDS", "30"))
+
+# Alert aggregation: repeats of (type, ip, source) within this many seconds
+# bump one alert's count; 0 disables aggregation. Counts are flushed with
+# each detection checkpoint (DETECTION_CHECKPOINT_SECONDS).
+ALERT_SUPPRESS_SECONDS = float(_env("ALERT_SUPPRESS_SECONDS", "300"))
+
+# Detection stage: consumes stored logs by seq after the write is acked
+DETECTION_BATCH_SIZE = int(_env("DETECTION_BATCH_SIZE", "500"))
+DETECTION_POLL_MS = int(_env("DETECTION_POLL_MS", "500"))
+DETECTION_CHECKPOINT_SECONDS = float(_env("DETECTION_CHECKPOINT_SECONDS", "1"))
+DETECTION_MAX_RETRIES = int(_env("DETECTION_MAX_RETRIES", "5"))
+# a seq reserved but not stored yet is stepped over after this long, then
+# looked up again until DETECTION_GAP_RECHECK_SECONDS in case its write was
+# only slow (a writer that failed reports its seqs and they are dropped)
+DETECTION_GAP_SECONDS = float(_env("DETECTION_GAP_SECONDS", "10"))
+DETECTION_GAP_RECHECK_SECONDS = float(_env("DETECTION_GAP_RECHECK_SECONDS", "600"))
+
 # grouping for compatibility with previous code that expected `settings`
 class Settings:
     def __init__(self):
@@ -31,5 +137,56 @@ class Settings:
         self.SMTP_PORT = SMTP_PORT
         self.SMTP_USER = SMTP_USER
         self.SMTP_PASS = SMTP_PASS
+        self.MONGO_MAX_POOL_SIZE = MONGO_MAX_POOL_SIZE
+        self.MONGO_MIN_POOL_SIZE = MONGO_MIN_POOL_SIZE
+        self.MONGO_MAX_IDLE_MS = MONGO_MAX_IDLE_MS
+        self.MONGO_CONNECT_TIMEOUT_MS = MONGO_CONNECT_TIMEOUT_MS
+        self.MONGO_SERVER_SELECTION_TIMEOUT_MS = MONGO_SERVER_SELECTION_TIMEOUT_MS
+        self.MONGO_SOCKET_TIMEOUT_MS = MONGO_SOCKET_TIMEOUT_MS
+        self.MONGO_WAIT_QUEUE_TIMEOUT_MS = MONGO_WAIT_QUEUE_TIMEOUT_MS
+        self.STATS_MAX_TIME_MS = STATS_MAX_TIME_MS
+        self.ROLLUP_FLUSH_MS = ROLLUP_FLUSH_MS
+        self.ROLLUP_MINUTE_RETENTION_HOURS = ROLLUP_MINUTE_RETENTION_HOURS
+        self.RESPONSE_CACHE_TTL_MS = RESPONSE_CACHE_TTL_MS
+        self.RESPONSE_CACHE_SIZE = RESPONSE_CACHE_SIZE
+        self.SKETCH_TOP_K = SKETCH_TOP_K
+        self.SKETCH_HLL_PRECISION = SKETCH_HLL_PRECISION
+        self.SKETCH_PERSIST_SECONDS = SKETCH_PERSIST_SECONDS
+        self.SKETCH_OWNER = SKETCH_OWNER
+        self.EXPORT_BATCH_SIZE = EXPORT_BATCH_SIZE
+        self.EXPORT_CHUNK_BYTES = EXPORT_CHUNK_BYTES
+        self.WS_QUEUE_SIZE = WS_QUEUE_SIZE
+        self.WS_SLOW_POLICY = WS_SLOW_POLICY
+        self.WS_SEND_TIMEOUT_SECONDS = WS_SEND_TIMEOUT_SECONDS
+        self.WS_COALESCE_MS = WS_COALESCE_MS
+        self.WS_MAX_PENDING = WS_MAX_PENDING
+        self.WS_CHANNEL = WS_CHANNEL
+        self.WS_EVENT_TTL_SECONDS = WS_EVENT_TTL_SECONDS
+        self.MAX_BATCH_RECORDS = MAX_BATCH_RECORDS
+        self.MAX_BATCH_BYTES = MAX_BATCH_BYTES
+        self.INGEST_QUEUE_SIZE = INGEST_QUEUE_SIZE
+        self.INGEST_BATCH_SIZE = INGEST_BATCH_SIZE
+        self.INGEST_FLUSH_MS = INGEST_FLUSH_MS
+        self.INGEST_RETRY_AFTER = INGEST_RETRY_AFTER
+        self.LOG_RETENTION_DAYS = LOG_RETENTION_DAYS
+        self.ALERT_RETENTION_DAYS = ALERT_RETENTION_DAYS
+        self.ARCHIVE_DIR = ARCHIVE_DIR
+        self.ARCHIVE_AFTER_DAYS = ARCHIVE_AFTER_DAYS
+        self.ARCHIVE_INTERVAL_SECONDS = ARCHIVE_INTERVAL_SECONDS
+        self.ARCHIVE_SEGMENT_ROWS = ARCHIVE_SEGMENT_ROWS
+        self.ARCHIVE_CODEC = ARCHIVE_CODEC
+        self.ARCHIVE_COMPRESSION_LEVEL = ARCHIVE_COMPRESSION_LEVEL
+        self.DETECTOR_MAX_KEYS = DETECTOR_MAX_KEYS
+        self.RULES_DIR = RULES_DIR
+        self.RULES_RELOAD_SECONDS = RULES_RELOAD_SECONDS
+        self.DETECTION_WORKERS = DETECTION_WORKERS
+        self.DETECTION_WORKER_TIMEOUT_SECONDS = DETECTION_WORKER_TIMEOUT_SECONDS
+        self.ALERT_SUPPRESS_SECONDS = ALERT_SUPPRESS_SECONDS
+        self.DETECTION_BATCH_SIZE = DETECTION_BATCH_SIZE
+        self.DETECTION_POLL_MS = DETECTION_POLL_MS
+        self.DETECTION_CHECKPOINT_SECONDS = DETECTION_CHECKPOINT_SECONDS
+        self.DETECTION_MAX_RETRIES = DETECTION_MAX_RETRIES
+        self.DETECTION_GAP_SECONDS = DETECTION_GAP_SECONDS
+        self.DETECTION_GAP_RECHECK_SECONDS = DETECTION_GAP_RECHECK_SECONDS
 
 settings = Settings()
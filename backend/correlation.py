@@ -0,0 +1,193 @@
+# backend/correlation.py
+# Multi-stage correlation over the alert stream. Sequence rules such as
+# "Brute Force from X, then Root Login from X within 10 minutes" are
+# evaluated with one small state machine per (rule, entity), kept in memory
+# with event-time timeouts and an LRU cap, so the cost per alert does not
+# depend on how many alerts are stored.
+#
+# Rules live in RULES_DIR/correlation/*.json (hot-reloaded):
+#
+#   {
+#     "name": "bruteforce_then_root",
+#     "type": "Compromised Account",
+#     "severity": "CRITICAL",
+#     "description": "Root login from {ip} after brute force within {within}s.",
+#     "sequence": ["Brute Force", "Root Login"],   alert types, in order
+#     "by": "ip",                                  entity field (ip or source)
+#     "within": 600                                seconds from first to last step
+#   }
+
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .rule_engine import RuleError, load_rule_specs, render, rules_signature
+
+logger = logging.getLogger(__name__)
+
+
+class SequenceRule:
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = spec
+        self.name: str = spec["name"]
+        self.type_: str = spec["type"]
+        self.severity: str = spec["severity"]
+        self.description: str = spec["description"]
+        self.steps: List[str] = list(spec["sequence"])
+        self.by: str = spec.get("by", "ip")
+        self.within = timedelta(seconds=float(spec["within"]))
+        self.completed = 0
+
+
+class _State:
+    __slots__ = ("step", "started", "source")
+
+    def __init__(self, started: datetime, source: str):
+        self.step = 1
+        self.started = started
+        self.source = source
+
+
+class CorrelationEngine:
+    def __init__(self, rules_dir: str, *, max_states: int = 100000, reload_seconds: float = 2.0):
+        self.rules_dir = rules_dir
+        self.max_states = max_states
+        self.reload_seconds = reload_seconds
+        self.rules: List[SequenceRule] = []
+        self.last_error: Optional[str] = None
+        self._by_type: Dict[str, List[SequenceRule]] = {}
+        self._rules_by_name: Dict[str, SequenceRule] = {}
+        self._states: "OrderedDict[Tuple[str, Any], _State]" = OrderedDict()
+        self._signature: Optional[Tuple] = None
+        self._next_check = 0.0
+        self.observed = 0
+        self.evicted = 0
+
+    # ---------- loading / hot reload ----------
+
+    def load(self) -> bool:
+        self._signature = rules_signature(self.rules_dir)
+        try:
+            specs = load_rule_specs(self.rules_dir)
+            for spec in specs:
+                if not isinstance(spec.get("sequence"), list) or len(spec["sequence"]) < 2 or "within" not in spec:
+                    raise RuleError(f"{spec['name']}: sequence needs >= 2 steps and 'within'")
+                within = spec["within"]
+                if isinstance(within, bool) or not isinstance(within, (int, float)) or within <= 0:
+                    raise RuleError(f"{spec['name']}: within must be a positive number of seconds")
+            rules = [SequenceRule(s) for s in specs]
+        except FileNotFoundError:
+            rules = []
+        except (OSError, ValueError) as exc:
+            self.last_error = str(exc)
+            logger.error("correlation rule load failed, keeping previous rules: %s", exc)
+            return False
+
+        by_type: Dict[str, List[SequenceRule]] = defaultdict(list)
+        for rule in rules:
+            for t in dict.fromkeys(rule.steps):
+                by_type[t].append(rule)
+        names = {r.name for r in rules}
+        # keep in-flight sequences of rules that still exist
+        self._states = OrderedDict((k, v) for k, v in self._states.items() if k[0] in names)
+        self.rules, self._by_type = rules, dict(by_type)
+        self._rules_by_name = {r.name: r for r in rules}
+        self.last_error = None
+        return True
+
+    def maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_seconds
+        if rules_signature(self.rules_dir) != self._signature:
+            self.load()
+
+    # ---------- evaluation ----------
+
+    def observe(self, alert: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Feed one alert (the _create_alert kwargs, datetime timestamp).
+        Returns correlated alerts (same kwargs shape) completed by it.
+        """
+        self.maybe_reload()
+        rules = self._by_type.get(alert.get("type_"))
+        if not rules:
+            return []
+        self.observed += 1
+        ts: datetime = alert["timestamp"]
+        out: List[Dict[str, Any]] = []
+        self._sweep(ts)
+
+        for rule in rules:
+            entity = alert.get(rule.by)
+            if entity is None:
+                continue
+            key = (rule.name, entity)
+            state = self._states.get(key)
+            if state is not None and ts - state.started > rule.within:
+                del self._states[key]
+                state = None
+
+            t = alert["type_"]
+            if state is not None and t == rule.steps[state.step]:
+                state.step += 1
+                self._states.move_to_end(key)
+                if state.step == len(rule.steps):
+                    del self._states[key]
+                    rule.completed += 1
+                    out.append(self._emit(rule, entity, alert, state))
+                continue
+
+            if t == rule.steps[0]:
+                if state is None:
+                    self._states[key] = _State(ts, alert.get("source", "unknown"))
+                    self._evict()
+                elif state.step == 1:
+                    # repeated first step: measure the window from the latest one
+                    state.started = ts
+                    self._states.move_to_end(key)
+        return out
+
+    def _emit(self, rule: SequenceRule, entity: Any, alert: Dict[str, Any], state: _State) -> Dict[str, Any]:
+        values = {
+            "ip": alert.get("ip"),
+            "source": alert.get("source", "unknown"),
+            "entity": entity,
+            "within": int(rule.within.total_seconds()),
+            "steps": " -> ".join(rule.steps),
+        }
+        return {
+            "source": alert.get("source", state.source),
+            "timestamp": alert["timestamp"],
+            "severity": rule.severity,
+            "type_": rule.type_,
+            "description": render(rule.description, values),
+            "ip": alert.get("ip"),
+        }
+
+    def _evict(self) -> None:
+        while len(self._states) > self.max_states:
+            self._states.popitem(last=False)
+            self.evicted += 1
+
+    def _sweep(self, now: datetime) -> None:
+        """Drop timed-out sequences from the cold end of the LRU."""
+        while self._states:
+            (name, _), state = next(iter(self._states.items()))
+            rule = self._rules_by_name.get(name)
+            if rule is not None and now - state.started <= rule.within:
+                break
+            self._states.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": {r.name: {"completed": r.completed} for r in self.rules},
+            "in_flight": len(self._states),
+            "max_states": self.max_states,
+            "observed": self.observed,
+            "evicted": self.evicted,
+            "last_error": self.last_error,
+        }
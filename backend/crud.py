@@ -1,10 +1,20 @@
 # backend/crud.py
 
+import asyncio
+import base64
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+from . import pipeline, rollups, tiering
+from .sketches import sketches
 from .database import logs_coll, alerts_coll
-from .detector import run_detection
+from .parsing import extract_fields
+from .search import search_conditions, terms
 
 
 def _model_to_dict(log: Any) -> Dict[str, Any]:
@@ -31,12 +41,15 @@ def _normalize_ts(doc: Dict[str, Any]) -> Dict[str, Any]:
     return doc
 
 
-async def insert_log(log: Any) -> None:
+def _prepare_log_doc(log: Any) -> Dict[str, Any]:
     """
-    Insert a log into MongoDB and run detection rules.
-    Works with both Motor (async) and PyMongo (sync) collections.
+    Turn an incoming log into the document shape stored in Mongo
+    (timestamp coerced to a datetime, structured fields extracted).
     """
-    data = _model_to_dict(log)
+    data = dict(_model_to_dict(log))
+    # `file` is optional (agent-tailed logs only); don't store it as null
+    if data.get("file") is None:
+        data.pop("file", None)
 
     ts = data.get("timestamp")
     if isinstance(ts, str):
@@ -47,89 +60,240 @@ async def insert_log(log: Any) -> None:
     elif not isinstance(ts, datetime):
         data["timestamp"] = datetime.utcnow()
 
-    # Handle both async and sync insert_one
-    maybe_coro = logs_coll.insert_one(data)
-    if hasattr(maybe_coro, "__await__"):
-        result = await maybe_coro
+    # parse once here; rules and /logs?ip= use these fields directly
+    data.update(extract_fields(data.get("message", "") or ""))
+    return data
+
+
+async def insert_log(log: Any) -> None:
+    """
+    Store a single log. Detection runs afterwards in the pipeline's
+    detection stage, not here.
+    """
+    errors = await insert_logs([log])
+    if errors and errors[0] is not None:
+        raise RuntimeError(errors[0])
+
+
+async def _store(docs: List[Dict[str, Any]]) -> List[Optional[str]]:
+    first = await pipeline.reserve_seq(len(docs))
+    for i, doc in enumerate(docs):
+        doc["seq"] = first + i
+
+    errors: List[Optional[str]] = [None] * len(docs)
+    try:
+        await logs_coll.insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        for err in exc.details.get("writeErrors", []):
+            errors[err["index"]] = err.get("errmsg", "write error")
+    except Exception:
+        # network error, timeout...: don't let detection wait on the reserved
+        # range; rows that did get written are still processed when found
+        pipeline.stage.skip(range(first, first + len(docs)))
+        raise
+    return errors
+
+
+async def store_logs(logs: List[Any]) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+    """
+    Insert a batch of logs with a single unordered insert_many. Each log gets
+    the next `seq`; once the write returns, the detection stage is woken to
+    analyse the new logs (exactly once, in seq order).
+
+    Returns the prepared documents (as written, `_id` and `seq` included)
+    and one entry per input log: None if it was stored, otherwise the write
+    error message for that position.
+    """
+    docs = [_prepare_log_doc(log) for log in logs]
+    if not docs:
+        return [], []
+    for doc in docs:
+        # search index terms (backend/search.py); never returned by /logs
+        doc["terms"] = terms(doc.get("message", "") or "")
+
+    errors = await _store(docs)
+    rollups.writer.add_logs(d for d, err in zip(docs, errors) if err is None)
+    await rollups.writer.maybe_flush()
+    sketches.add_many("logs", (d.get("src_ip") for d, err in zip(docs, errors) if err is None))
+
+    failed = [d["seq"] for d, err in zip(docs, errors) if err is not None]
+    if failed:
+        pipeline.stage.skip(failed)
+    pipeline.stage.notify(docs[-1]["seq"])
+    return docs, errors
+
+
+async def insert_logs(logs: List[Any]) -> List[Optional[str]]:
+    """
+    store_logs() without the documents: one entry per input log, None if it
+    was stored, otherwise the write error message for that position.
+    """
+    _, errors = await store_logs(logs)
+    return errors
+
+
+# ---------- keyset pagination ----------
+# /logs and /alerts are ordered by (timestamp, _id), newest first. A cursor
+# is an opaque token holding one row's position and a direction: "older"
+# continues below that row (next page), "newer" returns the rows above it
+# (previous page, or the delta since the last poll). Every page is an index
+# range scan from the cursor, so page 10,000 costs the same as page 1 and
+# rows inserted meanwhile don't shift the pages.
+
+OLDER = "o"
+NEWER = "n"
+# legacy `page` offsets over both tiers read and merge every row before the
+# page, so they stop here; cursors have no such limit
+TIERED_OFFSET_MAX = 10_000
+KEYSET_DESC = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+KEYSET_ASC = [("timestamp", ASCENDING), ("_id", ASCENDING)]
+
+Position = Tuple[datetime, ObjectId]
+
+
+def _encode_cursor(direction: str, pos: Position) -> str:
+    raw = f"{direction}|{pos[0].isoformat()}|{pos[1]}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> Tuple[str, Position]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        direction, ts, oid = raw.split("|")
+        if direction not in (OLDER, NEWER):
+            raise ValueError(direction)
+        return direction, (datetime.fromisoformat(ts), ObjectId(oid))
+    except (ValueError, InvalidId):
+        raise ValueError("invalid cursor") from None
+
+
+def _position(doc: Dict[str, Any]) -> Optional[Position]:
+    ts = doc.get("timestamp")
+    return (ts, doc["_id"]) if isinstance(ts, datetime) else None
+
+
+def _sort_key(doc: Dict[str, Any]) -> Tuple[datetime, ObjectId]:
+    ts = doc.get("timestamp")
+    return (ts if isinstance(ts, datetime) else datetime.min), doc["_id"]
+
+
+def _keyset_bound(direction: str, pos: Position) -> Dict[str, Any]:
+    # the outer timestamp range keeps the index scan tight; the $or breaks
+    # ties between rows sharing a timestamp
+    ts, oid = pos
+    if direction == OLDER:
+        return {"timestamp": {"$lte": ts}, "$or": [{"timestamp": {"$lt": ts}}, {"_id": {"$lt": oid}}]}
+    return {"timestamp": {"$gte": ts}, "$or": [{"timestamp": {"$gt": ts}}, {"_id": {"$gt": oid}}]}
+
+
+async def _page(
+    coll,
+    conditions: List[Dict[str, Any]],
+    limit: int,
+    *,
+    page: int,
+    cursor: Optional[str],
+    since: Optional[str],
+    projection: Optional[Dict[str, Any]] = None,
+    cold: Optional["tiering.ColdQuery"] = None,
+) -> Dict[str, Any]:
+    """
+    One page of coll, newest first. With `cursor` the page continues from
+    that token; with `since` it holds only rows newer than the token (at
+    most `limit`, the oldest of them, so repeated polls catch up without
+    gaps). Otherwise falls back to the legacy `page` offset.
+    Raises ValueError on a malformed token, or on an offset page that ends
+    past TIERED_OFFSET_MAX rows while archived segments exist.
+
+    With `cold`, archived rows (backend/tiering.py) are merged in, so the
+    page covers both tiers in one keyset order.
+
+    Returns {"items", "next", "prev"}: `next` pages to older rows (None on
+    the last page), `prev` to newer rows and doubles as the next `since`.
+    """
+    limit = max(1, limit)
+    token = since or cursor
+    pos: Optional[Position] = None
+    direction = OLDER
+    if token:
+        direction, pos = _decode_cursor(token)
+        if since:
+            direction = NEWER
+        conditions = conditions + [_keyset_bound(direction, pos)]
+
+    # with archived segments around, offset pages are cut from the merged
+    # order, so the hot query fetches skip + limit rows itself
+    tiered = cold is not None and bool(tiering.catalog.segments())
+    skip = (max(page, 1) - 1) * limit if pos is None else 0
+    n = skip + limit if tiered else limit
+    if tiered and n > TIERED_OFFSET_MAX:
+        raise ValueError(
+            f"page offsets stop at {TIERED_OFFSET_MAX} rows with archived logs; "
+            "follow the X-Next-Cursor header instead"
+        )
+
+    query: Dict[str, Any] = {"$and": conditions} if conditions else {}
+    if pos is None:
+        find = coll.find(query, projection).sort(KEYSET_DESC).skip(0 if tiered else skip).limit(n)
+    elif direction == OLDER:
+        find = coll.find(query, projection).sort(KEYSET_DESC).limit(n)
     else:
-        result = maybe_coro
+        find = coll.find(query, projection).sort(KEYSET_ASC).limit(n)
+    docs = await find.to_list(length=n)
+    if direction == NEWER:
+        docs.reverse()
+
+    if tiered:
+        # the hot tier's n-th row: archived rows beyond it can't make the page
+        bound = _position(docs[-1] if direction == OLDER else docs[0]) if len(docs) >= n else None
+        archived = await asyncio.to_thread(cold.scan, direction == OLDER, pos, n, bound)
+        if archived:
+            # a segment being committed still has its rows in Mongo too
+            hot_ids = {d["_id"] for d in docs}
+            archived = [r for r in archived if r["_id"] not in hot_ids]
+            docs = sorted(docs + archived, key=_sort_key, reverse=True)
+            docs = docs[-n:] if direction == NEWER else docs[:n]
+        docs = docs[skip:]
 
-    inserted_id = getattr(result, "inserted_id", None)
-    if inserted_id is not None:
-        data["_id"] = inserted_id
+    first = _position(docs[0]) if docs else pos
+    last = _position(docs[-1]) if docs else None
+    next_ = _encode_cursor(OLDER, last) if last and len(docs) == limit else None
+    prev = _encode_cursor(NEWER, first) if first else None
 
-    # Run detection AFTER the log is stored
-    await run_detection(data)
+    out: List[Dict[str, Any]] = []
+    for d in docs:
+        d["_id"] = str(d["_id"])
+        out.append(_normalize_ts(d))
+    return {"items": out, "next": next_, "prev": prev}
 
 
-async def recent_logs(
-    limit: int = 50,
+def log_conditions(
     *,
-    page: int = 1,
     ip: Optional[str] = None,
     source: Optional[str] = None,
     contains: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
-    """
-    Get recent logs with optional filters + pagination.
-    """
-    # Build Mongo query
+    """Mongo conditions for the /logs filters. Raises ValueError on a bad search query."""
     conditions: List[Dict[str, Any]] = []
 
     if ip:
-        conditions.append({"message": {"$regex": ip}})
+        conditions.append({"src_ip": ip})
     if source:
         conditions.append({"source": source})
     if contains:
-        conditions.append({"message": {"$regex": contains}})
-
-    if conditions:
-        query: Dict[str, Any] = {"$and": conditions}
-    else:
-        query = {}
-
-    # Pagination
-    if page < 1:
-        page = 1
-    skip = (page - 1) * limit
-
-    cursor = (
-        logs_coll.find(query)
-        .sort("timestamp", -1)
-        .skip(skip)
-        .limit(limit)
-    )
-
-    # Motor cursor has .to_list(); PyMongo cursor is just iterable
-    to_list = getattr(cursor, "to_list", None)
-    if callable(to_list):
-        maybe_coro = to_list(length=limit)
-        if hasattr(maybe_coro, "__await__"):
-            docs = await maybe_coro
-        else:
-            docs = maybe_coro
-    else:
-        docs = list(cursor)
-
-    out: List[Dict[str, Any]] = []
-    for d in docs:
-        d["_id"] = str(d["_id"])
-        out.append(_normalize_ts(d))
-    return out
+        # term/phrase/prefix search on the terms index (backend/search.py)
+        conditions.extend(search_conditions(contains))
+    return conditions
 
 
-async def recent_alerts(
-    limit: int = 50,
+def alert_conditions(
     *,
-    page: int = 1,
     ip: Optional[str] = None,
     type_: Optional[str] = None,
     severity: Optional[str] = None,
     source: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
-    """
-    Get recent alerts with optional filters + pagination.
-    """
+    """Mongo conditions for the /alerts filters."""
     conditions: List[Dict[str, Any]] = []
 
     if ip:
@@ -140,35 +304,45 @@ async def recent_alerts(
         conditions.append({"severity": severity})
     if source:
         conditions.append({"source": source})
+    return conditions
 
-    if conditions:
-        query: Dict[str, Any] = {"$and": conditions}
-    else:
-        query = {}
-
-    if page < 1:
-        page = 1
-    skip = (page - 1) * limit
-
-    cursor = (
-        alerts_coll.find(query)
-        .sort("timestamp", -1)
-        .skip(skip)
-        .limit(limit)
-    )
-
-    to_list = getattr(cursor, "to_list", None)
-    if callable(to_list):
-        maybe_coro = to_list(length=limit)
-        if hasattr(maybe_coro, "__await__"):
-            docs = await maybe_coro
-        else:
-            docs = maybe_coro
-    else:
-        docs = list(cursor)
 
-    out: List[Dict[str, Any]] = []
-    for d in docs:
-        d["_id"] = str(d["_id"])
-        out.append(_normalize_ts(d))
-    return out
+async def recent_logs(
+    limit: int = 50,
+    *,
+    page: int = 1,
+    ip: Optional[str] = None,
+    source: Optional[str] = None,
+    contains: Optional[str] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Get recent logs (hot and archived) with optional filters + keyset
+    pagination (see _page).
+    `contains` takes the search syntax of backend/search.py. Raises
+    ValueError on a malformed cursor or search query.
+    """
+    conditions = log_conditions(ip=ip, source=source, contains=contains)
+    cold = tiering.ColdQuery(ip=ip, source=source, contains=contains)
+    return await _page(logs_coll, conditions, limit, page=page, cursor=cursor, since=since,
+                       projection={"terms": 0}, cold=cold)
+
+
+async def recent_alerts(
+    limit: int = 50,
+    *,
+    page: int = 1,
+    ip: Optional[str] = None,
+    type_: Optional[str] = None,
+    severity: Optional[str] = None,
+    source: Optional[str] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Get recent alerts with optional filters + keyset pagination (see _page).
+    Raises ValueError on a malformed cursor.
+    """
+    conditions = alert_conditions(ip=ip, type_=type_, severity=severity, source=source)
+    return await _page(alerts_coll, conditions, limit, page=page, cursor=cursor, since=since)
@@ -1,10 +1,39 @@
+# backend/database.py
+# Async data layer (Motor) for everything that runs on the event loop, plus
+# a synchronous PyMongo client for CLI tools and code that already runs on
+# its own thread (replay, backfill, benchmarks). Both share the pool and
+# timeout settings from config.
+
+from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
+
 from .config import settings
 
-# Connect synchronously (local dev)
-_client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
-db = _client[settings.DB_NAME]
+_client_options = dict(
+    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+    minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=settings.MONGO_MAX_IDLE_MS,
+    connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
 
-# Collections (sync objects)
+client = AsyncIOMotorClient(settings.MONGO_URI, **_client_options)
+db = client[settings.DB_NAME]
+
+# Collections (async: every call must be awaited)
 logs_coll = db["logs"]
 alerts_coll = db["alerts"]
+# log seq counter + detection checkpoint/lease (backend/pipeline.py)
+pipeline_coll = db["pipeline"]
+# pre-aggregated /stats counters (backend/rollups.py)
+rollups_coll = db["rollups"]
+# persisted top-K / distinct-IP sketch buckets (backend/sketches.py)
+sketches_coll = db["sketches"]
+# /ws events relayed between worker processes (WS_CHANNEL=mongo, backend/broadcast.py)
+ws_events_coll = db["ws_events"]
+
+# Blocking client; never call it from a coroutine on the main loop
+sync_client = MongoClient(settings.MONGO_URI, **_client_options)
+sync_db = sync_client[settings.DB_NAME]
@@ -1,10 +1,27 @@
 # backend/detector.py
 
-import re
-from datetime import datetime, timedelta
-from typing import Any, Dict, Optional, Set, List
-
-from .database import logs_coll, alerts_coll
+import os
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional, List, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from . import cache, rollups
+from .alerting import AlertAggregator
+from .config import settings
+from .correlation import CorrelationEngine
+from .database import alerts_coll
+from .parsing import ensure_fields
+from .rule_engine import RuleEngine
+from .sketches import sketches
+from .workers import DetectionPool
+
+# seq of the log being evaluated; stamped on the alerts it raises so that
+# re-processing the same log (after a crash/retry) cannot duplicate them
+_log_seq: ContextVar[Optional[int]] = ContextVar("log_seq", default=None)
 
 
 def _to_dt(value: Any) -> datetime:
@@ -31,200 +48,253 @@ async def _create_alert(
     type_: str,
     description: str,
     ip: Optional[str] = None,
-) -> None:
+) -> Any:
     """
-    Insert an alert document. DB call is sync (PyMongo), so no await.
+    Insert an alert document and return its _id.
     """
+    ts = _to_dt(timestamp)
     doc: Dict[str, Any] = {
         "source": source,
-        "timestamp": _to_dt(timestamp),
+        "timestamp": ts,
         "severity": severity,
         "type": type_,
         "description": description,
+        "count": 1,
+        "last_seen": ts,
     }
     if ip:
         doc["ip"] = ip
+    seq = _log_seq.get()
+    if seq is not None:
+        doc["log_seq"] = seq
+
+    try:
+        alert_id = (await alerts_coll.insert_one(doc)).inserted_id
+    except DuplicateKeyError:
+        # this log already raised this alert before a restart: reuse it
+        existing = await alerts_coll.find_one({"log_seq": seq, "type": type_, "severity": severity}, {"_id": 1})
+        return existing["_id"] if existing else None
+    rollups.writer.add_alert(doc)
+    await rollups.writer.maybe_flush()
+    cache.response_cache.invalidate(cache.ALERTS)
+    return alert_id
+
+
+async def _update_alert_counts(updates: List[Tuple[Any, int, datetime, str]]) -> None:
+    """
+    Apply aggregated hits to open alerts: one update per alert.
+    """
+    await alerts_coll.bulk_write(
+        [
+            UpdateOne(
+                {"_id": alert_id},
+                {"$inc": {"count": inc}, "$max": {"last_seen": last_seen}, "$set": {"description": description}},
+            )
+            for alert_id, inc, last_seen, description in updates
+        ],
+        ordered=False,
+    )
+    cache.response_cache.invalidate(cache.ALERTS)
+
+
+# ---------- RULES ----------
+# Detection rules are declarative files in RULES_DIR (backend/rules by
+# default), compiled and hot-reloaded by the rule engine.
 
-    # PyMongo insert_one is synchronous – do NOT await this
-    alerts_coll.insert_one(doc)
 
+async def _open_alert(**kwargs: Any) -> Any:
+    # look up _create_alert at call time so wrappers installed on this
+    # module (e.g. the WebSocket broadcast in app.py) are honoured
+    return await _create_alert(**kwargs)
 
-# ---------- RULE 1: SSH brute-force ----------
 
-SSH_FAIL_RE = re.compile(
-    r"Failed password for (invalid user )?(?P<user>\S+) from (?P<ip>\d+\.\d+\.\d+\.\d+).*ssh2"
+# Repeated hits for the same (type, ip, source) inside the suppression
+# window bump one alert instead of inserting a new one each time.
+aggregator: Optional[AlertAggregator] = (
+    AlertAggregator(_open_alert, _update_alert_counts, window_seconds=settings.ALERT_SUPPRESS_SECONDS)
+    if settings.ALERT_SUPPRESS_SECONDS > 0 else None
 )
 
 
-async def _rule_ssh_bruteforce(log: Dict[str, Any]) -> None:
-    """
-    Look for many failed SSH logins from the same IP in a short period.
-    Threshold: >= 5 failures in 60 seconds.
-    """
-    msg = log.get("message", "")
-    m = SSH_FAIL_RE.search(msg)
-    if not m:
-        return
+# Sequence rules over the alert stream (RULES_DIR/correlation). Every rule
+# hit is observed, including ones the aggregator suppresses; correlated
+# alerts are recorded but not fed back in.
+correlator = CorrelationEngine(
+    os.path.join(settings.RULES_DIR, "correlation"),
+    max_states=settings.DETECTOR_MAX_KEYS,
+    reload_seconds=settings.RULES_RELOAD_SECONDS,
+)
+correlator.load()
 
-    ip = m.group("ip")
-    ts = _to_dt(log.get("timestamp"))
-    window_start = ts - timedelta(seconds=60)
 
-    # PyMongo count_documents is sync – no await
-    count: int = logs_coll.count_documents(
-        {
-            "message": {"$regex": ip},
-            "timestamp": {"$gte": window_start, "$lte": ts},
-        }
-    )
+async def _record_alert(**kwargs: Any) -> None:
+    if aggregator is not None:
+        await aggregator.submit(**kwargs)
+    else:
+        await _open_alert(**kwargs)
+    # top-K / distinct attacker sketches count every hit, suppressed or not
+    sketches.add("alerts", kwargs.get("ip"))
 
-    if count >= 5:
-        description = f"{count} failed SSH attempts detected from {ip} within 60 seconds."
-        await _create_alert(
-            source=log.get("source", "unknown"),
-            timestamp=ts,
-            severity="HIGH",
-            type_="Brute Force",
-            description=description,
-            ip=ip,
-        )
 
+# ---------- Retry bookkeeping ----------
+# Evaluating a log updates in-memory state (rule windows, the correlator);
+# recording its alerts writes to Mongo and may fail. The two are split so a
+# batch that failed is retried from where it stopped instead of from the
+# start: logs in _evaluated are not evaluated twice, and alerts they raised
+# that are not recorded yet wait in _unrecorded, in order. The detection
+# stage calls settle() once a batch is done with.
 
-# ---------- RULE 2: Port scan detection ----------
+_evaluated: Set[int] = set()
+_unrecorded: Deque[Tuple[Optional[int], Dict[str, Any]]] = deque()
 
-GENERIC_CONN_RE = re.compile(
-    r"from (?P<ip>\d+\.\d+\.\d+\.\d+) port (?P<port>\d+)"
-)
 
+async def _emit_alert(**kwargs: Any) -> None:
+    kwargs["timestamp"] = _to_dt(kwargs.get("timestamp"))
+    seq = _log_seq.get()
+    _unrecorded.append((seq, kwargs))
+    for correlated in correlator.observe(kwargs):
+        _unrecorded.append((seq, correlated))
+
+
+async def _drain() -> None:
+    # an alert leaves the queue only once it is recorded
+    while _unrecorded:
+        seq, alert = _unrecorded[0]
+        token = _log_seq.set(seq)
+        try:
+            await _record_alert(**alert)
+        finally:
+            _log_seq.reset(token)
+        _unrecorded.popleft()
+
+
+def _forget(keep: int) -> None:
+    # drop what an evaluation that raised had already queued for its log
+    while len(_unrecorded) > keep:
+        _unrecorded.pop()
+
+
+def blocked_seq() -> Optional[int]:
+    """Seq of the log whose alert failed to record, if any."""
+    return _unrecorded[0][0] if _unrecorded else None
 
-async def _rule_port_scan(log: Dict[str, Any]) -> None:
-    """
-    If an IP hits >= 10 different ports within 2 minutes, flag port scan.
-    Works with generic 'from <ip> port <port>' style logs.
-    """
-    msg = log.get("message", "")
-    m = GENERIC_CONN_RE.search(msg)
-    if not m:
-        return
 
-    ip = m.group("ip")
-    ts = _to_dt(log.get("timestamp"))
-    window_start = ts - timedelta(minutes=2)
-
-    pipeline = [
-        {
-            "$match": {
-                "message": {"$regex": ip},
-                "timestamp": {"$gte": window_start, "$lte": ts},
-            }
-        },
-        {"$project": {"message": 1, "timestamp": 1}},
-    ]
-
-    # PyMongo aggregate is sync – turn cursor into a list
-    cursor = logs_coll.aggregate(pipeline)
-    docs: List[Dict[str, Any]] = list(cursor)
-
-    ports: Set[int] = set()
-    for d in docs:
-        m2 = GENERIC_CONN_RE.search(d.get("message", ""))
-        if m2:
-            try:
-                ports.add(int(m2.group("port")))
-            except ValueError:
-                continue
-
-    if len(ports) >= 10:
-        description = (
-            f"Possible port scan: {len(ports)} distinct ports targeted from {ip} "
-            f"within 2 minutes."
-        )
-        await _create_alert(
-            source=log.get("source", "unknown"),
-            timestamp=ts,
-            severity="MEDIUM",
-            type_="Port Scan",
-            description=description,
-            ip=ip,
-        )
-
-
-# ---------- RULE 3: SQL injection attempt detection ----------
-
-SQLI_PATTERNS = [
-    r"UNION\s+SELECT",
-    r"\bOR\b\s+1=1",
-    r"' OR '1'='1",
-    r"\" OR \"1\"=\"1",
-    r"DROP\s+TABLE",
-    r"--\s",
-    r"/\*",
-]
-
-SQLI_RE = re.compile("|".join(SQLI_PATTERNS), re.IGNORECASE)
-
-
-async def _rule_sql_injection(log: Dict[str, Any]) -> None:
+def discard(seq: int) -> None:
     """
-    Very simple pattern-based SQL injection attempt detection.
-    Assumes HTTP logs or app logs where the request payload is in 'message'.
+    Give up on log `seq` (detection failed for good): drop its unrecorded
+    alerts and don't evaluate it again in this batch.
     """
-    msg = log.get("message", "")
-    if not msg:
-        return
+    global _unrecorded
+    _unrecorded = deque(item for item in _unrecorded if item[0] != seq)
+    _evaluated.add(seq)
 
-    if SQLI_RE.search(msg):
-        ip_match = re.search(r"(?P<ip>\d+\.\d+\.\d+\.\d+)", msg)
-        ip = ip_match.group("ip") if ip_match else None
-        description = "Potential SQL injection payload detected in log message."
-        await _create_alert(
-            source=log.get("source", "unknown"),
-            timestamp=log.get("timestamp"),
-            severity="HIGH",
-            type_="SQL Injection",
-            description=description,
-            ip=ip,
-        )
 
+def settle() -> None:
+    """The current batch is done with; forget which of its logs ran."""
+    _evaluated.clear()
 
-# ---------- RULE 4: Suspicious root login ----------
 
-ROOT_LOGIN_RE = re.compile(
-    r"Accepted (password|publickey) for root from (?P<ip>\d+\.\d+\.\d+\.\d+)"
+engine = RuleEngine(
+    settings.RULES_DIR,
+    _emit_alert,
+    max_keys=settings.DETECTOR_MAX_KEYS,
+    reload_seconds=settings.RULES_RELOAD_SECONDS,
 )
+engine.load()
 
 
-async def _rule_root_login(log: Dict[str, Any]) -> None:
-    """
-    Flag any successful root SSH login as HIGH severity.
-    """
-    msg = log.get("message", "")
-    m = ROOT_LOGIN_RE.search(msg)
-    if not m:
-        return
+# ---------- Optional process pool ----------
+# With DETECTION_WORKERS > 0, logs are sharded by src_ip onto worker
+# processes (each owning its shard's window state) instead of being
+# evaluated inside the event loop.
+
+_pool: Optional[DetectionPool] = None
+
 
-    ip = m.group("ip")
-    description = f"Suspicious root SSH login detected from {ip}."
-    await _create_alert(
-        source=log.get("source", "unknown"),
-        timestamp=log.get("timestamp"),
-        severity="HIGH",
-        type_="Root Login",
-        description=description,
-        ip=ip,
+def start_workers(n_workers: int) -> None:
+    global _pool
+    if n_workers <= 0 or _pool is not None:
+        return
+    _pool = DetectionPool(
+        n_workers,
+        settings.RULES_DIR,
+        max_keys=settings.DETECTOR_MAX_KEYS,
+        reload_seconds=settings.RULES_RELOAD_SECONDS,
+        timeout=settings.DETECTION_WORKER_TIMEOUT_SECONDS,
     )
+    _pool.start()
+
+
+def stop_workers() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+async def stats() -> Dict[str, Any]:
+    if _pool is not None:
+        out = await _pool.stats()
+    else:
+        out = {"workers": 0, "rules": engine.dispatcher.stats(), "windows": engine.window_stats()}
+    out["alerts"] = aggregator.stats() if aggregator is not None else None
+    out["correlation"] = correlator.stats()
+    return out
 
 
 # ---------- MAIN ENTRY ----------
 
+async def _evaluate(log: Dict[str, Any]) -> None:
+    ensure_fields(log)
+    seq = log.get("seq")
+    keep = len(_unrecorded)
+    token = _log_seq.set(seq)
+    try:
+        await engine.evaluate(log, _to_dt(log.get("timestamp")))
+    except BaseException:
+        _forget(keep)
+        raise
+    finally:
+        _log_seq.reset(token)
+    if seq is not None:
+        _evaluated.add(seq)
+
+
 async def run_detection(log: Dict[str, Any]) -> None:
     """
-    Call all detection rules for a single log document.
+    Evaluate the compiled rule plan against a single log document.
+    """
+    await run_detection_batch([log])
+
+
+async def run_detection_batch(logs: List[Dict[str, Any]]) -> None:
+    """
+    Run detection over a batch of log documents in arrival order. Safe to
+    call again with the same batch after it raised: logs that were already
+    evaluated are skipped and only their unrecorded alerts are written.
     """
-    await _rule_ssh_bruteforce(log)
-    await _rule_port_scan(log)
-    await _rule_sql_injection(log)
-    await _rule_root_login(log)
+    await _drain()
+    todo = [log for log in logs if log.get("seq") is None or log["seq"] not in _evaluated]
+    if _pool is None:
+        for log in todo:
+            await _evaluate(log)
+            await _drain()
+        return
+
+    items = []
+    for log in todo:
+        ensure_fields(log)
+        items.append((log, _to_dt(log.get("timestamp"))))
+    if not items:
+        return
+    for alert in await _pool.process(items):
+        token = _log_seq.set(alert.pop("log_seq", None))
+        try:
+            await _emit_alert(**alert)
+        finally:
+            _log_seq.reset(token)
+    _evaluated.update(log["seq"] for log in todo if log.get("seq") is not None)
+    await _drain()
 
 
 # Backwards-compatible name for older imports / BackgroundTasks
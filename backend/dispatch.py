@@ -0,0 +1,260 @@
+# backend/dispatch.py
+# Single-pass rule dispatch. Each rule declares what it needs to see
+# (literal anchor keywords, an event_type, or extracted fields); a log is
+# scanned once for all anchors and only the rules whose prerequisites are met
+# are called. Per-rule evaluated/skipped counters show the savings.
+
+import re
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Set
+
+try:
+    import ahocorasick  # optional: pyahocorasick, C automaton
+except ImportError:
+    ahocorasick = None
+
+RuleFn = Callable[..., Awaitable[None]]
+
+
+class _Automaton:
+    """
+    Pure-Python Aho-Corasick automaton (used without pyahocorasick), built
+    as a trie with failure links and then flattened into a DFA: delta[s]
+    maps a character to the next state (absent: back to the root, state 0)
+    and out[s] holds every anchor that ends at s, so the scan is one dict
+    lookup per character.
+    """
+
+    # with this few distinct first characters, skipping ahead at the root
+    # with a character-class search beats stepping through every character
+    SKIP_MAX_FIRST = 8
+
+    def __init__(self, words: List[str]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[FrozenSet[str]] = [frozenset()]
+        for w in words:
+            s = 0
+            for ch in w:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = goto[s][ch] = len(goto)
+                    goto.append({})
+                    out.append(frozenset())
+                s = nxt
+            out[s] = out[s] | {w}
+
+        # breadth-first: a state's failure target is complete before its children
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            delta[s] = {**delta[fail[s]], **goto[s]}
+            for ch, nxt in goto[s].items():
+                queue.append(nxt)
+                fail[nxt] = delta[fail[s]].get(ch, 0) if s else 0
+                out[nxt] = out[nxt] | out[fail[nxt]]
+        self.delta = delta
+        self.out = out
+        self._start: Optional[re.Pattern] = (
+            re.compile("[" + "".join(re.escape(ch) for ch in goto[0]) + "]")
+            if len(goto[0]) <= self.SKIP_MAX_FIRST else None
+        )
+
+    def scan(self, text: str) -> Set[str]:
+        delta, out = self.delta, self.out
+        hits: Set[str] = set()
+        s = 0
+        if self._start is None:
+            for ch in text:
+                s = delta[s].get(ch, 0)
+                if out[s]:
+                    hits.update(out[s])
+            return hits
+        i, n = 0, len(text)
+        while i < n:
+            if s == 0:
+                m = self._start.search(text, i)
+                if m is None:
+                    break
+                i = m.start()
+            s = delta[s].get(text[i], 0)
+            if out[s]:
+                hits.update(out[s])
+            i += 1
+        return hits
+
+
+class _RegexScan:
+    """
+    Small anchor sets without pyahocorasick: a zero-width lookahead
+    alternation visits every position where any anchor starts (in the C
+    regex engine); candidates there are confirmed with startswith(),
+    bucketed by first character. Its cost grows with the number of anchors.
+    """
+
+    def __init__(self, words: List[str]):
+        self._by_first: Dict[str, List[str]] = defaultdict(list)
+        for w in sorted(words, key=len, reverse=True):
+            self._by_first[w[0]].append(w)
+        self._re = re.compile("(?=" + "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)) + ")")
+
+    def scan(self, text: str) -> Set[str]:
+        hits: Set[str] = set()
+        for m in self._re.finditer(text):
+            pos = m.start()
+            for w in self._by_first[text[pos]]:
+                if text.startswith(w, pos):
+                    hits.add(w)
+        return hits
+
+
+class AnchorScanner:
+    """
+    Multi-literal, case-insensitive keyword scan in one pass over the text
+    with an Aho-Corasick automaton: cost grows with the text, not with the
+    number of anchors, and overlapping anchors are all reported.
+
+    Uses pyahocorasick when it is installed (optional). Without it, sets of
+    up to REGEX_MAX_ANCHORS anchors use the C regex scan, which beats a
+    Python-level automaton at that size; larger sets use _Automaton.
+    """
+
+    REGEX_MAX_ANCHORS = 16
+
+    def __init__(self, anchors: Iterable[str]):
+        self.anchors: List[str] = sorted({a.lower() for a in anchors if a})
+        self.backend = "none"
+        self._ac: Any = None
+        self._fallback: Any = None
+        if not self.anchors:
+            return
+        if ahocorasick is not None:
+            self.backend = "pyahocorasick"
+            self._ac = ahocorasick.Automaton()
+            for a in self.anchors:
+                self._ac.add_word(a, a)
+            self._ac.make_automaton()
+        elif len(self.anchors) <= self.REGEX_MAX_ANCHORS:
+            self.backend = "regex"
+            self._fallback = _RegexScan(self.anchors)
+        else:
+            self.backend = "python"
+            self._fallback = _Automaton(self.anchors)
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        if not self.anchors or not text:
+            return frozenset()
+        low = text.lower()
+        if self._ac is not None:
+            return frozenset(a for _, a in self._ac.iter(low))
+        return frozenset(self._fallback.scan(low))
+
+
+class Rule:
+    def __init__(
+        self,
+        name: str,
+        fn: RuleFn,
+        *,
+        anchors: Iterable[str] = (),
+        event_types: Iterable[str] = (),
+        fields: Iterable[str] = (),
+    ):
+        """
+        anchors: run if any keyword appears in the message (case-insensitive)
+        event_types: run if log["event_type"] is one of these
+        fields: run only if all these extracted fields are present
+        A rule with no prerequisites runs on every log.
+        """
+        self.name = name
+        self.fn = fn
+        self.anchors = frozenset(a.lower() for a in anchors)
+        self.event_types = frozenset(event_types)
+        self.fields = tuple(fields)
+        self.evaluated = 0
+        self.total_ns = 0
+
+    def wants(self, log: Dict[str, Any], hits: FrozenSet[str]) -> bool:
+        if self.event_types and log.get("event_type") not in self.event_types:
+            return False
+        if self.fields and any(log.get(f) is None for f in self.fields):
+            return False
+        if self.anchors and not (self.anchors & hits):
+            return False
+        return True
+
+
+class RuleDispatcher:
+    """
+    Rules are indexed by their first prerequisite (event_type, else anchor,
+    else field/always), so per-log cost grows with the number of rules that
+    could match, not with the total number of rules.
+    """
+
+    def __init__(self, timed: bool = False):
+        """timed: also record per-rule wall time (used by replay/benchmarks)."""
+        self.rules: List[Rule] = []
+        self.dispatched = 0
+        self.timed = timed
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._scanner = AnchorScanner(a for r in self.rules for a in r.anchors)
+        self._by_event: Dict[str, List[Rule]] = defaultdict(list)
+        self._by_anchor: Dict[str, List[Rule]] = defaultdict(list)
+        self._unindexed: List[Rule] = []
+        for r in self.rules:
+            if r.event_types:
+                for et in r.event_types:
+                    self._by_event[et].append(r)
+            elif r.anchors:
+                for a in r.anchors:
+                    self._by_anchor[a].append(r)
+            else:
+                self._unindexed.append(r)
+        self._order = {id(r): i for i, r in enumerate(self.rules)}
+
+    def register(self, name: str, fn: RuleFn, **prereqs: Any) -> Rule:
+        rule = Rule(name, fn, **prereqs)
+        self.rules.append(rule)
+        self._rebuild()
+        return rule
+
+    def candidates(self, log: Dict[str, Any]) -> List[Rule]:
+        """Rules whose prerequisites this log meets, in registration order."""
+        hits = self._scanner.scan(log.get("message", "") or "") if self._by_anchor else frozenset()
+        found: Dict[int, Rule] = {}
+        for r in self._by_event.get(log.get("event_type"), ()):
+            found[id(r)] = r
+        for a in hits:
+            for r in self._by_anchor[a]:
+                found[id(r)] = r
+        for r in self._unindexed:
+            found[id(r)] = r
+        out = [r for r in found.values() if r.wants(log, hits)]
+        if len(out) > 1:
+            out.sort(key=lambda r: self._order[id(r)])
+        return out
+
+    async def dispatch(self, log: Dict[str, Any], *args: Any) -> None:
+        """Call fn(log, *args) for every candidate rule."""
+        self.dispatched += 1
+        for rule in self.candidates(log):
+            rule.evaluated += 1
+            if self.timed:
+                t0 = time.perf_counter_ns()
+                await rule.fn(log, *args)
+                rule.total_ns += time.perf_counter_ns() - t0
+            else:
+                await rule.fn(log, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for r in self.rules:
+            out[r.name] = {"evaluated": r.evaluated, "skipped": self.dispatched - r.evaluated}
+            if self.timed:
+                out[r.name]["avg_us"] = round(r.total_ns / r.evaluated / 1000, 3) if r.evaluated else 0.0
+                out[r.name]["total_ms"] = round(r.total_ns / 1e6, 3)
+        return out
@@ -0,0 +1,245 @@
+# backend/export.py
+# Bulk export for GET /logs/export and GET /alerts/export. Rows are streamed
+# from a batched cursor in (timestamp, _id) order, oldest first, and
+# encoded straight to NDJSON or CSV bytes in ~EXPORT_CHUNK_BYTES chunks, so
+# memory stays flat however many rows match. Log exports also cover the
+# archived tier (backend/tiering.py), merged in the same order.
+#
+# NDJSON uses orjson when it is installed (optional), else the stdlib json.
+
+import asyncio
+import csv
+import io
+import itertools
+import json
+import re
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+from . import tiering
+from .config import settings
+from .crud import KEYSET_ASC, _sort_key, alert_conditions, log_conditions
+from .database import alerts_coll, logs_coll
+
+NDJSON = "ndjson"
+CSV = "csv"
+MEDIA_TYPES = {NDJSON: "application/x-ndjson", CSV: "text/csv; charset=utf-8"}
+
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# CSV columns when no fields are given (NDJSON then exports whole documents)
+LOG_FIELDS = ("_id", "timestamp", "source", "src_ip", "port", "user", "auth_method", "event_type", "message")
+ALERT_FIELDS = ("_id", "timestamp", "last_seen", "source", "severity", "type", "ip", "count", "description")
+# internal fields never exported
+HIDDEN = {"terms"}
+# a CSV cell starting with one of these is run as a formula by spreadsheets
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)  # ObjectId and anything else BSON hands back
+
+
+if orjson is not None:
+    def _dumps(doc: Dict[str, Any]) -> bytes:
+        return orjson.dumps(doc, default=_default, option=orjson.OPT_APPEND_NEWLINE)
+else:
+    def _dumps(doc: Dict[str, Any]) -> bytes:
+        return json.dumps(doc, default=_default, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_default, separators=(",", ":"))
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # log lines are attacker-controlled: keep them text, not formulas
+        return "'" + value
+    return value
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """'timestamp,src_ip,message' -> list of names. Raises ValueError."""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    bad = [f for f in names if not FIELD_RE.match(f) or f in HIDDEN]
+    if bad:
+        raise ValueError(f"invalid field(s): {', '.join(bad)}")
+    return list(dict.fromkeys(names))
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", ""))
+    except ValueError:
+        raise ValueError(f"invalid timestamp: {value}") from None
+
+
+def _time_conditions(start: Optional[datetime], end: Optional[datetime]) -> List[Dict[str, Any]]:
+    rng: Dict[str, Any] = {}
+    if start:
+        rng["$gte"] = start
+    if end:
+        rng["$lt"] = end
+    return [{"timestamp": rng}] if rng else []
+
+
+# ---------- row sources ----------
+
+async def _hot(coll, conditions: List[Dict[str, Any]], projection: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    query: Dict[str, Any] = {"$and": conditions} if conditions else {}
+    cursor = coll.find(query, projection).sort(KEYSET_ASC).batch_size(settings.EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        yield doc
+
+
+async def _cold(rows: Iterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    # segments are decompressed off the event loop, one batch at a time
+    try:
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(rows, settings.EXPORT_BATCH_SIZE))
+            if not batch:
+                return
+            for row in batch:
+                yield row
+    finally:
+        rows.close()
+
+
+async def _merge(a: AsyncIterator[Dict[str, Any]], b: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    x, y = await anext(a, None), await anext(b, None)
+    while x is not None or y is not None:
+        if x is not None and y is not None and x["_id"] == y["_id"]:
+            # in both tiers while its segment is being committed
+            y = await anext(b, None)
+            continue
+        if y is None or (x is not None and _sort_key(x) <= _sort_key(y)):
+            yield x
+            x = await anext(a, None)
+        else:
+            yield y
+            y = await anext(b, None)
+
+
+# ---------- encoders ----------
+
+async def _encode(
+    rows: AsyncIterator[Dict[str, Any]],
+    fmt: str,
+    fields: Optional[Sequence[str]],
+    limit: Optional[int],
+) -> AsyncIterator[bytes]:
+    chunk_bytes = settings.EXPORT_CHUNK_BYTES
+    n = 0
+    if fmt == CSV:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(fields)
+        async for row in rows:
+            writer.writerow([_cell(row.get(f)) for f in fields])
+            n += 1
+            if limit and n >= limit:
+                break
+            if buf.tell() >= chunk_bytes:
+                yield buf.getvalue().encode()
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode()
+        return
+
+    parts: List[bytes] = []
+    size = 0
+    async for row in rows:
+        if fields is not None:
+            row = {f: row[f] for f in fields if f in row}
+        else:
+            for f in HIDDEN:
+                row.pop(f, None)
+        line = _dumps(row)
+        parts.append(line)
+        size += len(line)
+        n += 1
+        if limit and n >= limit:
+            break
+        if size >= chunk_bytes:
+            yield b"".join(parts)
+            parts.clear()
+            size = 0
+    if parts:
+        yield b"".join(parts)
+
+
+def _plan(
+    fmt: str, fields: Optional[str], defaults: Sequence[str], limit: Optional[int]
+) -> Tuple[Optional[List[str]], Dict[str, Any]]:
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"format must be one of {', '.join(MEDIA_TYPES)}")
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+    names = parse_fields(fields)
+    if names is None and fmt == CSV:
+        names = list(defaults)
+    if names is None:
+        return None, {f: 0 for f in HIDDEN}
+    # timestamp and _id are always read: they order the stream and the tier merge
+    return names, {**{f: 1 for f in names}, "timestamp": 1, "_id": 1}
+
+
+def export_logs(
+    fmt: str = NDJSON,
+    *,
+    fields: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    ip: Optional[str] = None,
+    source: Optional[str] = None,
+    contains: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Logs (hot and archived) matching the /logs filters within
+    [start, end), oldest first, as a stream of encoded chunks. Arguments
+    are validated here, before anything is streamed: raises ValueError.
+    Rows archived while the export is running may be missed.
+    """
+    names, projection = _plan(fmt, fields, LOG_FIELDS, limit)
+    start_dt, end_dt = parse_time(start), parse_time(end)
+    conditions = log_conditions(ip=ip, source=source, contains=contains) + _time_conditions(start_dt, end_dt)
+
+    rows = _hot(logs_coll, conditions, projection)
+    if tiering.catalog.segments():
+        cold = tiering.ColdQuery(ip=ip, source=source, contains=contains)
+        rows = _merge(_cold(tiering.iter_cold(start_dt, end_dt, query=cold)), rows)
+    return _encode(rows, fmt, names, limit)
+
+
+def export_alerts(
+    fmt: str = NDJSON,
+    *,
+    fields: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    ip: Optional[str] = None,
+    type_: Optional[str] = None,
+    severity: Optional[str] = None,
+    source: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """Alerts matching the /alerts filters within [start, end); see export_logs."""
+    names, projection = _plan(fmt, fields, ALERT_FIELDS, limit)
+    conditions = alert_conditions(ip=ip, type_=type_, severity=severity, source=source)
+    conditions += _time_conditions(parse_time(start), parse_time(end))
+    return _encode(_hot(alerts_coll, conditions, projection), fmt, names, limit)
@@ -0,0 +1,267 @@
+# backend/indexes.py
+# Index bootstrap + TTL retention for the logs and alerts collections.
+# The wanted indexes mirror the actual query shapes in crud.py and the
+# /stats endpoints; ensure_indexes() runs at startup and
+# index_report() backs GET /stats/indexes.
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from .config import settings
+from .database import db, logs_coll, alerts_coll, rollups_coll, sketches_coll, ws_events_coll
+
+logger = logging.getLogger(__name__)
+
+Keys = List[Tuple[str, int]]
+
+# name -> (keys, extra options). Names are fixed so verification is stable.
+LOG_INDEXES: Dict[str, Tuple[Keys, Dict[str, Any]]] = {
+    # /stats time windows, TTL retention
+    "ts_desc": ([("timestamp", DESCENDING)], {}),
+    # recent_logs() keyset order (timestamp, _id); filtered variants below
+    "ts_id_desc": ([("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    # /logs?ip=
+    "src_ip_ts_id": ([("src_ip", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    # /logs?source=
+    "source_ts_id": ([("source", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    # /logs?contains= : multikey over the search terms (backend/search.py)
+    "terms_ts_id": ([("terms", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    "user_ts": ([("user", ASCENDING), ("timestamp", DESCENDING)], {"sparse": True}),
+    # detection stage reads logs in seq order (backend/pipeline.py); seqs
+    # come from a counter, so no unique constraint is needed on the hot path
+    "seq": ([("seq", ASCENDING)], {"sparse": True}),
+}
+
+ALERT_INDEXES: Dict[str, Tuple[Keys, Dict[str, Any]]] = {
+    # alerts-over-time, TTL retention
+    "ts_desc": ([("timestamp", DESCENDING)], {}),
+    # recent_alerts() keyset order (timestamp, _id) and its filtered variants
+    "ts_id_desc": ([("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    "severity_ts_id": ([("severity", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    "type_ts_id": ([("type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    "ip_ts_id": ([("ip", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    "source_ts_id": ([("source", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    # one alert per (log, type, severity): makes detection re-runs idempotent
+    "log_seq_type": (
+        [("log_seq", ASCENDING), ("type", ASCENDING), ("severity", ASCENDING)],
+        {"unique": True, "partialFilterExpression": {"log_seq": {"$exists": True}}},
+    ),
+}
+
+ROLLUP_INDEXES: Dict[str, Tuple[Keys, Dict[str, Any]]] = {
+    # /stats windows and series (backend/rollups.py)
+    "grain_dim_bucket": ([("grain", ASCENDING), ("dim", ASCENDING), ("bucket", ASCENDING)], {}),
+    # top-N keys per dimension
+    "grain_dim_count": ([("grain", ASCENDING), ("dim", ASCENDING), ("count", DESCENDING)], {}),
+    # minute buckets carry expire_at; hour/all-time buckets never expire
+    "expire_at": ([("expire_at", ASCENDING)], {"expireAfterSeconds": 0, "sparse": True}),
+}
+
+SKETCH_INDEXES: Dict[str, Tuple[Keys, Dict[str, Any]]] = {
+    # startup reload of this process's buckets (backend/sketches.py)
+    "owner_stream_start": ([("owner", ASCENDING), ("stream", ASCENDING), ("start", ASCENDING)], {}),
+    "expire_at": ([("expire_at", ASCENDING)], {"expireAfterSeconds": 0}),
+}
+
+WS_EVENT_INDEXES: Dict[str, Tuple[Keys, Dict[str, Any]]] = {
+    # relayed /ws events are only needed while workers catch up
+    "at_ttl": ([("at", ASCENDING)], {"expireAfterSeconds": settings.WS_EVENT_TTL_SECONDS}),
+}
+
+# Superseded by the (..., timestamp, _id) variants above; dropped at startup.
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    "logs": ["src_ip_ts", "source_ts"],
+    "alerts": ["severity_ts", "type_ts", "ip_ts", "source_ts"],
+}
+
+KEYSET: Keys = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# Representative filters/sorts used to check that no hot query falls back
+# to a collection scan.
+QUERY_SHAPES: Dict[str, List[Tuple[str, Dict[str, Any], Optional[Keys]]]] = {
+    "logs": [
+        ("recent_logs", {}, KEYSET),
+        ("recent_logs?ip", {"src_ip": "0.0.0.0"}, KEYSET),
+        ("recent_logs?source", {"source": "x"}, KEYSET),
+        ("recent_logs?contains", {"terms": {"$all": ["x"]}}, KEYSET),
+        ("detection_stage", {"seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ],
+    "alerts": [
+        ("recent_alerts", {}, KEYSET),
+        ("recent_alerts?severity", {"severity": "HIGH"}, KEYSET),
+        ("recent_alerts?type", {"type": "x"}, KEYSET),
+        ("recent_alerts?ip", {"ip": "0.0.0.0"}, KEYSET),
+        ("alerts_24h", {"timestamp": {"$gte": 0}}, None),
+    ],
+    "rollups": [
+        ("series", {"grain": "hour", "dim": "alerts", "bucket": {"$gte": 0}}, None),
+        ("top", {"grain": "all", "dim": "alerts.ip"}, [("count", DESCENDING)]),
+    ],
+}
+
+
+def _collections() -> List[Any]:
+    colls = [logs_coll, alerts_coll, rollups_coll, sketches_coll]
+    if settings.WS_CHANNEL == "mongo":
+        colls.append(ws_events_coll)
+    return colls
+
+
+def _retention_seconds(days: float) -> Optional[int]:
+    return int(days * 86400) if days and days > 0 else None
+
+
+def _wanted(coll_name: str) -> Dict[str, Tuple[Keys, Dict[str, Any]]]:
+    if coll_name == "rollups":
+        return {name: (keys, dict(opts)) for name, (keys, opts) in ROLLUP_INDEXES.items()}
+    if coll_name == "sketches":
+        return {name: (keys, dict(opts)) for name, (keys, opts) in SKETCH_INDEXES.items()}
+    if coll_name == "ws_events":
+        return {name: (keys, dict(opts)) for name, (keys, opts) in WS_EVENT_INDEXES.items()}
+    if coll_name == "logs":
+        wanted, days = LOG_INDEXES, settings.LOG_RETENTION_DAYS
+    else:
+        wanted, days = ALERT_INDEXES, settings.ALERT_RETENTION_DAYS
+
+    out = {name: (keys, dict(opts)) for name, (keys, opts) in wanted.items()}
+    ttl = _retention_seconds(days)
+    if ttl is not None:
+        # TTL lives on the single-field timestamp index
+        out["ts_desc"][1]["expireAfterSeconds"] = ttl
+    return out
+
+
+async def _sync_ttl(coll, name: str, keys: Keys, existing: Dict[str, Any], ttl: Optional[int]) -> None:
+    current = existing.get("expireAfterSeconds")
+    if current == ttl:
+        return
+    if ttl is not None and current is not None:
+        # change retention in place
+        await db.command("collMod", coll.name, index={"name": name, "expireAfterSeconds": ttl})
+        logger.info("%s.%s: TTL changed %ss -> %ss", coll.name, name, current, ttl)
+        return
+    # adding or removing TTL: rebuild the index
+    await coll.drop_index(name)
+    opts = {"expireAfterSeconds": ttl} if ttl is not None else {}
+    await coll.create_index(keys, name=name, **opts)
+    logger.info("%s.%s: TTL set to %s", coll.name, name, ttl)
+
+
+def _key_tuple(keys) -> Tuple[Tuple[str, int], ...]:
+    return tuple((k, int(v)) for k, v in keys)
+
+
+def _resolve(info: Dict[str, Any], name: str, keys: Keys) -> Optional[str]:
+    """Name under which the wanted index exists (ours, or same keys under another name)."""
+    if name in info:
+        return name
+    for other, spec in info.items():
+        if _key_tuple(spec["key"]) == _key_tuple(keys):
+            return other
+    return None
+
+
+async def _ensure(coll) -> List[str]:
+    warnings: List[str] = []
+    info = await coll.index_information()
+    for name, (keys, opts) in _wanted(coll.name).items():
+        actual = _resolve(info, name, keys)
+        if actual is None:
+            try:
+                await coll.create_index(keys, name=name, **opts)
+            except OperationFailure as exc:
+                # usually the same keys exist under another name
+                warnings.append(f"{coll.name}.{name}: could not create ({exc})")
+            continue
+
+        existing = info[actual]
+        if _key_tuple(existing["key"]) != _key_tuple(keys):
+            warnings.append(f"{coll.name}.{name}: key pattern differs from expected {keys}")
+            continue
+        try:
+            await _sync_ttl(coll, actual, keys, existing, opts.get("expireAfterSeconds"))
+        except OperationFailure as exc:
+            warnings.append(f"{coll.name}.{name}: could not update TTL ({exc})")
+
+    for name in RETIRED_INDEXES.get(coll.name, []):
+        if name in info:
+            try:
+                await coll.drop_index(name)
+                logger.info("%s.%s: dropped (superseded)", coll.name, name)
+            except OperationFailure as exc:
+                warnings.append(f"{coll.name}.{name}: could not drop retired index ({exc})")
+    return warnings
+
+
+async def ensure_indexes() -> List[str]:
+    """
+    Create/verify all wanted indexes. Returns (and logs) any warnings.
+    """
+    warnings: List[str] = []
+    for coll in _collections():
+        warnings.extend(await _ensure(coll))
+    for w in warnings:
+        logger.warning("index: %s", w)
+    return warnings
+
+
+async def _usage(coll) -> Dict[str, Dict[str, Any]]:
+    try:
+        stats = await coll.aggregate([{"$indexStats": {}}]).to_list(length=None)
+    except (OperationFailure, NotImplementedError):
+        return {}
+    return {
+        s["name"]: {"ops": s.get("accesses", {}).get("ops", 0),
+                    "since": s.get("accesses", {}).get("since")}
+        for s in stats
+    }
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for child in plan.get("inputStages", []) + ([plan["inputStage"]] if "inputStage" in plan else []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def _collscan_shapes(coll) -> List[str]:
+    hits: List[str] = []
+    for label, flt, sort in QUERY_SHAPES.get(coll.name, []):
+        cursor = coll.find(flt).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            plan = (await cursor.explain()).get("queryPlanner", {}).get("winningPlan", {})
+        except (OperationFailure, NotImplementedError, AttributeError):
+            return []
+        if "COLLSCAN" in _plan_stages(plan):
+            hits.append(label)
+    return hits
+
+
+async def index_report() -> Dict[str, Any]:
+    """
+    Per-collection index status: present/missing wanted indexes, usage
+    counters from $indexStats, unused indexes and query shapes that would
+    collection-scan.
+    """
+    report: Dict[str, Any] = {}
+    for coll in _collections():
+        info = await coll.index_information()
+        wanted = _wanted(coll.name)
+        usage = await _usage(coll)
+        report[coll.name] = {
+            "indexes": sorted(info.keys()),
+            "missing": sorted(n for n, (keys, _) in wanted.items() if _resolve(info, n, keys) is None),
+            "ttl_seconds": (
+                info.get(_resolve(info, "ts_desc", wanted["ts_desc"][0]) or "", {}).get("expireAfterSeconds")
+                if "ts_desc" in wanted else None
+            ),
+            "usage": usage,
+            "unused": sorted(n for n, u in usage.items() if u["ops"] == 0 and n != "_id_"),
+            "collscan_queries": await _collscan_shapes(coll),
+        }
+    return report
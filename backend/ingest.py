@@ -0,0 +1,168 @@
+# backend/ingest.py
+# Group-commit ingest queue: POST /logs enqueues, a single background writer
+# flushes batches to Mongo with insert_many, and each request is answered
+# once its batch is written. Batches form from whatever queued up while the
+# previous write was in flight (plus an optional linger, flush_interval).
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[Any]],
+        *,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+    ):
+        """
+        flush: coroutine called with each batch (e.g. crud.insert_logs);
+            returns a list with one error (or None) per item. Any other
+            result fails the whole batch.
+        max_size: queue capacity; submit() raises asyncio.QueueFull beyond it.
+        batch_size / flush_interval: flush when either limit is reached.
+        """
+        self._flush_fn = flush
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # metrics
+        self.enqueued = 0
+        self.rejected_full = 0
+        self.batches_flushed = 0
+        self.docs_flushed = 0
+        self.docs_failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop accepting new logs and wait until everything queued is flushed.
+        """
+        if not self.running:
+            return
+        self._closing = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def submit(self, item: Any) -> "asyncio.Future[Optional[str]]":
+        """
+        Enqueue one log. Returns a future that resolves once the log's batch
+        is written: None if it was stored, else the error message.
+        Raises asyncio.QueueFull when the queue is full or shutting down.
+        """
+        if self._closing or not self.running:
+            self.rejected_full += 1
+            raise asyncio.QueueFull()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, fut))
+        except asyncio.QueueFull:
+            self.rejected_full += 1
+            raise
+        self.enqueued += 1
+        return fut
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth(),
+            "capacity": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "enqueued": self.enqueued,
+            "rejected_full": self.rejected_full,
+            "batches_flushed": self.batches_flushed,
+            "docs_flushed": self.docs_flushed,
+            "docs_failed": self.docs_failed,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches_flushed, 3)
+            if self.batches_flushed else 0.0,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        q = self._queue
+        stopping = False
+        while not stopping:
+            item = await q.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                # take whatever is already queued without waiting
+                try:
+                    item = q.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(q.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Any]) -> None:
+        started = time.perf_counter()
+        items = [item for item, _ in batch]
+        try:
+            errors = await self._flush_fn(items)
+        except Exception as exc:
+            logger.exception("ingest flush of %d logs failed", len(batch))
+            errors = [f"write failed: {exc}"] * len(batch)
+        if not isinstance(errors, list) or len(errors) != len(batch):
+            # can't tell which logs were stored: don't acknowledge any
+            logger.error(
+                "ingest flush of %d logs returned %s instead of one result per log; failing the batch",
+                len(batch),
+                f"{len(errors)} results" if isinstance(errors, list) else type(errors).__name__,
+            )
+            errors = ["write failed: unexpected flush result"] * len(batch)
+        for (_, fut), err in zip(batch, errors):
+            if err is None:
+                self.docs_flushed += 1
+            else:
+                self.docs_failed += 1
+            if not fut.done():
+                fut.set_result(err)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.batches_flushed += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._total_flush_ms += elapsed
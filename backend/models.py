@@ -5,6 +5,7 @@ class LogIn(BaseModel):
     source: str = Field(..., description="Host that sent the log, e.g. ec2-1")
     timestamp: datetime
     message: str
+    file: str | None = Field(None, description="Path of the file the line was read from")
 
 class AlertModel(BaseModel):
     source: str
@@ -13,3 +14,5 @@ class AlertModel(BaseModel):
     type: str
     description: str
     ip: str | None = None
+    count: int = 1
+    last_seen: datetime | None = None
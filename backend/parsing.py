@@ -0,0 +1,121 @@
+# backend/parsing.py
+# Parse-once field extraction. Runs at ingest so rules and queries can use
+# real, indexed fields (src_ip, port, user, event_type) instead of regexing
+# the raw message again.
+
+import re
+from typing import Any, Dict, Optional
+
+from .dispatch import AnchorScanner
+
+IPV4 = r"\d+\.\d+\.\d+\.\d+"
+
+SSH_FAIL_RE = re.compile(
+    rf"Failed password for (invalid user )?(?P<user>\S+) from (?P<ip>{IPV4}).*ssh2"
+)
+SSH_ACCEPT_RE = re.compile(
+    rf"Accepted (?P<method>\S+) for (?P<user>\S+) from (?P<ip>{IPV4})"
+)
+GENERIC_CONN_RE = re.compile(
+    rf"from (?P<ip>{IPV4}) port (?P<port>\d+)"
+)
+HTTP_ACCESS_RE = re.compile(
+    rf'^(?P<ip>{IPV4}) \S+ \S+ \[[^\]]*\] "(?P<method>[A-Z]+) '
+)
+ANY_IP_RE = re.compile(rf"(?P<ip>{IPV4})")
+
+# normalized event_type values
+EVENT_SSH_FAILED = "ssh_failed_password"
+EVENT_SSH_ACCEPTED = "ssh_accepted"
+EVENT_HTTP = "http_request"
+EVENT_CONNECTION = "connection"
+EVENT_OTHER = "other"
+
+EXTRACTED_FIELDS = ("src_ip", "port", "user", "auth_method", "event_type")
+
+# literal anchors gating the regexes above: one scan decides which to run
+_A_FAILED = "failed password"
+_A_ACCEPTED = "accepted "
+_A_PORT = " port "
+_SCANNER = AnchorScanner((_A_FAILED, _A_ACCEPTED, _A_PORT))
+
+
+def extract_fields(message: str) -> Dict[str, Any]:
+    """
+    Pull structured fields out of a raw log line.
+    Only fields that were found are returned; event_type is always set.
+    """
+    out: Dict[str, Any] = {}
+    ip: Optional[str] = None
+    hits = _SCANNER.scan(message)
+
+    m = SSH_FAIL_RE.search(message) if _A_FAILED in hits else None
+    if m:
+        out["event_type"] = EVENT_SSH_FAILED
+        out["user"] = m.group("user")
+        ip = m.group("ip")
+    else:
+        m = SSH_ACCEPT_RE.search(message) if _A_ACCEPTED in hits else None
+        if m:
+            out["event_type"] = EVENT_SSH_ACCEPTED
+            out["user"] = m.group("user")
+            out["auth_method"] = m.group("method")
+            ip = m.group("ip")
+        else:
+            m = HTTP_ACCESS_RE.match(message)
+            if m:
+                out["event_type"] = EVENT_HTTP
+                ip = m.group("ip")
+
+    conn = GENERIC_CONN_RE.search(message) if _A_PORT in hits else None
+    if conn:
+        out["port"] = int(conn.group("port"))
+        ip = ip or conn.group("ip")
+        out.setdefault("event_type", EVENT_CONNECTION)
+
+    if ip is None:
+        m = ANY_IP_RE.search(message)
+        if m:
+            ip = m.group("ip")
+    if ip is not None:
+        out["src_ip"] = ip
+
+    out.setdefault("event_type", EVENT_OTHER)
+    return out
+
+
+def ensure_fields(log: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Make sure a log dict carries the extracted fields (older documents and
+    raw payloads may not). Parses only if event_type is missing.
+    """
+    if "event_type" not in log:
+        log.update(extract_fields(log.get("message", "") or ""))
+    return log
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """
+    Add extracted fields to stored logs that predate parse-at-ingest.
+    Returns the number of documents updated.
+    """
+    from pymongo import UpdateOne
+    from .database import sync_db
+
+    logs_coll = sync_db["logs"]
+    updated = 0
+    ops = []
+    cursor = logs_coll.find({"event_type": {"$exists": False}}, {"message": 1})
+    for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": extract_fields(doc.get("message", "") or "")}))
+        if len(ops) >= batch_size:
+            updated += logs_coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += logs_coll.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    # python -m backend.parsing  -> backfill fields on existing logs
+    print(f"backfilled {backfill()} logs")
@@ -0,0 +1,371 @@
+# backend/pipeline.py
+# Two-stage ingest. Stage 1 (crud.insert_logs) stamps every log with a
+# monotonically increasing `seq` from a Mongo counter and acknowledges the
+# client once the write is durable; it never runs detection. Stage 2 (the
+# DetectionStage below) consumes stored logs in seq order, runs detection
+# with retries, and persists a processed-up-to checkpoint, so every stored
+# log is analysed once and a restart resumes where the last one stopped.
+#
+# Alerts carry the seq of the log that raised them and a unique
+# (log_seq, type, severity) index makes re-processing after a crash
+# idempotent. The stage also owns flushing aggregated alert counts (see
+# _checkpoint). Only one process holds the detection lease at a time.
+#
+# A batch that fails is retried from the log that failed (the detector keeps
+# track of what it already evaluated), so window counts are never fed the
+# same log twice. A reserved seq that is not stored within gap_timeout is
+# stepped over but looked up again for recheck_seconds: a slow write is
+# analysed late rather than never.
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from . import detector
+from .config import settings
+from .database import db, logs_coll, pipeline_coll
+
+logger = logging.getLogger(__name__)
+
+SEQ_ID = "log_seq"
+CHECKPOINT_ID = "detection"
+LEASE_SECONDS = 30.0
+
+failures_coll = db["pipeline_failures"]
+
+
+async def reserve_seq(n: int) -> int:
+    """Reserve n consecutive seq values; returns the first one."""
+    doc = await pipeline_coll.find_one_and_update(
+        {"_id": SEQ_ID},
+        {"$inc": {"value": n}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["value"] - n + 1
+
+
+class DetectionStage:
+    def __init__(
+        self,
+        *,
+        batch_size: int = 500,
+        poll_interval: float = 0.5,
+        checkpoint_interval: float = 1.0,
+        max_retries: int = 5,
+        gap_timeout: float = 10.0,
+        recheck_seconds: float = 600.0,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.max_retries = max_retries
+        self.gap_timeout = gap_timeout
+        self.recheck_seconds = recheck_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.position = 0          # last seq processed
+        self.checkpoint = 0        # last seq persisted
+        self.latest_seq = 0        # highest seq stored by this process
+        self.leased = False
+        self._lease_until = 0.0
+        self._last_checkpoint = 0.0
+        self._skip: Set[int] = set()
+        self._gap_since: Optional[float] = None
+        # seqs stepped over while missing -> when to stop looking for them
+        self._late: Dict[int, float] = {}
+        self._last_recheck = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # callers of checkpoint_now() waiting for the next forced checkpoint
+        self._checkpoint_waiters: List["asyncio.Future[bool]"] = []
+
+        # metrics
+        self.processed = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.gaps_skipped = 0
+        self.late_processed = 0
+        self.gaps_lost = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Process whatever is already stored, checkpoint, release the lease."""
+        if not self.running:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    # ---------- called by stage 1 ----------
+
+    def notify(self, last_seq: int) -> None:
+        """New logs up to last_seq are stored."""
+        self.latest_seq = max(self.latest_seq, last_seq)
+        if self._wake is not None:
+            self._wake.set()
+
+    def skip(self, seqs: Iterable[int]) -> None:
+        """Seqs that were reserved but failed to store; don't wait for them."""
+        for seq in seqs:
+            self._skip.add(seq)
+            self._late.pop(seq, None)
+
+    async def checkpoint_now(self) -> bool:
+        """
+        Have the stage flush aggregated counts and advance the checkpoint
+        (the only safe place to flush them, see _checkpoint) and wait for
+        it. Returns False if this process doesn't hold the detection lease.
+        """
+        if not self.running or not self.leased:
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        self._checkpoint_waiters.append(fut)
+        self._wake.set()
+        return await fut
+
+    def _settle_waiters(self, ok: bool) -> None:
+        waiters, self._checkpoint_waiters = self._checkpoint_waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(ok)
+
+    # ---------- lease / checkpoint ----------
+
+    async def _acquire(self) -> bool:
+        now = datetime.utcnow()
+        try:
+            doc = await pipeline_coll.find_one_and_update(
+                {"_id": CHECKPOINT_ID, "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # the checkpoint exists and another process holds a live lease
+            return False
+        if not self.leased:
+            self.position = self.checkpoint = int(doc.get("seq", 0))
+            until = time.monotonic() + self.recheck_seconds
+            self._late = {int(seq): until for seq in doc.get("late", [])}
+            logger.info("detection lease acquired by %s at seq %d", self.owner, self.position)
+        self.leased = True
+        self._lease_until = time.monotonic() + LEASE_SECONDS
+        return True
+
+    async def _write_checkpoint(self, release: bool = False) -> None:
+        now = datetime.utcnow()
+        lease_until = now if release else now + timedelta(seconds=LEASE_SECONDS)
+        res = await pipeline_coll.update_one(
+            {"_id": CHECKPOINT_ID, "owner": self.owner},
+            {"$set": {"seq": self.position, "late": sorted(self._late), "updated": now, "lease_until": lease_until}},
+        )
+        if res.matched_count == 0:
+            # lease was taken over (we stalled for longer than LEASE_SECONDS)
+            logger.error("detection lease lost by %s at seq %d", self.owner, self.position)
+            self.leased = False
+            return
+        self.checkpoint = self.position
+        self._last_checkpoint = time.monotonic()
+        self._lease_until = time.monotonic() + LEASE_SECONDS
+
+    async def _checkpoint(self, *, force: bool = False, release: bool = False) -> None:
+        due = time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+        renew = self._lease_until - time.monotonic() < LEASE_SECONDS / 2
+        if not (force or renew or (due and self.position != self.checkpoint)):
+            return
+        # Aggregated counts are flushed here and only here, right before the
+        # checkpoint: after a crash, stored counts then cover exactly the
+        # logs up to the checkpoint and re-processing the rest adds no double
+        # counts (re-opened alerts are deduplicated by log_seq).
+        agg = detector.aggregator
+        if agg is not None:
+            await agg.flush(idle_seconds=agg.window.total_seconds())
+        await self._write_checkpoint(release)
+
+    # ---------- consuming ----------
+
+    async def _fetch(self) -> List[Dict[str, Any]]:
+        cursor = logs_coll.find({"seq": {"$gt": self.position}}, {"terms": 0}).sort("seq", 1).limit(self.batch_size)
+        return await cursor.to_list(length=self.batch_size)
+
+    def _ready(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Longest gap-free prefix of docs starting right after position."""
+        expected = self.position + 1
+        ready: List[Dict[str, Any]] = []
+        for doc in docs:
+            while expected in self._skip and doc["seq"] != expected:
+                expected += 1
+            if doc["seq"] != expected:
+                break
+            ready.append(doc)
+            expected += 1
+
+        if ready or not docs:
+            self._gap_since = None
+            return ready
+
+        # head-of-line gap: a reserved seq is not stored (yet)
+        now = time.monotonic()
+        if self._gap_since is None:
+            self._gap_since = now
+        elif now - self._gap_since >= self.gap_timeout:
+            missing = [s for s in range(self.position + 1, docs[0]["seq"]) if s not in self._skip]
+            logger.warning("detection: stepping over %d missing seq(s) after %d", len(missing), self.position)
+            self.gaps_skipped += len(missing)
+            until = now + self.recheck_seconds
+            self._late.update((s, until) for s in missing)
+            self.position = docs[0]["seq"] - 1
+            self._gap_since = None
+            return self._ready(docs)
+        return []
+
+    async def _process(self, docs: List[Dict[str, Any]]) -> None:
+        try:
+            for attempt in range(self.max_retries):
+                try:
+                    await detector.run_detection_batch(docs)
+                    return
+                except Exception:
+                    self.retries += 1
+                    logger.exception("detection batch at seq %d failed (attempt %d)", docs[0]["seq"], attempt + 1)
+                    await asyncio.sleep(min(0.1 * 2 ** attempt, 5.0))
+
+            # isolate the poison log(s); everything else still gets analysed
+            for doc in docs:
+                while True:
+                    try:
+                        await detector.run_detection_batch([doc])
+                        break
+                    except Exception as exc:
+                        # an earlier log's alert may be what keeps failing
+                        seq = detector.blocked_seq() or doc["seq"]
+                        await self._give_up(seq, docs, exc)
+                        if seq == doc["seq"]:
+                            break
+        finally:
+            detector.settle()
+
+    async def _give_up(self, seq: int, docs: List[Dict[str, Any]], exc: Exception) -> None:
+        self.failed += 1
+        detector.discard(seq)
+        logger.error("detection gave up on log seq %d: %r", seq, exc)
+        log_id = next((d.get("_id") for d in docs if d["seq"] == seq), None)
+        await failures_coll.insert_one({"seq": seq, "log_id": log_id, "error": repr(exc), "at": datetime.utcnow()})
+
+    async def _recheck(self) -> None:
+        """Analyse stepped-over seqs whose write has shown up since."""
+        now = time.monotonic()
+        if not self._late or now - self._last_recheck < self.poll_interval:
+            return
+        self._last_recheck = now
+        expired = [s for s, until in self._late.items() if until <= now]
+        if expired:
+            logger.warning("detection: %d missing seq(s) never stored, e.g. %d", len(expired), expired[0])
+            self.gaps_lost += len(expired)
+            for s in expired:
+                del self._late[s]
+        if not self._late:
+            return
+        cursor = logs_coll.find({"seq": {"$in": sorted(self._late)}}, {"terms": 0}).sort("seq", 1)
+        docs = await cursor.to_list(length=None)
+        if docs:
+            await self._process(docs)
+            for doc in docs:
+                del self._late[doc["seq"]]
+            self.late_processed += len(docs)
+            self.processed += len(docs)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self.leased and not await self._acquire():
+                    self._settle_waiters(False)
+                    if self._closing:
+                        return
+                    await asyncio.sleep(LEASE_SECONDS / 3)
+                    continue
+
+                if self._checkpoint_waiters:
+                    await self._checkpoint(force=True)
+                    self._settle_waiters(self.leased)
+                await self._recheck()
+                # clear before reading so a notify() during the fetch isn't lost
+                self._wake.clear()
+                docs = await self._fetch()
+                ready = self._ready(docs)
+                if ready:
+                    await self._process(ready)
+                    self.position = ready[-1]["seq"]
+                    if self._skip:
+                        self._skip = {s for s in self._skip if s > self.position}
+                    self.processed += len(ready)
+                    self.batches += 1
+                    await self._checkpoint()
+                    continue
+
+                if self._closing:
+                    # anything behind a gap is picked up after the restart
+                    await self._checkpoint(force=True, release=True)
+                    self._settle_waiters(self.leased)
+                    self.leased = False
+                    return
+                await self._checkpoint()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception:
+                # Mongo unavailable etc.: back off and resume from position
+                logger.exception("detection stage error")
+                if self._closing:
+                    self._settle_waiters(False)
+                    return
+                await asyncio.sleep(1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "leased": self.leased,
+            "position": self.position,
+            "checkpoint": self.checkpoint,
+            "lag": max(0, self.latest_seq - self.position),
+            "processed": self.processed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed": self.failed,
+            "gaps_skipped": self.gaps_skipped,
+            "late": len(self._late),
+            "late_processed": self.late_processed,
+            "gaps_lost": self.gaps_lost,
+        }
+
+
+stage = DetectionStage(
+    batch_size=settings.DETECTION_BATCH_SIZE,
+    poll_interval=settings.DETECTION_POLL_MS / 1000,
+    checkpoint_interval=settings.DETECTION_CHECKPOINT_SECONDS,
+    max_retries=settings.DETECTION_MAX_RETRIES,
+    gap_timeout=settings.DETECTION_GAP_SECONDS,
+    recheck_seconds=settings.DETECTION_GAP_RECHECK_SECONDS,
+)
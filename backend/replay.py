@@ -0,0 +1,368 @@
+# backend/replay.py
+# Replay / backtest: stream historical logs (from logs_coll by time range, or
+# from raw files) through the compiled detection rules at full speed, using
+# each log's own timestamp rather than wall-clock time. Alerts go to a
+# dry-run sink or a separate collection named replay_*, never to the live
+# alerts collection or any other collection the app owns. Memory is bounded: logs are streamed from a batched cursor or
+# file, and only per-(type, ip) alert counts are kept.
+#
+# Stored logs cover both tiers: hot (logs_coll) and archived segments.
+#
+#   python -m backend.replay --start 2024-01-01T00:00 --end 2024-01-02T00:00
+#   python -m backend.replay --file /var/log/auth.log --year 2024
+#   python -m backend.replay --file logs.ndjson --sink replay_alerts
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .config import settings
+from .correlation import CorrelationEngine
+from .parsing import ensure_fields
+from .rule_engine import RuleEngine
+
+DIFF_LIMIT = 50
+
+# collection sinks are confined to their own namespace
+SINK_PREFIX = "replay_"
+SINK_RE = re.compile(r"^replay_[A-Za-z0-9_]{1,64}$")
+
+SYSLOG_TS_RE = re.compile(
+    r"^(?P<mon>[A-Z][a-z]{2})\s+(?P<day>\d{1,2}) (?P<time>\d\d:\d\d:\d\d) (?P<host>\S+) "
+)
+ISO_TS_RE = re.compile(r"^(?P<ts>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?)Z?\s")
+
+
+def _to_dt(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", ""))
+        except ValueError:
+            return None
+    return None
+
+
+# ---------- sources ----------
+
+def iter_mongo(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    source: Optional[str] = None,
+    batch_size: int = 2000,
+) -> Iterator[Dict[str, Any]]:
+    """Stored logs in (timestamp, _id) order, streamed from a batched cursor."""
+    from .database import sync_db
+
+    query: Dict[str, Any] = {}
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    if source:
+        query["source"] = source
+    cursor = sync_db["logs"].find(query, {"terms": 0}).sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+    yield from cursor
+
+
+def iter_stored(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    source: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Hot and archived logs (backend/tiering.py) merged in timestamp order."""
+    import heapq
+
+    from .tiering import iter_cold
+
+    last = None
+    merged = heapq.merge(iter_cold(start, end, source), iter_mongo(start, end, source),
+                         key=lambda log: (log["timestamp"], log["_id"]))
+    for log in merged:
+        log_id = log.pop("_id")
+        if log_id == last:
+            # in both tiers while its segment is being committed
+            continue
+        last = log_id
+        yield log
+
+
+def iter_file(path: str, *, year: Optional[int] = None, source: str = "replay") -> Iterator[Dict[str, Any]]:
+    """
+    Raw log file: NDJSON records ({source, timestamp, message}) or plain lines
+    with a syslog ("Jan  5 10:00:01 host ...") or ISO-8601 prefix. Lines
+    without a timestamp inherit the previous one.
+    """
+    year = year or datetime.utcnow().year
+    last_ts: Optional[datetime] = None
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if line.startswith("{"):
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    rec = None
+                if isinstance(rec, dict) and "message" in rec:
+                    ts = _to_dt(rec.get("timestamp")) or last_ts
+                    if ts is None:
+                        continue
+                    last_ts = ts
+                    rec["timestamp"] = ts
+                    rec.setdefault("source", source)
+                    yield rec
+                    continue
+
+            log_source = source
+            m = SYSLOG_TS_RE.match(line)
+            if m:
+                try:
+                    last_ts = datetime.strptime(f"{year} {m['mon']} {m['day']} {m['time']}", "%Y %b %d %H:%M:%S")
+                    log_source = m["host"]
+                except ValueError:
+                    pass
+            else:
+                m = ISO_TS_RE.match(line)
+                if m:
+                    last_ts = _to_dt(m["ts"]) or last_ts
+            if last_ts is None:
+                continue
+            yield {"source": log_source, "timestamp": last_ts, "message": line}
+
+
+# ---------- sinks ----------
+
+class DryRunSink:
+    """Keeps a small sample of alerts; everything else is only counted."""
+
+    def __init__(self, sample_size: int = 20):
+        self.sample: List[Dict[str, Any]] = []
+        self.sample_size = sample_size
+
+    def write(self, alert: Dict[str, Any]) -> None:
+        if len(self.sample) < self.sample_size:
+            self.sample.append(alert)
+
+    def close(self) -> Dict[str, Any]:
+        return {"sink": "dry_run", "sample": [_jsonable(a) for a in self.sample]}
+
+
+class CollectionSink:
+    """Writes alerts to a separate collection in batches."""
+
+    def __init__(self, name: str, batch_size: int = 1000):
+        from .database import sync_db
+
+        check_sink(name)
+        self.coll = sync_db[name]
+        self.name = name
+        self.batch_size = batch_size
+        self._buf: List[Dict[str, Any]] = []
+        self.written = 0
+
+    def write(self, alert: Dict[str, Any]) -> None:
+        doc = {k: v for k, v in alert.items() if k != "type_"}
+        doc["type"] = alert["type_"]
+        self._buf.append(doc)
+        if len(self._buf) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buf:
+            self.coll.insert_many(self._buf, ordered=False)
+            self.written += len(self._buf)
+            self._buf = []
+
+    def close(self) -> Dict[str, Any]:
+        self._flush()
+        return {"sink": "collection", "collection": self.name, "written": self.written}
+
+
+def _jsonable(alert: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(alert)
+    if isinstance(out.get("timestamp"), datetime):
+        out["timestamp"] = out["timestamp"].isoformat()
+    return out
+
+
+# ---------- replay ----------
+
+class Replay:
+    def __init__(self, sink, *, rules_dir: Optional[str] = None, correlate: bool = True):
+        rules_dir = rules_dir or settings.RULES_DIR
+        self.sink = sink
+        # fresh state: replay never touches the live detector's windows
+        self.engine = RuleEngine(
+            rules_dir, self._on_alert,
+            max_keys=settings.DETECTOR_MAX_KEYS, reload_seconds=float("inf"), timed=True,
+        )
+        self.engine.load()
+        self.correlator = (
+            CorrelationEngine(os.path.join(rules_dir, "correlation"), reload_seconds=float("inf"))
+            if correlate else None
+        )
+        if self.correlator is not None:
+            self.correlator.load()
+        self.alert_counts: Counter = Counter()
+        self.first_ts: Optional[datetime] = None
+        self.last_ts: Optional[datetime] = None
+        self.logs = 0
+
+    def _record(self, alert: Dict[str, Any]) -> None:
+        self.alert_counts[(alert["type_"], alert.get("ip"))] += 1
+        self.sink.write(alert)
+
+    async def _on_alert(self, **alert: Any) -> None:
+        self._record(alert)
+        if self.correlator is not None:
+            for correlated in self.correlator.observe(alert):
+                self._record(correlated)
+
+    async def run(self, logs: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        for log in logs:
+            ts = _to_dt(log.get("timestamp"))
+            if ts is None:
+                continue
+            if self.first_ts is None or ts < self.first_ts:
+                self.first_ts = ts
+            if self.last_ts is None or ts > self.last_ts:
+                self.last_ts = ts
+            ensure_fields(log)
+            await self.engine.evaluate(log, ts)
+            self.logs += 1
+        elapsed = time.perf_counter() - started
+
+        by_type: Counter = Counter()
+        for (type_, _), n in self.alert_counts.items():
+            by_type[type_] += n
+        return {
+            "logs": self.logs,
+            "seconds": round(elapsed, 3),
+            "events_per_sec": round(self.logs / elapsed, 1) if elapsed > 0 else None,
+            "first_ts": self.first_ts.isoformat() if self.first_ts else None,
+            "last_ts": self.last_ts.isoformat() if self.last_ts else None,
+            "alerts": sum(self.alert_counts.values()),
+            "alerts_by_type": dict(by_type),
+            "rules": self.engine.dispatcher.stats(),
+            "output": self.sink.close(),
+        }
+
+    def diff_against_stored(self, source: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Compare replayed hits per (type, ip) with the stored alerts for the
+        replayed time range (and source, when the replay was limited to
+        one). Stored aggregated alerts contribute their count.
+        """
+        from .database import sync_db
+
+        if self.first_ts is None:
+            return {"added": [], "removed": [], "changed": [], "totals": {"added": 0, "removed": 0, "changed": 0}}
+        match: Dict[str, Any] = {"timestamp": {"$gte": self.first_ts, "$lte": self.last_ts}}
+        if source:
+            match["source"] = source
+        pipeline = [
+            {"$match": match},
+            # same key as alert_counts; older alerts kept the address in source_ip
+            {"$group": {
+                "_id": {"type": "$type", "ip": {"$ifNull": ["$ip", "$source_ip"]}},
+                "n": {"$sum": {"$ifNull": ["$count", 1]}},
+            }},
+        ]
+        stored = {(d["_id"].get("type"), d["_id"].get("ip")): d["n"] for d in sync_db["alerts"].aggregate(pipeline)}
+
+        added, removed, changed = [], [], []
+        for key, n in self.alert_counts.items():
+            if key not in stored:
+                added.append({"type": key[0], "ip": key[1], "replay": n})
+            elif stored[key] != n:
+                changed.append({"type": key[0], "ip": key[1], "stored": stored[key], "replay": n})
+        for key, n in stored.items():
+            if key not in self.alert_counts:
+                removed.append({"type": key[0], "ip": key[1], "stored": n})
+        return {
+            "added": added[:DIFF_LIMIT],
+            "removed": removed[:DIFF_LIMIT],
+            "changed": changed[:DIFF_LIMIT],
+            "totals": {"added": len(added), "removed": len(removed), "changed": len(changed)},
+        }
+
+
+def _is_dry_run(sink: str) -> bool:
+    return sink in ("dry_run", "dry-run", "")
+
+
+def check_sink(sink: str) -> None:
+    """Dry run or a replay_* collection name. Raises ValueError."""
+    if not _is_dry_run(sink) and not SINK_RE.match(sink):
+        raise ValueError(
+            f"sink must be dry_run or a collection named {SINK_PREFIX}<letters, digits, _> (max 64)"
+        )
+
+
+def make_sink(sink: str):
+    if _is_dry_run(sink):
+        return DryRunSink()
+    return CollectionSink(sink)
+
+
+async def replay_range(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    *,
+    source: Optional[str] = None,
+    sink: str = "dry_run",
+    correlate: bool = True,
+    diff: bool = True,
+) -> Dict[str, Any]:
+    r = Replay(make_sink(sink), correlate=correlate)
+    report = await r.run(iter_stored(start, end, source))
+    if diff:
+        report["diff"] = r.diff_against_stored(source)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay logs through the detection rules")
+    parser.add_argument("--start", help="ISO time, inclusive (stored logs)")
+    parser.add_argument("--end", help="ISO time, exclusive (stored logs)")
+    parser.add_argument("--source", help="only logs from this source (stored logs)")
+    parser.add_argument("--file", action="append", help="raw log file(s) instead of stored logs")
+    parser.add_argument("--year", type=int, help="year for syslog timestamps (default: current)")
+    parser.add_argument("--sink", default="dry_run", help="dry_run (default) or a replay_* collection, e.g. replay_alerts")
+    parser.add_argument("--rules-dir", help=f"rules directory (default: {settings.RULES_DIR})")
+    parser.add_argument("--no-correlate", action="store_true", help="skip correlation rules")
+    parser.add_argument("--no-diff", action="store_true", help="skip the diff against stored alerts")
+    args = parser.parse_args()
+    try:
+        check_sink(args.sink)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    r = Replay(make_sink(args.sink), rules_dir=args.rules_dir, correlate=not args.no_correlate)
+    if args.file:
+        logs: Iterable[Dict[str, Any]] = (
+            log for path in args.file for log in iter_file(path, year=args.year)
+        )
+    else:
+        logs = iter_stored(_to_dt(args.start), _to_dt(args.end), args.source)
+
+    report = asyncio.run(r.run(logs))
+    if not args.no_diff:
+        report["diff"] = r.diff_against_stored(None if args.file else args.source)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
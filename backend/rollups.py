@@ -0,0 +1,409 @@
+# backend/rollups.py
+# Pre-aggregated counters behind the /stats endpoints. Every stored log and
+# every newly opened alert bumps a handful of rollup documents (all-time,
+# per hour, and per minute for the plain totals) by dimension: severity,
+# type, source and IP. Bumps are summed in memory and written every
+# ROLLUP_FLUSH_MS as $inc upserts, so the dashboard reads a few dozen
+# bucket documents instead of re-aggregating logs/alerts on every poll.
+#
+# Counts follow the documents as they were written: TTL retention on logs
+# or alerts does not decrement them. `python -m backend.rollups` rebuilds
+# everything from the stored collections (run it with ingest stopped).
+# On a deployment that predates rollups, the first process to start with an
+# empty rollups collection seeds it in the background (see seed()); a seed
+# that fails is resumed by the next process to start.
+
+import asyncio
+import logging
+import os
+import socket
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .config import settings
+from .database import pipeline_coll, rollups_coll
+
+logger = logging.getLogger(__name__)
+
+# grains
+ALL = "all"
+HOUR = "hour"
+MINUTE = "minute"
+EPOCH = datetime(1970, 1, 1)
+
+# dimensions; minute buckets are only kept for the unkeyed totals, which
+# need them to make rolling windows (last 24h) exact to the minute
+LOGS = "logs"
+LOGS_SOURCE = "logs.source"
+ALERTS = "alerts"
+ALERTS_SEVERITY = "alerts.severity"
+ALERTS_TYPE = "alerts.type"
+ALERTS_SOURCE = "alerts.source"
+ALERTS_IP = "alerts.ip"
+
+Key = Tuple[str, str, str, datetime]  # (grain, dim, key, bucket)
+
+# one-shot seeding claim, in the pipeline collection
+SEED_ID = "rollups_seed"
+SEED_LEASE_SECONDS = 3600.0
+
+
+def _floor(ts: datetime, grain: str) -> datetime:
+    if grain == ALL:
+        return EPOCH
+    if grain == HOUR:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+
+def _doc_id(key: Key) -> str:
+    grain, dim, value, bucket = key
+    return f"{grain}|{dim}|{bucket:%Y%m%d%H%M}|{value}"
+
+
+def _bumps(ts: datetime, dims: Iterable[Tuple[str, str]]) -> Iterable[Key]:
+    for dim, value in dims:
+        for grain in (ALL, HOUR, MINUTE) if value == "" else (ALL, HOUR):
+            yield grain, dim, value, _floor(ts, grain)
+
+
+def log_keys(doc: Dict[str, Any]) -> Iterable[Key]:
+    ts = doc.get("timestamp")
+    if not isinstance(ts, datetime):
+        return ()
+    return _bumps(ts, ((LOGS, ""), (LOGS_SOURCE, str(doc.get("source") or ""))))
+
+
+def alert_keys(doc: Dict[str, Any]) -> Iterable[Key]:
+    ts = doc.get("timestamp")
+    if not isinstance(ts, datetime):
+        return ()
+    dims = [
+        (ALERTS, ""),
+        (ALERTS_SEVERITY, str(doc.get("severity") or "")),
+        (ALERTS_TYPE, str(doc.get("type") or "")),
+        (ALERTS_SOURCE, str(doc.get("source") or "")),
+    ]
+    ip = doc.get("ip") or doc.get("source_ip")
+    if ip:
+        dims.append((ALERTS_IP, str(ip)))
+    return _bumps(ts, dims)
+
+
+def _fields(key: Key) -> Dict[str, Any]:
+    grain, dim, value, bucket = key
+    fields: Dict[str, Any] = {"grain": grain, "dim": dim, "key": value, "bucket": bucket}
+    if grain == MINUTE:
+        # TTL index on expire_at drops minute buckets once no window needs them
+        fields["expire_at"] = bucket + timedelta(hours=settings.ROLLUP_MINUTE_RETENTION_HOURS)
+    return fields
+
+
+def _update(key: Key, n: int, *, replace: bool = False) -> UpdateOne:
+    fields = _fields(key)
+    if replace:
+        return UpdateOne({"_id": _doc_id(key)}, {"$set": {**fields, "count": n}}, upsert=True)
+    return UpdateOne({"_id": _doc_id(key)}, {"$inc": {"count": n}, "$setOnInsert": fields}, upsert=True)
+
+
+class RollupWriter:
+    """
+    Sums bumps in memory; flush() turns them into one $inc upsert per
+    touched bucket. With flush_interval == 0 every add is written at once.
+    """
+
+    def __init__(self, *, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+        self._pending: Counter = Counter()
+        self._inflight: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+
+    def add_logs(self, docs: Iterable[Dict[str, Any]]) -> None:
+        for doc in docs:
+            self._pending.update(log_keys(doc))
+
+    def add_alert(self, doc: Dict[str, Any]) -> None:
+        self._pending.update(alert_keys(doc))
+
+    def pending(self, grain: str, dim: str) -> Dict[Tuple[str, datetime], int]:
+        """Not-yet-flushed counts, so readers see their own process's writes."""
+        out: Counter = Counter()
+        for counts in (self._pending, self._inflight):
+            for k, n in counts.items():
+                if k[0] == grain and k[1] == dim:
+                    out[(k[2], k[3])] += n
+        return out
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            batch = self._inflight = self._pending
+            self._pending = Counter()
+            try:
+                await rollups_coll.bulk_write([_update(k, n) for k, n in batch.items()], ordered=False)
+            except Exception:
+                # keep the counts for the next attempt
+                self.errors += 1
+                self._pending.update(batch)
+                raise
+            finally:
+                self._inflight = Counter()
+            self.flushes += 1
+            self.written += len(batch)
+
+    async def maybe_flush(self) -> None:
+        """Called after adds: writes immediately when unbuffered."""
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("rollup flush failed")
+
+    async def start(self) -> None:
+        if self.flush_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+        }
+
+
+writer = RollupWriter(flush_interval=settings.ROLLUP_FLUSH_MS / 1000)
+
+
+# ---------- readers ----------
+
+async def _buckets(grain: str, dim: str, query: Dict[str, Any]) -> Dict[Tuple[str, datetime], int]:
+    cursor = rollups_coll.find(
+        {"grain": grain, "dim": dim, **query}, {"key": 1, "bucket": 1, "count": 1},
+        max_time_ms=settings.STATS_MAX_TIME_MS,
+    )
+    out: Counter = Counter()
+    for d in await cursor.to_list(length=None):
+        out[(d["key"], d["bucket"])] += d["count"]
+    return out
+
+
+async def total(dim: str) -> int:
+    doc = await rollups_coll.find_one(
+        {"_id": _doc_id((ALL, dim, "", EPOCH))}, {"count": 1}, max_time_ms=settings.STATS_MAX_TIME_MS,
+    )
+    return (doc or {}).get("count", 0) + writer.pending(ALL, dim).get(("", EPOCH), 0)
+
+
+async def series(dim: str, start: datetime) -> List[Tuple[datetime, int]]:
+    """
+    (bucket start, count) for an unkeyed dim since `start`: whole hours from
+    hour buckets, the partial first hour from minute buckets.
+    """
+    first_hour = _floor(start, HOUR)
+    if first_hour < start:
+        first_hour += timedelta(hours=1)
+    first_minute = _floor(start, MINUTE)
+    hours, minutes = await asyncio.gather(
+        _buckets(HOUR, dim, {"bucket": {"$gte": first_hour}}),
+        _buckets(MINUTE, dim, {"bucket": {"$gte": first_minute, "$lt": first_hour}}),
+    )
+    out: Counter = Counter()
+    for (_, bucket), n in hours.items():
+        out[bucket] += n
+    for (_, bucket), n in minutes.items():
+        out[bucket] += n
+    for (_, bucket), n in writer.pending(HOUR, dim).items():
+        if bucket >= first_hour:
+            out[bucket] += n
+    for (_, bucket), n in writer.pending(MINUTE, dim).items():
+        if first_minute <= bucket < first_hour:
+            out[bucket] += n
+    return sorted(out.items())
+
+
+async def count_since(dim: str, start: datetime) -> int:
+    return sum(n for _, n in await series(dim, start))
+
+
+async def top(dim: str, limit: Optional[int] = 10) -> List[Tuple[str, int]]:
+    """All-time counts per key, highest first."""
+    cursor = rollups_coll.find(
+        {"grain": ALL, "dim": dim}, {"key": 1, "count": 1}, max_time_ms=settings.STATS_MAX_TIME_MS,
+    ).sort("count", DESCENDING)
+    if limit:
+        # headroom for keys whose unflushed counts would move them up
+        cursor = cursor.limit(limit + 10)
+    counts: Counter = Counter({d["key"]: d["count"] for d in await cursor.to_list(length=None)})
+    for (key, _), n in writer.pending(ALL, dim).items():
+        counts[key] += n
+    return counts.most_common(limit)
+
+
+# ---------- rebuild ----------
+
+def _count(batch_size: int, before: Optional[datetime] = None) -> Counter:
+    # before: only documents inserted earlier (ObjectIds carry their creation time)
+    from .database import sync_db
+
+    from .tiering import iter_cold
+
+    before_id = ObjectId.from_datetime(before) if before else None
+    query: Dict[str, Any] = {"_id": {"$lt": before_id}} if before_id else {}
+    counts: Counter = Counter()
+    for doc in sync_db["logs"].find(query, {"timestamp": 1, "source": 1}).batch_size(batch_size):
+        counts.update(log_keys(doc))
+    for doc in iter_cold():
+        if before_id is None or doc["_id"] < before_id:
+            counts.update(log_keys(doc))
+    fields = {"timestamp": 1, "severity": 1, "type": 1, "source": 1, "ip": 1, "source_ip": 1}
+    for doc in sync_db["alerts"].find(query, fields).batch_size(batch_size):
+        counts.update(alert_keys(doc))
+    return counts
+
+
+def _write(counts: Counter, batch_size: int, *, replace: bool) -> int:
+    from .database import sync_db
+
+    cutoff = datetime.utcnow() - timedelta(hours=settings.ROLLUP_MINUTE_RETENTION_HOURS)
+    ops = [_update(k, n, replace=replace) for k, n in counts.items() if k[0] != MINUTE or k[3] >= cutoff]
+    coll = sync_db[rollups_coll.name]
+    for i in range(0, len(ops), batch_size):
+        coll.bulk_write(ops[i:i + batch_size], ordered=False)
+    return len(ops)
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """
+    Recompute every rollup from the stored logs (both tiers) and alerts
+    (blocking).
+    Returns the number of rollup documents written.
+    """
+    from .database import sync_db
+
+    counts = _count(batch_size)
+    sync_db[rollups_coll.name].delete_many({})
+    return _write(counts, batch_size, replace=True)
+
+
+async def claim_seed(before: datetime) -> Optional[datetime]:
+    """
+    Claim the one-shot seeding when the rollups predate no documents: on
+    first start with an empty rollups collection, or to finish a seed that
+    failed or was abandoned. Returns the cutoff to pass to seed() (`before`
+    for a new claim, the original cutoff when resuming), or None if there
+    is nothing to do or another process holds the claim. Call before this
+    process starts ingesting.
+    """
+    claim = await pipeline_coll.find_one({"_id": SEED_ID})
+    if claim is not None and claim.get("done"):
+        return None
+    if claim is None and await rollups_coll.find_one({}, {"_id": 1}) is not None:
+        # rollups were kept from the first document on
+        return None
+    now = datetime.utcnow()
+    try:
+        claim = await pipeline_coll.find_one_and_update(
+            {"_id": SEED_ID, "done": {"$ne": True}, "lease_until": {"$lt": now}},
+            {
+                "$set": {
+                    "owner": f"{socket.gethostname()}:{os.getpid()}",
+                    "lease_until": now + timedelta(seconds=SEED_LEASE_SECONDS),
+                },
+                # the writers have counted everything since the first claim
+                "$setOnInsert": {"before": before},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # seeded already, or another process holds the claim
+        return None
+    return claim.get("before", before)
+
+
+def _seed_write(counts: Counter, batch_size: int) -> int:
+    # Each bucket takes its seed count once: the op only matches a document
+    # that isn't marked seeded yet, so on a marked one the upsert collides
+    # on _id (code 11000) and is dropped. A resumed seed therefore doesn't
+    # add twice what a failed one already wrote.
+    from .database import sync_db
+
+    cutoff = datetime.utcnow() - timedelta(hours=settings.ROLLUP_MINUTE_RETENTION_HOURS)
+    keys = [k for k in counts if k[0] != MINUTE or k[3] >= cutoff]
+    coll = sync_db[rollups_coll.name]
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        for _ in range(3):
+            ops = [
+                UpdateOne(
+                    {"_id": _doc_id(key), "seeded": {"$ne": True}},
+                    {"$inc": {"count": counts[key]}, "$set": {"seeded": True}, "$setOnInsert": _fields(key)},
+                    upsert=True,
+                )
+                for key in batch
+            ]
+            try:
+                coll.bulk_write(ops, ordered=False)
+                break
+            except BulkWriteError as exc:
+                errors = exc.details.get("writeErrors", [])
+                if any(e.get("code") != 11000 for e in errors):
+                    raise
+                # a collision is either an already seeded bucket or a race
+                # with a writer's first upsert: retry those, done ones drop
+                batch = [batch[e["index"]] for e in errors]
+    return len(keys)
+
+
+def seed(before: datetime, batch_size: int = 1000) -> int:
+    """
+    Build the rollups from documents inserted before `before` (blocking).
+    Later ones are counted by the writers, and the counts go in as $inc so
+    their flushes are kept. Run only with the cutoff claim_seed() returned;
+    the claim is marked done only once every count is written, and released
+    on failure so the next start resumes it.
+    """
+    from .database import sync_db
+
+    claims = sync_db[pipeline_coll.name]
+    try:
+        written = _seed_write(_count(batch_size, before), batch_size)
+    except Exception:
+        logger.exception("rollup seeding failed; the next start resumes it")
+        claims.update_one({"_id": SEED_ID}, {"$set": {"lease_until": datetime.utcnow()}})
+        raise
+    claims.update_one({"_id": SEED_ID}, {"$set": {"done": True, "written": written}})
+    logger.info("rollups seeded from stored documents: %d rollup documents", written)
+    return written
+
+
+if __name__ == "__main__":
+    # python -m backend.rollups  -> rebuild rollups from stored documents
+    print(f"wrote {rebuild()} rollup documents")
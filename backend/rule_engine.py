@@ -0,0 +1,369 @@
+# backend/rule_engine.py
+# Declarative detection rules. Rules are JSON (or YAML, if PyYAML is
+# installed) files in RULES_DIR; they are compiled into an evaluation plan
+# and hot-reloaded when the directory changes, without restarting uvicorn.
+#
+# Rule format (one object, or a list of objects, per file):
+#
+#   {
+#     "name": "ssh_bruteforce",              unique id
+#     "type": "Brute Force",                 alert type
+#     "severity": "HIGH",
+#     "description": "{count} failed SSH attempts detected from {ip} ...",
+#     "match": {"event_type": "ssh_failed_password", "user": ["root", "admin"]},
+#     "require": ["src_ip"],                 fields that must be present
+#     "pattern": "(?i)UNION\\s+SELECT",      optional regex on message
+#     "anchors": ["union"],                  literals gating the regex
+#     "group_by": "src_ip",                  optional threshold window:
+#     "window": 60,                          seconds
+#     "threshold": 5,                        alert when count >= threshold
+#     "distinct": "port",                    count distinct values instead of events
+#     "ip_field": "src_ip"                   field copied to alert.ip (default src_ip)
+#   }
+#
+# Compilation shares identical regexes between rules, shares window state
+# between rules with the same (match, group_by, window, distinct) so e.g. a
+# HIGH and a CRITICAL threshold on the same stream update one window, and
+# orders checks cheapest first (event_type via the dispatcher index, required
+# fields, equality matches, then the regex).
+
+import json
+import logging
+import os
+import re
+import string
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .dispatch import RuleDispatcher
+from .windows import CountWindow, DistinctWindow
+
+try:
+    import yaml  # optional
+except ImportError:  # pragma: no cover
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+EmitFn = Callable[..., Awaitable[None]]
+
+_REQUIRED_KEYS = ("name", "type", "severity", "description")
+
+
+class RuleError(ValueError):
+    pass
+
+
+class _WindowGroup:
+    """Window state shared by every rule with the same stream signature."""
+
+    def __init__(self, group_by: str, window: float, distinct: Optional[str], max_keys: int):
+        self.group_by = group_by
+        self.distinct = distinct
+        self.store = (
+            DistinctWindow(window, max_keys=max_keys) if distinct
+            else CountWindow(window, max_keys=max_keys)
+        )
+
+    def add(self, log: Dict[str, Any], ts: datetime) -> Optional[int]:
+        key = log.get(self.group_by)
+        if key is None:
+            return None
+        if self.distinct:
+            value = log.get(self.distinct)
+            if value is None:
+                return None
+            return self.store.add(key, value, ts)
+        return self.store.add(key, ts)
+
+
+class CompiledRule:
+    def __init__(self, spec: Dict[str, Any], regex: Optional[re.Pattern], group: Optional[_WindowGroup]):
+        self.spec = spec
+        self.name: str = spec["name"]
+        self.type_: str = spec["type"]
+        self.severity: str = spec["severity"]
+        self.description: str = spec["description"]
+        self.ip_field: str = spec.get("ip_field", "src_ip")
+        self.threshold: int = int(spec.get("threshold", 1))
+        self.window = spec.get("window")
+        self.regex = regex
+        self.group = group
+
+        match = dict(spec.get("match") or {})
+        self.event_types = _as_list(match.pop("event_type", None))
+        self.require: Tuple[str, ...] = tuple(spec.get("require") or ())
+        if group is not None:
+            self.require += tuple(f for f in (group.group_by, group.distinct) if f and f not in self.require)
+        # equality checks: scalar -> ==, list -> membership
+        self.equals: List[Tuple[str, Any]] = [
+            (field, frozenset(v) if isinstance(v, list) else v) for field, v in match.items()
+        ]
+        self.anchors: List[str] = list(spec.get("anchors") or ())
+
+    def matches(self, log: Dict[str, Any]) -> bool:
+        for field, want in self.equals:
+            value = log.get(field)
+            if isinstance(want, frozenset):
+                if value not in want:
+                    return False
+            elif value != want:
+                return False
+        if self.regex is not None and not self.regex.search(log.get("message", "") or ""):
+            return False
+        return True
+
+
+def _as_list(v: Any) -> List[Any]:
+    if v is None:
+        return []
+    return list(v) if isinstance(v, (list, tuple)) else [v]
+
+
+def _is_number(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _check_template(template: Any, where: str) -> None:
+    """Descriptions are str.format templates with named fields only."""
+    if not isinstance(template, str):
+        raise RuleError(f"{where}: description must be a string")
+    try:
+        fields = [f for _, f, _, _ in string.Formatter().parse(template) if f is not None]
+    except ValueError as exc:
+        raise RuleError(f"{where}: bad description: {exc}")
+    for f in fields:
+        if not f or f[0].isdigit():
+            raise RuleError(f"{where}: bad description: positional field {{{f}}}, use a name")
+
+
+def render(template: str, values: Dict[str, Any]) -> str:
+    """Fill a description; a field that won't format leaves the template as-is."""
+    try:
+        return template.format_map(_Missing(values))
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return template
+
+
+def _validate(spec: Any, origin: str) -> Dict[str, Any]:
+    if not isinstance(spec, dict):
+        raise RuleError(f"{origin}: rule must be an object")
+    missing = [k for k in _REQUIRED_KEYS if not spec.get(k)]
+    if missing:
+        raise RuleError(f"{origin}: rule missing {', '.join(missing)}")
+    windowed = [k for k in ("group_by", "window") if k in spec]
+    if windowed and len(windowed) != 2:
+        raise RuleError(f"{origin}: {spec['name']}: group_by and window go together")
+    if "distinct" in spec and "group_by" not in spec:
+        raise RuleError(f"{origin}: {spec['name']}: distinct needs group_by/window")
+    if "window" in spec and not (_is_number(spec["window"]) and spec["window"] > 0):
+        raise RuleError(f"{origin}: {spec['name']}: window must be a positive number of seconds")
+    if "threshold" in spec and not (_is_number(spec["threshold"]) and spec["threshold"] >= 1
+                                    and float(spec["threshold"]).is_integer()):
+        raise RuleError(f"{origin}: {spec['name']}: threshold must be a whole number >= 1")
+    _check_template(spec["description"], f"{origin}: {spec['name']}")
+    if "pattern" in spec:
+        try:
+            re.compile(spec["pattern"])
+        except re.error as exc:
+            raise RuleError(f"{origin}: {spec['name']}: bad pattern: {exc}")
+    return spec
+
+
+def load_rule_specs(rules_dir: str) -> List[Dict[str, Any]]:
+    """Read and validate every rule file in rules_dir (sorted by file name)."""
+    specs: List[Dict[str, Any]] = []
+    for fname in sorted(os.listdir(rules_dir)):
+        path = os.path.join(rules_dir, fname)
+        try:
+            if fname.endswith(".json"):
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            elif fname.endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise RuleError(f"{fname}: PyYAML is not installed")
+                with open(path, "r", encoding="utf-8") as f:
+                    data = yaml.safe_load(f)
+            else:
+                continue
+        except RuleError:
+            raise
+        except Exception as exc:
+            raise RuleError(f"{fname}: {exc}")
+        if isinstance(data, dict) and "rules" in data:
+            data = data["rules"]
+        for spec in data if isinstance(data, list) else [data]:
+            specs.append(_validate(spec, fname))
+
+    names = [s["name"] for s in specs]
+    dupes = sorted({n for n in names if names.count(n) > 1})
+    if dupes:
+        raise RuleError(f"duplicate rule names: {', '.join(dupes)}")
+    return specs
+
+
+def rules_signature(rules_dir: str) -> Tuple:
+    """(name, mtime, size) of every rule file; changes when a file does."""
+    try:
+        entries = sorted(
+            (e.name, e.stat().st_mtime_ns, e.stat().st_size)
+            for e in os.scandir(rules_dir)
+            if e.name.endswith((".json", ".yaml", ".yml"))
+        )
+    except OSError:
+        return ()
+    return tuple(entries)
+
+
+class RuleEngine:
+    def __init__(
+        self,
+        rules_dir: str,
+        emit: EmitFn,
+        *,
+        max_keys: int = 100000,
+        reload_seconds: float = 2.0,
+        timed: bool = False,
+    ):
+        self.rules_dir = rules_dir
+        self.emit = emit
+        self.max_keys = max_keys
+        self.reload_seconds = reload_seconds
+        self.rules: List[CompiledRule] = []
+        self.timed = timed
+        self.dispatcher = RuleDispatcher(timed)
+        self.last_error: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+        self._groups: Dict[Tuple, _WindowGroup] = {}
+        self._signature: Optional[Tuple] = None
+        self._next_check = 0.0
+
+    # ---------- loading / hot reload ----------
+
+    def load(self) -> bool:
+        """
+        (Re)compile all rules. On error the previous plan stays active.
+        Returns True if the new rules were installed.
+        """
+        self._signature = rules_signature(self.rules_dir)
+        try:
+            self._compile(load_rule_specs(self.rules_dir))
+        except (OSError, ValueError, re.error) as exc:
+            self.last_error = str(exc)
+            logger.error("rule load failed, keeping previous rules: %s", exc)
+            return False
+        self.last_error = None
+        self.loaded_at = datetime.utcnow()
+        logger.info("loaded %d detection rules from %s", len(self.rules), self.rules_dir)
+        return True
+
+    def maybe_reload(self) -> None:
+        """Cheap mtime check, at most once every reload_seconds."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_seconds
+        if rules_signature(self.rules_dir) != self._signature:
+            self.load()
+
+    def _compile(self, specs: List[Dict[str, Any]]) -> None:
+        regex_cache: Dict[str, re.Pattern] = {}
+        groups: Dict[Tuple, _WindowGroup] = {}
+        compiled: List[CompiledRule] = []
+
+        for spec in specs:
+            regex = None
+            if spec.get("pattern"):
+                regex = regex_cache.get(spec["pattern"])
+                if regex is None:
+                    regex = regex_cache[spec["pattern"]] = re.compile(spec["pattern"])
+
+            group = None
+            if spec.get("group_by"):
+                sig = (
+                    json.dumps(spec.get("match") or {}, sort_keys=True),
+                    tuple(sorted(spec.get("require") or ())),
+                    spec.get("pattern"),
+                    spec["group_by"],
+                    float(spec["window"]),
+                    spec.get("distinct"),
+                )
+                # reuse live window state across reloads when the stream is unchanged
+                group = groups.get(sig) or self._groups.get(sig)
+                if group is None:
+                    group = _WindowGroup(spec["group_by"], float(spec["window"]), spec.get("distinct"), self.max_keys)
+                groups[sig] = group
+
+            compiled.append(CompiledRule(spec, regex, group))
+
+        dispatcher = RuleDispatcher(self.timed)
+        for rule in compiled:
+            dispatcher.register(
+                rule.name,
+                self._make_fn(rule),
+                event_types=rule.event_types,
+                anchors=rule.anchors,
+                fields=rule.require,
+            )
+
+        self.rules = compiled
+        self._groups = groups
+        self.dispatcher = dispatcher
+
+    # ---------- evaluation ----------
+
+    def _make_fn(self, rule: CompiledRule):
+        async def _evaluate(log: Dict[str, Any], ts: datetime, counts: Dict[int, Optional[int]]) -> None:
+            if not rule.matches(log):
+                return
+            count: Optional[int] = None
+            if rule.group is not None:
+                gid = id(rule.group)
+                if gid not in counts:
+                    # one window update per event, however many rules share it
+                    counts[gid] = rule.group.add(log, ts)
+                count = counts[gid]
+                if count is None or count < rule.threshold:
+                    return
+            ip = log.get(rule.ip_field)
+            values = dict(log)
+            values.update(count=count, ip=ip, window=rule.window, threshold=rule.threshold)
+            await self.emit(
+                source=log.get("source", "unknown"),
+                timestamp=ts,
+                severity=rule.severity,
+                type_=rule.type_,
+                description=render(rule.description, values),
+                ip=ip,
+            )
+        return _evaluate
+
+    async def evaluate(self, log: Dict[str, Any], ts: datetime) -> None:
+        self.maybe_reload()
+        await self.dispatcher.dispatch(log, ts, {})
+
+    # ---------- introspection ----------
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "rules_dir": self.rules_dir,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "last_error": self.last_error,
+            "window_groups": len(self._groups),
+            "rules": [r.spec for r in self.rules],
+        }
+
+    def window_stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for rule in self.rules:
+            if rule.group is not None:
+                out[rule.name] = rule.group.store.stats()
+        return out
+
+
+class _Missing(dict):
+    """format_map helper: unknown placeholders render as-is."""
+
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
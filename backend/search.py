@@ -0,0 +1,174 @@
+# backend/search.py
+# Full-text search over log messages. At ingest every log gets a `terms`
+# array (lower-cased tokens of its message) backed by a multikey
+# (terms, timestamp, _id) index, so /logs?contains= is an index lookup
+# instead of an unanchored $regex over every message.
+#
+# Query syntax for `contains`:
+#   failed root          all terms must occur (any order)
+#   "invalid user admin" phrase: terms in this exact order
+#   adm*                 prefix: any term starting with "adm"
+# Terms, phrases and prefixes can be mixed and combined with the other
+# /logs filters. Words of one character are not indexed: they may appear in
+# a query next to a longer word, but not on their own.
+#
+# Limits: terms are cut to MAX_TERM characters and at most MAX_TERMS
+# distinct terms are indexed per log (whole words first, in message order).
+# A stored log with more distinct terms than that is only found by the ones
+# that made the cut; archived logs are matched on their full message.
+
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+# a "word" keeps the separators that hold IPs, paths, user@host and
+# key=value tokens together; its alphanumeric parts are indexed as well,
+# so both "1.2.3.4" and "sshd" match "sshd[42]: from 1.2.3.4"
+WORD_RE = re.compile(r"[a-z0-9_]+(?:[.\-:/@=][a-z0-9_]+)*")
+PART_RE = re.compile(r"[a-z0-9_]+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+MIN_TERM = 2        # single characters are too common to be worth indexing
+MAX_TERM = 64       # longer runs (hashes, base64 blobs) are truncated
+MAX_TERMS = 1024    # per log; bounds index entries for pathological lines
+MIN_PREFIX = 2
+
+
+def _words(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
+
+
+def _all_terms(message: str) -> Dict[str, None]:
+    text = (message or "").lower()
+    # every alphanumeric run lies inside exactly one word, so the parts of
+    # all words are simply the runs of the whole message
+    return dict.fromkeys(
+        t[:MAX_TERM] for t in (*WORD_RE.findall(text), *PART_RE.findall(text)) if len(t) >= MIN_TERM
+    )
+
+
+def terms(message: str) -> List[str]:
+    """Distinct index terms of a message: whole words first, then their parts."""
+    return list(_all_terms(message))[:MAX_TERMS]
+
+
+def _query_term(word: str) -> str:
+    return word[:MAX_TERM]
+
+
+def _short_word(word: str) -> str:
+    # not indexed: falls back to an escaped (never user-supplied) regex
+    return rf"(?<![a-z0-9_]){re.escape(word)}(?![a-z0-9_])"
+
+
+def _parse(query: str) -> Tuple[List[str], List[str], List[str]]:
+    """
+    (required terms, term prefixes, case-insensitive message patterns) of a
+    `contains` query. Raises ValueError on an empty query, a query made
+    only of one-character words, or a prefix shorter than MIN_PREFIX.
+    """
+    required: Dict[str, None] = {}
+    prefixes: List[str] = []
+    patterns: List[str] = []
+
+    for phrase, token in QUERY_RE.findall(query or ""):
+        if phrase:
+            words = _words(phrase)
+            for w in words:
+                if len(w) >= MIN_TERM:
+                    required.setdefault(_query_term(w), None)
+            if len(words) > 1:
+                patterns.append(r"[^a-z0-9_]+".join(re.escape(w) for w in words))
+            elif words and len(words[0]) < MIN_TERM:
+                patterns.append(_short_word(words[0]))
+            continue
+
+        prefix = token.endswith("*")
+        words = _words(token.rstrip("*"))
+        if not words:
+            continue
+        if prefix:
+            # only the last word is a prefix ("root@10.*" -> root@10 prefix)
+            for w in words[:-1]:
+                required.setdefault(_query_term(w), None)
+            stem = words[-1]
+            if len(stem) < MIN_PREFIX:
+                raise ValueError(f"prefix must have at least {MIN_PREFIX} characters: {token!r}")
+            prefixes.append(stem[:MAX_TERM])
+            continue
+        for w in words:
+            if len(w) >= MIN_TERM:
+                required.setdefault(_query_term(w), None)
+            else:
+                patterns.append(_short_word(w))
+
+    if not (required or prefixes or patterns):
+        raise ValueError("empty search query")
+    if not (required or prefixes):
+        # nothing the index can narrow down: would regex-scan every log
+        raise ValueError(f"search needs a word of at least {MIN_TERM} characters")
+    return list(required), prefixes, patterns
+
+
+def search_conditions(query: str) -> List[Dict[str, Any]]:
+    """
+    Mongo conditions for a `contains` query. Exact terms become one $all on
+    the index; prefixes become anchored regexes on `terms` (index range
+    scans); phrases additionally check word order with an escaped,
+    case-insensitive regex on the message, evaluated only on the rows the
+    index already narrowed down. Raises ValueError like _parse.
+    """
+    required, prefixes, patterns = _parse(query)
+    conditions: List[Dict[str, Any]] = []
+    if required:
+        conditions.append({"terms": {"$all": required}})
+    conditions.extend({"terms": {"$regex": "^" + re.escape(p)}} for p in prefixes)
+    conditions.extend({"message": {"$regex": p, "$options": "i"}} for p in patterns)
+    return conditions
+
+
+def matcher(query: str) -> Callable[[str], bool]:
+    """
+    The same query as a predicate over a raw message, for rows that live
+    outside Mongo (archived segments, backend/tiering.py). Checks all terms
+    of the message, not just the first MAX_TERMS.
+    """
+    required, prefixes, patterns = _parse(query)
+    need = set(required)
+    compiled = [re.compile(p, re.IGNORECASE) for p in patterns]
+
+    def match(message: str) -> bool:
+        have = _all_terms(message).keys()
+        if not have >= need:
+            return False
+        if any(not any(t.startswith(p) for t in have) for p in prefixes):
+            return False
+        return all(c.search(message or "") for c in compiled)
+
+    return match
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """
+    Add `terms` to stored logs that predate search indexing.
+    Returns the number of documents updated.
+    """
+    from pymongo import UpdateOne
+    from .database import sync_db
+
+    logs_coll = sync_db["logs"]
+    updated = 0
+    ops = []
+    cursor = logs_coll.find({"terms": {"$exists": False}}, {"message": 1})
+    for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"terms": terms(doc.get("message", "") or "")}}))
+        if len(ops) >= batch_size:
+            updated += logs_coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += logs_coll.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    # python -m backend.search  -> index terms on existing logs
+    print(f"backfilled {backfill()} logs")
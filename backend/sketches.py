@@ -0,0 +1,377 @@
+# backend/sketches.py
+# Streaming sketches over source IPs, fed by the ingest path (every stored
+# log's src_ip) and the alert path (every rule hit, including ones the
+# aggregator suppresses):
+#   - Space-Saving: top-K heavy hitters with a per-item overestimate bound
+#   - HyperLogLog: distinct count, ~1.6% standard error at precision 12
+# Both live in rotating wall-clock buckets (60 x 1 minute, 24 x 1 hour).
+# Merges of the completed buckets in a window are cached until the next
+# rotation, so a query only merges that cache with the live bucket.
+# Dirty buckets are persisted to the `sketches` collection every
+# SKETCH_PERSIST_SECONDS and reloaded at startup.
+#
+# Sketches are per process; with several workers each one persists and
+# answers for its own share of the traffic (keyed by SKETCH_OWNER, host:pid
+# unless configured).
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import Binary
+from pymongo import UpdateOne
+
+from .config import settings
+from .database import sketches_coll
+
+logger = logging.getLogger(__name__)
+
+STREAMS = ("logs", "alerts")
+# granularity seconds -> buckets kept
+GRAINS = {60: 60, 3600: 24}
+WINDOW_RE = re.compile(r"^(\d+)([mh])$")
+
+_RHO_INV = [2.0 ** -r for r in range(65)]
+
+
+def _hash(item: str) -> int:
+    return int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p: int = 12, registers: Optional[bytes] = None):
+        self.p = p
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << p)
+
+    def add_hash(self, h: int) -> None:
+        rest_bits = 64 - self.p
+        idx = h >> rest_bits
+        rho = rest_bits - (h & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rho > self.registers[idx]:
+            self.registers[idx] = rho
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def copy(self) -> "HyperLogLog":
+        return HyperLogLog(self.p, self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(_RHO_INV[r] for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class SpaceSaving:
+    """
+    k counters. An untracked item replaces the minimum counter and inherits
+    its count as `error`; every true count lies in [count - error, count].
+
+    The minimum is found through a lazy min-heap with one entry per tracked
+    item. Increments leave the entry stale (counts only grow, so a stale
+    entry only underestimates); eviction re-pushes stale entries until the
+    top one is current. Tracked hits stay O(1), evictions are amortised
+    O(log k).
+    """
+
+    __slots__ = ("k", "counts", "errors", "_heap")
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # built on the first eviction; None after counts were replaced wholesale
+        self._heap: Optional[List[Tuple[int, str]]] = None
+
+    def add(self, item: str, n: int = 1) -> None:
+        counts = self.counts
+        if item in counts:
+            counts[item] += n
+        elif len(counts) < self.k:
+            counts[item] = n
+            self.errors[item] = 0
+            if self._heap is not None:
+                heapq.heappush(self._heap, (n, item))
+        else:
+            floor = self._evict()
+            counts[item] = floor + n
+            self.errors[item] = floor
+            heapq.heappush(self._heap, (floor + n, item))
+
+    def _evict(self) -> int:
+        heap = self._heap
+        if heap is None:
+            heap = self._heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(heap)
+        while True:
+            c, victim = heapq.heappop(heap)
+            current = self.counts[victim]
+            if current == c:
+                del self.counts[victim]
+                del self.errors[victim]
+                return c
+            heapq.heappush(heap, (current, victim))
+
+    def _floor(self) -> int:
+        # the most an untracked item can have been seen: 0 until k items are tracked
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """
+        Mergeable-summaries combine: an item tracked on one side only gets
+        the other side's minimum counter added to both count and error.
+        """
+        floor, other_floor = self._floor(), other._floor()
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for item in itertools.chain(self.counts, (i for i in other.counts if i not in self.counts)):
+            c, oc = self.counts.get(item), other.counts.get(item)
+            counts[item] = (floor if c is None else c) + (other_floor if oc is None else oc)
+            errors[item] = (
+                (floor if c is None else self.errors[item])
+                + (other_floor if oc is None else other.errors[item])
+            )
+        if len(counts) > self.k:
+            keep = heapq.nlargest(self.k, counts, key=counts.get)
+            counts = {i: counts[i] for i in keep}
+            errors = {i: errors[i] for i in keep}
+        self.counts, self.errors, self._heap = counts, errors, None
+
+    def copy(self) -> "SpaceSaving":
+        out = SpaceSaving(self.k)
+        out.counts = dict(self.counts)
+        out.errors = dict(self.errors)
+        return out
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        items = heapq.nlargest(n, self.counts, key=self.counts.get)
+        return [(i, self.counts[i], self.errors[i]) for i in items]
+
+
+class _Bucket:
+    __slots__ = ("start", "hll", "top", "dirty")
+
+    def __init__(self, start: int, hll: HyperLogLog, top: SpaceSaving):
+        self.start = start
+        self.hll = hll
+        self.top = top
+        self.dirty = True
+
+
+class WindowedSketch:
+    """HLL + Space-Saving per `granularity`-second bucket, last `keep` buckets."""
+
+    def __init__(self, granularity: int, keep: int, *, k: int, p: int):
+        self.granularity = granularity
+        self.keep = keep
+        self.k = k
+        self.p = p
+        self.buckets: "OrderedDict[int, _Bucket]" = OrderedDict()
+        # n buckets -> merge of the n - 1 completed buckets before the live one
+        self._sealed: Dict[int, Tuple[int, HyperLogLog, SpaceSaving]] = {}
+
+    def _start(self, now: float) -> int:
+        return int(now // self.granularity) * self.granularity
+
+    def bucket(self, now: float) -> _Bucket:
+        start = self._start(now)
+        b = self.buckets.get(start)
+        if b is None:
+            b = self.buckets[start] = _Bucket(start, HyperLogLog(self.p), SpaceSaving(self.k))
+            oldest = start - (self.keep - 1) * self.granularity
+            while self.buckets and next(iter(self.buckets)) < oldest:
+                self.buckets.popitem(last=False)
+        return b
+
+    def restore(self, start: int, hll: HyperLogLog, top: SpaceSaving) -> None:
+        b = _Bucket(start, hll, top)
+        b.dirty = False
+        self.buckets[start] = b
+        self.buckets = OrderedDict(sorted(self.buckets.items()))
+        self._sealed.clear()
+
+    def window(self, n: int, now: float) -> Tuple[HyperLogLog, SpaceSaving]:
+        live = self.bucket(now)
+        cached = self._sealed.get(n)
+        if cached is None or cached[0] != live.start:
+            hll, top = HyperLogLog(self.p), SpaceSaving(self.k)
+            oldest = live.start - (n - 1) * self.granularity
+            for start, b in self.buckets.items():
+                if oldest <= start < live.start:
+                    hll.merge(b.hll)
+                    top.merge(b.top)
+            cached = self._sealed[n] = (live.start, hll, top)
+        hll, top = cached[1].copy(), cached[2].copy()
+        hll.merge(live.hll)
+        top.merge(live.top)
+        return hll, top
+
+
+def parse_window(window: str) -> Tuple[int, int]:
+    """'15m' / '1h' / '24h' -> (granularity, buckets). Raises ValueError."""
+    m = WINDOW_RE.match(window or "")
+    if not m:
+        raise ValueError("window must look like 15m or 6h")
+    seconds = int(m[1]) * (60 if m[2] == "m" else 3600)
+    for granularity, keep in sorted(GRAINS.items()):
+        n = seconds // granularity
+        if seconds % granularity == 0 and 1 <= n <= keep:
+            return granularity, n
+    raise ValueError("window must be 1-60m or 1-24h")
+
+
+class SketchSet:
+    def __init__(self, *, k: int = 100, p: int = 12, owner: str = "local"):
+        self.owner = owner
+        self.sketches: Dict[Tuple[str, int], WindowedSketch] = {
+            (stream, g): WindowedSketch(g, keep, k=k, p=p)
+            for stream in STREAMS for g, keep in GRAINS.items()
+        }
+        self._task: Optional[asyncio.Task] = None
+        self.added = 0
+        self.persisted = 0
+
+    def add(self, stream: str, ip: Optional[str], now: Optional[float] = None) -> None:
+        self.add_many(stream, (ip,), now)
+
+    def add_many(self, stream: str, ips: Iterable[Optional[str]], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        buckets = [self.sketches[(stream, g)].bucket(now) for g in GRAINS]
+        for ip in ips:
+            if not ip:
+                continue
+            h = _hash(ip)
+            for b in buckets:
+                b.hll.add_hash(h)
+                b.top.add(ip)
+            self.added += 1
+        for b in buckets:
+            b.dirty = True
+
+    def top(self, stream: str, window: str, k: int = 10) -> Dict[str, Any]:
+        granularity, n = parse_window(window)
+        _, top = self.sketches[(stream, granularity)].window(n, time.time())
+        return {
+            "stream": stream,
+            "window": window,
+            "items": [{"ip": ip, "count": c, "error": e} for ip, c, e in top.top(k)],
+        }
+
+    def distinct(self, stream: str, window: str) -> Dict[str, Any]:
+        granularity, n = parse_window(window)
+        hll, _ = self.sketches[(stream, granularity)].window(n, time.time())
+        return {
+            "stream": stream,
+            "window": window,
+            "distinct": hll.count(),
+            "relative_error": round(hll.relative_error, 4),
+        }
+
+    # ---------- persistence ----------
+
+    def _doc_id(self, stream: str, granularity: int, start: int) -> str:
+        return f"{self.owner}|{stream}|{granularity}|{start}"
+
+    async def persist(self) -> None:
+        ops = []
+        written = []
+        for (stream, g), sk in self.sketches.items():
+            for b in sk.buckets.values():
+                if not b.dirty:
+                    continue
+                # cleared before the write so adds made meanwhile re-dirty it
+                b.dirty = False
+                written.append(b)
+                started = datetime.utcfromtimestamp(b.start)
+                ops.append(UpdateOne({"_id": self._doc_id(stream, g, b.start)}, {"$set": {
+                    "owner": self.owner,
+                    "stream": stream,
+                    "granularity": g,
+                    "start": started,
+                    "hll": Binary(bytes(b.hll.registers)),
+                    "top": [[i, c, b.top.errors[i]] for i, c in b.top.counts.items()],
+                    "expire_at": started + timedelta(seconds=g * (sk.keep + 1)),
+                }}, upsert=True))
+        if not ops:
+            return
+        try:
+            await sketches_coll.bulk_write(ops, ordered=False)
+        except Exception:
+            # keep them for the next round instead of dropping sealed buckets
+            for b in written:
+                b.dirty = True
+            raise
+        self.persisted += len(ops)
+
+    async def load(self) -> int:
+        now = time.time()
+        docs = await sketches_coll.find({"owner": self.owner}).to_list(length=None)
+        loaded = 0
+        for d in docs:
+            sk = self.sketches.get((d["stream"], d["granularity"]))
+            start = int((d["start"] - datetime(1970, 1, 1)).total_seconds())
+            if sk is None or start < sk._start(now) - (sk.keep - 1) * sk.granularity:
+                continue
+            top = SpaceSaving(sk.k)
+            for item, c, e in d["top"]:
+                top.counts[item] = c
+                top.errors[item] = e
+            sk.restore(start, HyperLogLog(sk.p, d["hll"]), top)
+            loaded += 1
+        return loaded
+
+    async def _run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.persist()
+            except Exception:
+                logger.exception("sketch persist failed")
+
+    async def start(self) -> None:
+        try:
+            await self.load()
+        except Exception:
+            logger.exception("could not load persisted sketches")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(settings.SKETCH_PERSIST_SECONDS))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.persist()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "added": self.added,
+            "persisted": self.persisted,
+            "buckets": {f"{s}/{g}s": len(sk.buckets) for (s, g), sk in self.sketches.items()},
+        }
+
+
+sketches = SketchSet(k=settings.SKETCH_TOP_K, p=settings.SKETCH_HLL_PRECISION, owner=settings.SKETCH_OWNER)
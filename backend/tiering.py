@@ -0,0 +1,487 @@
+# backend/tiering.py
+# Hot/cold tiering for logs. Logs older than ARCHIVE_AFTER_DAYS move out of
+# Mongo into compressed, time-partitioned NDJSON segment files under
+# ARCHIVE_DIR (zstd when the optional `zstandard` package is installed,
+# gzip otherwise). Every segment has a sidecar .meta.json with its row
+# count, min/max timestamp, sources and (when few enough) source IPs, so
+# readers prune segments without opening them. /logs and replay read both
+# tiers transparently (see ColdQuery / iter_cold).
+#
+# A move is crash-safe: the segment and its meta ("written") are renamed
+# into place first, then the meta is flipped to "committed" (still marked
+# `hot`), the rows are deleted from Mongo and the mark is cleared. Readers
+# ignore "written" segments (their rows are still hot) and drop the rows
+# they see in both tiers while a segment is `hot`, so no row is ever out of
+# sight; the next run finishes an interrupted move. The archive lease is
+# renewed for every segment. Only logs the detection stage has already
+# processed are archived.
+#
+#   python -m backend.tiering --days 30     one archive run
+#   python -m backend.tiering --list        segment catalog
+
+import argparse
+import gzip
+import io
+import json
+import logging
+import mmap
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+
+from .config import settings
+from .search import matcher
+
+try:  # optional: better ratio and much faster decompression than gzip
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+WRITTEN = "written"
+COMMITTED = "committed"
+LEASE_ID = "archive"
+LEASE_SECONDS = 600.0
+MAX_META_IPS = 5000    # beyond this a segment doesn't list its IPs (no IP pruning)
+
+Position = Tuple[datetime, ObjectId]
+
+
+def _codec() -> str:
+    codec = settings.ARCHIVE_CODEC
+    if codec == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if codec == "zstd" and zstandard is None:
+        raise RuntimeError("ARCHIVE_CODEC=zstd needs the zstandard package")
+    return codec
+
+
+def _root() -> str:
+    return os.path.join(settings.ARCHIVE_DIR, "logs")
+
+
+def _key(row: Dict[str, Any]) -> Position:
+    return row["timestamp"], row["_id"]
+
+
+# ---------- segments ----------
+
+class Segment:
+    __slots__ = ("path", "meta_path", "codec", "rows", "min_ts", "max_ts", "sources", "src_ips", "state", "hot")
+
+    def __init__(self, meta_path: str, meta: Dict[str, Any]):
+        self.meta_path = meta_path
+        self.path = os.path.join(os.path.dirname(meta_path), meta["file"])
+        self.codec = meta["codec"]
+        self.rows = meta["rows"]
+        self.min_ts = datetime.fromisoformat(meta["min_ts"])
+        self.max_ts = datetime.fromisoformat(meta["max_ts"])
+        self.sources = set(meta["sources"])
+        self.src_ips = set(meta["src_ips"]) if meta.get("src_ips") is not None else None
+        self.state = meta["state"]
+        # committed, but its rows may still be in Mongo too
+        self.hot = bool(meta.get("hot"))
+
+    def read(self) -> Iterator[Dict[str, Any]]:
+        """
+        Rows in (timestamp, _id) order, decompressed from a read-only mmap.
+        A segment removed by retention since the catalog was loaded yields
+        nothing.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if self.codec == "zstd":
+                if zstandard is None:
+                    raise RuntimeError(f"{self.path}: zstd segment but zstandard is not installed")
+                stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(mm))
+            else:
+                stream = gzip.GzipFile(fileobj=mm, mode="rb")
+            with stream:
+                for line in stream:
+                    row = json.loads(line)
+                    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                    row["_id"] = ObjectId(row["_id"])
+                    yield row
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _encode_row(doc: Dict[str, Any]) -> bytes:
+    row = {k: v for k, v in doc.items() if k != "terms"}
+    row["_id"] = str(row["_id"])
+    row["timestamp"] = row["timestamp"].isoformat()
+    return json.dumps(row, separators=(",", ":"), default=str).encode() + b"\n"
+
+
+def write_segment(docs: List[Dict[str, Any]]) -> Segment:
+    """
+    Write docs (sorted by timestamp, _id; one UTC day) as a segment in the
+    "written" state. The name derives from the first row, so re-archiving
+    the same rows after a crash overwrites rather than duplicates.
+    """
+    first = docs[0]
+    day_dir = os.path.join(_root(), first["timestamp"].strftime("%Y-%m-%d"))
+    os.makedirs(day_dir, exist_ok=True)
+    codec = _codec()
+    name = f"{first['timestamp']:%Y%m%dT%H%M%S}_{first['_id']}.ndjson." + ("zst" if codec == "zstd" else "gz")
+
+    raw = b"".join(_encode_row(d) for d in docs)
+    if codec == "zstd":
+        data = zstandard.ZstdCompressor(level=settings.ARCHIVE_COMPRESSION_LEVEL).compress(raw)
+    else:
+        data = gzip.compress(raw, compresslevel=min(9, settings.ARCHIVE_COMPRESSION_LEVEL))
+    _write_atomic(os.path.join(day_dir, name), data)
+
+    ips = {d["src_ip"] for d in docs if d.get("src_ip")}
+    meta = {
+        "file": name,
+        "codec": codec,
+        "rows": len(docs),
+        "bytes": len(data),
+        "min_ts": docs[0]["timestamp"].isoformat(),
+        "max_ts": docs[-1]["timestamp"].isoformat(),
+        "sources": sorted({str(d.get("source") or "") for d in docs}),
+        "src_ips": sorted(ips) if len(ips) <= MAX_META_IPS else None,
+        "state": WRITTEN,
+        "created": datetime.utcnow().isoformat(),
+    }
+    meta_path = os.path.join(day_dir, name + ".meta.json")
+    _write_atomic(meta_path, json.dumps(meta, indent=1).encode())
+    return Segment(meta_path, meta)
+
+
+def _set_state(seg: Segment, state: str, *, hot: bool = False) -> None:
+    with open(seg.meta_path) as f:
+        meta = json.load(f)
+    meta["state"] = state
+    if hot:
+        meta["hot"] = True
+    else:
+        meta.pop("hot", None)
+    _write_atomic(seg.meta_path, json.dumps(meta, indent=1).encode())
+    seg.state = state
+    seg.hot = hot
+
+
+def _touch_generation() -> None:
+    os.makedirs(_root(), exist_ok=True)
+    with open(os.path.join(_root(), ".generation"), "a"):
+        pass
+    os.utime(os.path.join(_root(), ".generation"))
+
+
+class Catalog:
+    """
+    In-memory list of segment metas. Reloaded when an archive run (in any
+    process) touches ARCHIVE_DIR/logs/.generation.
+    """
+
+    def __init__(self):
+        self._segments: List[Segment] = []
+        self._loaded_at: Optional[int] = None
+
+    def _generation(self) -> Optional[int]:
+        try:
+            return os.stat(os.path.join(_root(), ".generation")).st_mtime_ns
+        except OSError:
+            return None
+
+    def segments(self, *, include_written: bool = False) -> List[Segment]:
+        gen = self._generation()
+        if gen is None:
+            return []
+        if gen != self._loaded_at:
+            self._segments = self._load()
+            self._loaded_at = gen
+        if include_written:
+            return list(self._segments)
+        return [s for s in self._segments if s.state == COMMITTED]
+
+    def _load(self) -> List[Segment]:
+        out: List[Segment] = []
+        root = _root()
+        for day in sorted(os.listdir(root)):
+            day_dir = os.path.join(root, day)
+            if not os.path.isdir(day_dir):
+                continue
+            for name in sorted(os.listdir(day_dir)):
+                if not name.endswith(".meta.json"):
+                    continue
+                path = os.path.join(day_dir, name)
+                try:
+                    with open(path) as f:
+                        out.append(Segment(path, json.load(f)))
+                except (OSError, ValueError, KeyError) as exc:
+                    logger.error("archive: unreadable segment meta %s: %r", path, exc)
+        return out
+
+
+catalog = Catalog()
+
+
+# ---------- reading ----------
+
+class ColdQuery:
+    """
+    The /logs filters applied to archived rows. Segments are pruned on
+    their min/max timestamp, sources and IPs before any file is opened.
+    """
+
+    def __init__(self, *, ip: Optional[str] = None, source: Optional[str] = None, contains: Optional[str] = None):
+        self.ip = ip
+        self.source = source
+        self.match_message: Optional[Callable[[str], bool]] = matcher(contains) if contains else None
+
+    def _may_match(self, seg: Segment) -> bool:
+        if self.source and self.source not in seg.sources:
+            return False
+        if self.ip and seg.src_ips is not None and self.ip not in seg.src_ips:
+            return False
+        return True
+
+    def _match(self, row: Dict[str, Any]) -> bool:
+        if self.ip and row.get("src_ip") != self.ip:
+            return False
+        if self.source and row.get("source") != self.source:
+            return False
+        return self.match_message is None or self.match_message(row.get("message", "") or "")
+
+    def scan(self, older: bool, pos: Optional[Position], n: int, bound: Optional[Position]) -> List[Dict[str, Any]]:
+        """
+        Up to n matching rows, newest first. older=True: the n newest rows
+        below pos (or overall); older=False: the n oldest rows above pos.
+        `bound` is the hot tier's n-th row: rows beyond it can't make the
+        page, so segments entirely past it are skipped.
+        """
+        segs = [s for s in catalog.segments() if self._may_match(s)]
+        if older:
+            segs = [s for s in segs if (pos is None or s.min_ts <= pos[0]) and (bound is None or s.max_ts >= bound[0])]
+            segs.sort(key=lambda s: s.max_ts, reverse=True)
+        else:
+            segs = [s for s in segs if s.max_ts >= pos[0] and (bound is None or s.min_ts <= bound[0])]
+            segs.sort(key=lambda s: s.min_ts)
+
+        best: List[Dict[str, Any]] = []
+        for seg in segs:
+            if len(best) >= n:
+                # segments are visited nearest-first; stop once none can compete
+                edge = best[-1]["timestamp"]
+                if (older and seg.max_ts < edge) or (not older and seg.min_ts > edge):
+                    break
+            for row in seg.read():
+                k = _key(row)
+                if pos is not None and ((older and not k < pos) or (not older and not k > pos)):
+                    continue
+                if self._match(row):
+                    best.append(row)
+            best.sort(key=_key, reverse=older)
+            del best[n:]
+        best.sort(key=_key, reverse=True)
+        return best
+
+
+def iter_cold(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None,
+    *,
+    query: Optional[ColdQuery] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Archived rows with start <= timestamp < end in timestamp order. Segments
+    that overlap in time are merged; one is only opened once the merge
+    reaches its min_ts, so few files are open at a time. With `query`, only
+    rows matching its /logs filters are returned.
+    """
+    import heapq
+
+    segs = [
+        s for s in catalog.segments()
+        if (start is None or s.max_ts >= start) and (end is None or s.min_ts < end)
+        and (not source or source in s.sources) and (query is None or query._may_match(s))
+    ]
+    segs.sort(key=lambda s: s.min_ts)
+    heap: List[Tuple[Position, int, Dict[str, Any], Iterator[Dict[str, Any]]]] = []
+    i = 0
+    while True:
+        while i < len(segs) and (not heap or segs[i].min_ts <= heap[0][0][0]):
+            it = segs[i].read()
+            row = next(it, None)
+            if row is not None:
+                heapq.heappush(heap, (_key(row), i, row, it))
+            i += 1
+        if not heap:
+            return
+        _, idx, row, it = heapq.heappop(heap)
+        nxt = next(it, None)
+        if nxt is not None:
+            heapq.heappush(heap, (_key(nxt), idx, nxt, it))
+        ts = row["timestamp"]
+        if (start is None or ts >= start) and (end is None or ts < end) and (not source or row.get("source") == source):
+            if query is None or query._match(row):
+                yield row
+
+
+# ---------- archiving ----------
+
+def _acquire(pipeline, owner: str) -> bool:
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.utcnow()
+    try:
+        pipeline.find_one_and_update(
+            {"_id": LEASE_ID, "$or": [{"owner": owner}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def _renew(pipeline, owner: str) -> None:
+    """Extend the archive lease; raises if another process took it over."""
+    now = datetime.utcnow()
+    res = pipeline.update_one(
+        {"_id": LEASE_ID, "owner": owner},
+        {"$set": {"lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+    )
+    if res.matched_count == 0:
+        raise RuntimeError(f"archive lease lost by {owner}")
+
+
+def _commit(logs, seg: Segment, ids: Optional[List[Any]] = None, batch_size: int = 1000) -> int:
+    """
+    Mark the segment committed (readers use it from now on), delete its
+    rows from Mongo, then clear the `hot` mark.
+    """
+    if ids is None:
+        ids = [row["_id"] for row in seg.read()]
+    if seg.state == WRITTEN:
+        _set_state(seg, COMMITTED, hot=True)
+        # readers pick the segment up now, not at the end of the run
+        _touch_generation()
+    deleted = 0
+    for i in range(0, len(ids), batch_size):
+        deleted += logs.delete_many({"_id": {"$in": ids[i:i + batch_size]}}).deleted_count
+    _set_state(seg, COMMITTED)
+    _touch_generation()
+    return deleted
+
+
+def archive_once(days: float, *, segment_rows: Optional[int] = None, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Move logs older than `days` into segments (blocking; sync client). Also
+    finishes moves interrupted by a crash and, with LOG_RETENTION_DAYS set,
+    deletes segments that fell out of retention.
+    """
+    from .database import sync_db
+
+    segment_rows = segment_rows or settings.ARCHIVE_SEGMENT_ROWS
+    logs, pipeline = sync_db["logs"], sync_db["pipeline"]
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if not _acquire(pipeline, owner):
+        return {"skipped": "another process holds the archive lease"}
+
+    report = {"segments": 0, "rows": 0, "resumed": 0, "expired": 0}
+    try:
+        for seg in catalog.segments(include_written=True):
+            if seg.state == WRITTEN or seg.hot:
+                _renew(pipeline, owner)
+                _commit(logs, seg, batch_size=batch_size)
+                report["resumed"] += 1
+
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        # never move logs the detection stage hasn't analysed yet
+        checkpoint = (pipeline.find_one({"_id": "detection"}) or {}).get("seq", 0)
+        query = {
+            "timestamp": {"$lt": cutoff},
+            "$or": [{"seq": {"$lte": checkpoint}}, {"seq": {"$exists": False}}],
+        }
+        cursor = logs.find(query, {"terms": 0}).sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+
+        buf: List[Dict[str, Any]] = []
+
+        def _flush() -> None:
+            if buf:
+                # a long run must not let a second process take the range over
+                _renew(pipeline, owner)
+                seg = write_segment(buf)
+                _commit(logs, seg, [d["_id"] for d in buf], batch_size)
+                report["segments"] += 1
+                report["rows"] += len(buf)
+                buf.clear()
+
+        for doc in cursor:
+            if not isinstance(doc.get("timestamp"), datetime):
+                continue
+            if buf and (doc["timestamp"].date() != buf[0]["timestamp"].date() or len(buf) >= segment_rows):
+                _flush()
+            buf.append(doc)
+        _flush()
+
+        if settings.LOG_RETENTION_DAYS > 0:
+            expiry = datetime.utcnow() - timedelta(days=settings.LOG_RETENTION_DAYS)
+            for seg in catalog.segments():
+                if seg.max_ts < expiry:
+                    # meta first: a catalog reload never lists a segment without data
+                    os.remove(seg.meta_path)
+                    try:
+                        os.remove(seg.path)
+                    except FileNotFoundError:
+                        pass
+                    report["expired"] += 1
+    finally:
+        _touch_generation()
+        pipeline.update_one({"_id": LEASE_ID, "owner": owner}, {"$set": {"lease_until": datetime.utcnow()}})
+    if report["segments"] or report["resumed"] or report["expired"]:
+        logger.info("archive: %s", report)
+    return report
+
+
+async def run_archiver(days: float, interval: float) -> None:
+    """Background loop for the app: one archive run every `interval` seconds."""
+    import asyncio
+
+    while True:
+        try:
+            await asyncio.to_thread(archive_once, days)
+        except Exception:
+            logger.exception("archive run failed")
+        await asyncio.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move aged logs from Mongo into archive segments")
+    parser.add_argument("--days", type=float, default=settings.ARCHIVE_AFTER_DAYS,
+                        help="archive logs older than this many days (default: ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--list", action="store_true", help="print the segment catalog and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for seg in catalog.segments(include_written=True):
+            print(f"{seg.min_ts.isoformat()}  {seg.max_ts.isoformat()}  {seg.rows:>8}  {seg.state:<9}  {seg.path}")
+        return
+    if args.days <= 0:
+        parser.error("--days must be > 0 (or set ARCHIVE_AFTER_DAYS)")
+    print(json.dumps(archive_once(args.days), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# backend/windows.py
+# In-memory sliding-window state for threshold rules. Each window keeps
+# per-key state (e.g. per source IP) with time-based eviction, and a global
+# key cap with LRU eviction of cold keys so memory stays bounded.
+
+from bisect import insort
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Hashable, Tuple
+
+
+def _secs(ts: Any) -> float:
+    return ts.timestamp() if isinstance(ts, datetime) else float(ts)
+
+
+class _Window:
+    def __init__(self, window_seconds: float, max_keys: int = 100000, max_events_per_key: int = 10000):
+        self.window = float(window_seconds)
+        self.max_keys = max_keys
+        self.max_events_per_key = max_events_per_key
+        self._keys: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.evicted_keys = 0
+
+    def _touch(self, key: Hashable):
+        state = self._keys.get(key)
+        if state is None:
+            state = self._new_state()
+            self._keys[key] = state
+            if len(self._keys) > self.max_keys:
+                # drop the least recently used key
+                self._keys.popitem(last=False)
+                self.evicted_keys += 1
+        else:
+            self._keys.move_to_end(key)
+        return state
+
+    def _new_state(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self) -> None:
+        self._keys.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "keys": len(self._keys),
+            "max_keys": self.max_keys,
+            "evicted_keys": self.evicted_keys,
+        }
+
+
+class CountWindow(_Window):
+    """
+    Number of events per key within the last `window` seconds.
+    """
+
+    def _new_state(self) -> Deque[float]:
+        return deque()
+
+    def add(self, key: Hashable, ts: Any) -> int:
+        """Record one event at ts; return the count in [ts - window, ts]."""
+        t = _secs(ts)
+        events: Deque[float] = self._touch(key)
+        if not events or t >= events[-1]:
+            events.append(t)
+        else:
+            # out-of-order event: rare, keep the deque sorted
+            insort(events, t)
+        if len(events) > self.max_events_per_key:
+            events.popleft()
+
+        cutoff = max(t, events[-1]) - self.window
+        while events and events[0] < cutoff:
+            events.popleft()
+        return len(events)
+
+
+class DistinctWindow(_Window):
+    """
+    Number of distinct values per key within the last `window` seconds
+    (e.g. distinct destination ports per source IP).
+    """
+
+    def _new_state(self) -> Tuple[Deque[Tuple[float, Hashable]], Dict[Hashable, int]]:
+        return deque(), {}
+
+    def add(self, key: Hashable, value: Hashable, ts: Any) -> int:
+        """Record value at ts; return the distinct count in the window."""
+        t = _secs(ts)
+        events, counts = self._touch(key)
+        if not events or t >= events[-1][0]:
+            events.append((t, value))
+        else:
+            insort(events, (t, value), key=lambda e: e[0])
+        counts[value] = counts.get(value, 0) + 1
+
+        if len(events) > self.max_events_per_key:
+            self._drop(events, counts)
+
+        cutoff = max(t, events[-1][0]) - self.window
+        while events and events[0][0] < cutoff:
+            self._drop(events, counts)
+        return len(counts)
+
+    @staticmethod
+    def _drop(events: Deque[Tuple[float, Hashable]], counts: Dict[Hashable, int]) -> None:
+        _, old = events.popleft()
+        n = counts[old] - 1
+        if n:
+            counts[old] = n
+        else:
+            del counts[old]
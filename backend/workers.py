@@ -0,0 +1,191 @@
+# backend/workers.py
+# Process-pool detection. Logs are sharded by source IP (crc32) onto worker
+# processes; each worker owns a RuleEngine and therefore the window state for
+# its shard, so brute-force / port-scan counts stay exact without shared
+# locks. Batches move over pipes, alerts come back to the parent, which
+# writes them through detector._create_alert as before.
+
+import asyncio
+import logging
+import multiprocessing as mp
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Only what the rules can look at crosses the pipe
+_SHIPPED_FIELDS = ("seq", "source", "message", "file", "src_ip", "port", "user", "auth_method", "event_type")
+
+
+def shard_for(log: Dict[str, Any], n: int) -> int:
+    key = log.get("src_ip") or log.get("source") or ""
+    return zlib.crc32(key.encode("utf-8", "ignore")) % n
+
+
+def _worker_main(conn, rules_dir: str, max_keys: int, reload_seconds: float) -> None:
+    """
+    Worker loop. Messages:
+      ("batch", [(log, ts), ...]) -> list of alert kwargs (+ log_seq)
+      ("stats",)                  -> {"rules": ..., "windows": ...}
+      ("stop",)                   -> exit
+    """
+    from .parsing import ensure_fields
+    from .rule_engine import RuleEngine
+
+    alerts: List[Dict[str, Any]] = []
+
+    async def _collect(**kwargs: Any) -> None:
+        alerts.append(kwargs)
+
+    engine = RuleEngine(rules_dir, _collect, max_keys=max_keys, reload_seconds=reload_seconds)
+    engine.load()
+    loop = asyncio.new_event_loop()
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        kind = msg[0]
+        if kind == "batch":
+            alerts = []
+            for log, ts in msg[1]:
+                ensure_fields(log)
+                n = len(alerts)
+                loop.run_until_complete(engine.evaluate(log, ts))
+                for alert in alerts[n:]:
+                    alert["log_seq"] = log.get("seq")
+            conn.send(alerts)
+        elif kind == "stats":
+            conn.send({"rules": engine.dispatcher.stats(), "windows": engine.window_stats()})
+        elif kind == "stop":
+            break
+    loop.close()
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx, index: int, args: Tuple, timeout: float):
+        self.index = index
+        self._ctx = ctx
+        self._args = args
+        self.timeout = timeout
+        self.lock = asyncio.Lock()
+        self._spawn()
+
+    def _spawn(self) -> None:
+        self.conn, child = self._ctx.Pipe()
+        self.proc = self._ctx.Process(
+            target=_worker_main, args=(child,) + self._args,
+            name=f"detector-{self.index}", daemon=True,
+        )
+        self.proc.start()
+        child.close()
+
+    def _call(self, msg: Tuple) -> Any:
+        self.conn.send(msg)
+        # a dead worker makes the pipe readable (EOF), a hung one doesn't
+        if not self.conn.poll(self.timeout):
+            raise TimeoutError(f"detection worker {self.index} gave no answer in {self.timeout}s")
+        return self.conn.recv()
+
+    def _recycle(self) -> None:
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(timeout=5)
+        self.conn.close()
+        self._spawn()
+
+    async def call(self, msg: Tuple) -> Any:
+        async with self.lock:
+            try:
+                return await asyncio.to_thread(self._call, msg)
+            except TimeoutError:
+                # hung: replace it and fail the call, the caller retries the batch
+                logger.error("detection worker %d timed out, restarting", self.index)
+                await asyncio.to_thread(self._recycle)
+                raise
+            except (EOFError, OSError, BrokenPipeError):
+                # worker died: its window state is lost, restart and retry once
+                logger.error("detection worker %d died, restarting", self.index)
+                await asyncio.to_thread(self._recycle)
+                return await asyncio.to_thread(self._call, msg)
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(("stop",))
+        except (OSError, BrokenPipeError):
+            pass
+        self.proc.join(timeout=5)
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.conn.close()
+
+
+class DetectionPool:
+    def __init__(
+        self,
+        n_workers: int,
+        rules_dir: str,
+        *,
+        max_keys: int = 100000,
+        reload_seconds: float = 2.0,
+        timeout: float = 30.0,
+    ):
+        self.n = n_workers
+        self._args = (rules_dir, max_keys, reload_seconds)
+        self.timeout = timeout
+        self._workers: List[_Worker] = []
+        self.batches = 0
+        self.logs = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        # spawn: workers must not inherit the event loop / Mongo client threads
+        ctx = mp.get_context("spawn")
+        self._workers = [_Worker(ctx, i, self._args, self.timeout) for i in range(self.n)]
+
+    def stop(self) -> None:
+        for w in self._workers:
+            w.stop()
+        self._workers = []
+
+    async def process(self, items: List[Tuple[Dict[str, Any], datetime]]) -> List[Dict[str, Any]]:
+        """
+        Evaluate (log, ts) pairs; returns alert kwargs. Arrival order is kept
+        within each shard, which is all the window rules need.
+        """
+        shards: Dict[int, List[Tuple[Dict[str, Any], datetime]]] = defaultdict(list)
+        for log, ts in items:
+            slim = {k: log[k] for k in _SHIPPED_FIELDS if k in log}
+            shards[shard_for(log, self.n)].append((slim, ts))
+
+        results = await asyncio.gather(
+            *(self._workers[i].call(("batch", batch)) for i, batch in shards.items())
+        )
+        self.batches += 1
+        self.logs += len(items)
+        return [alert for res in results for alert in res]
+
+    async def stats(self) -> Dict[str, Any]:
+        per_worker = await asyncio.gather(*(w.call(("stats",)) for w in self._workers))
+        rules: Dict[str, Dict[str, int]] = {}
+        for ws in per_worker:
+            for name, counters in ws["rules"].items():
+                agg = rules.setdefault(name, {"evaluated": 0, "skipped": 0})
+                agg["evaluated"] += counters["evaluated"]
+                agg["skipped"] += counters["skipped"]
+        return {
+            "workers": self.n,
+            "batches": self.batches,
+            "logs": self.logs,
+            "rules": rules,
+            "windows": {f"worker-{i}": ws["windows"] for i, ws in enumerate(per_worker)},
+        }
@@ -0,0 +1,142 @@
+# bench/generator.py
+# Seeded synthetic traffic: sshd and nginx lines mixed with attack episodes
+# (brute-force bursts, port scans, SQLi payloads, root logins) on top of
+# benign noise. The same seed always yields the same logs, so benchmark
+# numbers and alert counts are comparable between runs.
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+USERS = ["deploy", "ubuntu", "git", "www-data", "backup", "alice", "bob"]
+ATTACK_USERS = ["root", "admin", "oracle", "test", "postgres", "pi", "guest"]
+PATHS = ["/", "/index.html", "/login", "/api/items", "/static/app.js", "/favicon.ico", "/search?q=shoes"]
+AGENTS = ["Mozilla/5.0 (X11; Linux x86_64)", "curl/8.4.0", "Go-http-client/1.1", "python-requests/2.31"]
+SQLI = [
+    "/items?id=1 UNION SELECT username,password FROM users",
+    "/login?user=admin' OR '1'='1",
+    "/search?q=1 OR 1=1",
+    "/items?id=1; DROP TABLE users",
+    "/p?id=1/**/union/**/select/**/1",
+]
+
+# share of each episode kind; the rest is benign noise
+DEFAULT_MIX = {
+    "bruteforce": 0.008,
+    "portscan": 0.003,
+    "sqli": 0.01,
+    "root_login": 0.002,
+}
+
+
+class TrafficGenerator:
+    """
+    Yields log dicts shaped like POST /logs bodies: {source, timestamp, message}.
+    Timestamps advance by ~rate events per second from `start`.
+    """
+
+    def __init__(self, seed: int = 1, *, start: datetime = datetime(2024, 1, 1), rate: float = 50.0, mix=None):
+        self.rng = random.Random(seed)
+        self.ts = start
+        self.rate = rate
+        self.mix = dict(DEFAULT_MIX if mix is None else mix)
+        self.hosts = [f"web{i}" for i in range(1, 4)] + [f"bastion{i}" for i in range(1, 3)]
+
+    # ---------- helpers ----------
+
+    def _tick(self) -> datetime:
+        self.ts += timedelta(seconds=self.rng.expovariate(self.rate))
+        return self.ts
+
+    def _internal_ip(self) -> str:
+        return f"10.{self.rng.randint(0, 3)}.{self.rng.randint(0, 255)}.{self.rng.randint(1, 254)}"
+
+    def _external_ip(self) -> str:
+        return f"{self.rng.choice([45, 89, 103, 185, 203])}.{self.rng.randint(0, 255)}.{self.rng.randint(0, 255)}.{self.rng.randint(1, 254)}"
+
+    def _log(self, source: str, message: str) -> Dict[str, Any]:
+        return {"source": source, "timestamp": self._tick().isoformat(), "message": message}
+
+    def _sshd(self, msg: str) -> str:
+        return f"sshd[{self.rng.randint(1000, 65000)}]: {msg}"
+
+    def _nginx(self, ip: str, method: str, path: str, status: int) -> str:
+        stamp = self.ts.strftime("%d/%b/%Y:%H:%M:%S +0000")
+        return (
+            f'{ip} - - [{stamp}] "{method} {path} HTTP/1.1" {status} '
+            f'{self.rng.randint(200, 20000)} "-" "{self.rng.choice(AGENTS)}"'
+        )
+
+    # ---------- traffic kinds ----------
+
+    def benign(self) -> List[Dict[str, Any]]:
+        host = self.rng.choice(self.hosts)
+        ip = self._internal_ip()
+        kind = self.rng.random()
+        if kind < 0.6:
+            msg = self._nginx(ip, self.rng.choice(["GET", "GET", "GET", "POST"]), self.rng.choice(PATHS),
+                              self.rng.choice([200, 200, 200, 304, 404]))
+        elif kind < 0.75:
+            msg = self._sshd(f"Accepted publickey for {self.rng.choice(USERS)} from {ip} port {self.rng.randint(30000, 65000)} ssh2")
+        elif kind < 0.85:
+            msg = self._sshd(f"pam_unix(sshd:session): session opened for user {self.rng.choice(USERS)}")
+        elif kind < 0.95:
+            msg = self._sshd(f"Received disconnect from {ip} port {self.rng.randint(30000, 65000)}:11: disconnected by user")
+        else:
+            # the odd typo'd password from a legitimate user
+            msg = self._sshd(f"Failed password for {self.rng.choice(USERS)} from {ip} port {self.rng.randint(30000, 65000)} ssh2")
+        return [self._log(host, msg)]
+
+    def bruteforce(self) -> List[Dict[str, Any]]:
+        host = self.rng.choice(self.hosts)
+        ip = self._external_ip()
+        out = []
+        for _ in range(self.rng.randint(5, 30)):
+            user = self.rng.choice(ATTACK_USERS)
+            invalid = "" if user == "root" else "invalid user "
+            out.append(self._log(host, self._sshd(
+                f"Failed password for {invalid}{user} from {ip} port {self.rng.randint(30000, 65000)} ssh2"
+            )))
+        return out
+
+    def portscan(self) -> List[Dict[str, Any]]:
+        host = self.rng.choice(self.hosts)
+        ip = self._external_ip()
+        ports = self.rng.sample(range(1, 10000), self.rng.randint(10, 40))
+        return [
+            self._log(host, self._sshd(f"Connection from {ip} port {p} on 10.0.0.5 port 22"))
+            for p in ports
+        ]
+
+    def sqli(self) -> List[Dict[str, Any]]:
+        ip = self._external_ip()
+        return [self._log("web1", self._nginx(ip, "GET", self.rng.choice(SQLI), self.rng.choice([200, 403, 500])))]
+
+    def root_login(self) -> List[Dict[str, Any]]:
+        host = self.rng.choice(self.hosts)
+        ip = self._external_ip()
+        method = self.rng.choice(["password", "publickey"])
+        return [self._log(host, self._sshd(f"Accepted {method} for root from {ip} port {self.rng.randint(30000, 65000)} ssh2"))]
+
+    # ---------- stream ----------
+
+    def stream(self, n: int) -> Iterator[Dict[str, Any]]:
+        """Exactly n logs; attack episodes are truncated at the end if needed."""
+        kinds = list(self.mix.items())
+        emitted = 0
+        while emitted < n:
+            r = self.rng.random()
+            batch = None
+            for kind, share in kinds:
+                if r < share:
+                    batch = getattr(self, kind)()
+                    break
+                r -= share
+            if batch is None:
+                batch = self.benign()
+            for log in batch[: n - emitted]:
+                yield log
+            emitted += len(batch)
+
+    def logs(self, n: int) -> List[Dict[str, Any]]:
+        return list(self.stream(n))
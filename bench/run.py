@@ -0,0 +1,439 @@
+# bench/run.py
+# Benchmark suite. Micro-benchmarks (field extraction, each detection rule,
+# the whole rule engine) run on seeded synthetic traffic; end-to-end
+# benchmarks drive the FastAPI app in-process (POST /logs, POST /logs/batch,
+# the /stats* endpoints) against a local mongod or an in-memory stand-in;
+# pipeline checks drive the detection stage through injected write failures
+# and a late-stored seq. Results are compared with bench/baselines.json.
+#
+#   python -m bench.run --memory                 in-memory stand-in (mongomock-motor)
+#   python -m bench.run --mongo mongodb://localhost:27017
+#   python -m bench.run --memory --save-baseline
+#
+# Uses its own database (--db, default mini_siem_bench) and drops it first.
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# metric -> which direction is better
+LOWER = "lower"
+HIGHER = "higher"
+EXACT = "exact"  # e.g. alert counts: any change on the same seed is a behaviour change
+
+
+class Results:
+    def __init__(self):
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str) -> None:
+        self.metrics[name] = {"value": round(value, 3), "unit": unit, "better": better}
+        print(f"  {name:<40} {value:>12.3f} {unit}")
+
+
+def _pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# ---------- environment ----------
+
+def _use_memory_backend() -> None:
+    """
+    Swap the Mongo clients for in-memory ones (mongomock + mongomock-motor)
+    before backend.database is imported. Both clients share one store.
+    """
+    try:
+        import mongomock
+        import mongomock_motor
+        from mongomock.collection import BulkOperationBuilder
+    except ImportError:
+        sys.exit("--memory needs mongomock and mongomock-motor (pip install mongomock-motor)")
+    import inspect
+    import motor.motor_asyncio
+    import pymongo
+
+    store = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: store
+    motor.motor_asyncio.AsyncIOMotorClient = (
+        lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient(mock_mongo_client=store)
+    )
+    # newer pymongo passes sort= to bulk updates; older mongomock rejects it
+    if "sort" not in inspect.signature(BulkOperationBuilder.add_update).parameters:
+        add_update = BulkOperationBuilder.add_update
+
+        def _add_update(self, *args, sort=None, **kwargs):
+            return add_update(self, *args, **kwargs)
+
+        BulkOperationBuilder.add_update = _add_update
+
+
+# ---------- micro ----------
+
+def bench_micro(res: Results, logs: List[Dict[str, Any]], rounds: int) -> None:
+    """Best of `rounds` runs, each with a fresh engine (window state starts empty)."""
+    from backend.parsing import extract_fields
+    from backend.rule_engine import RuleEngine
+    from backend.config import settings
+    from backend.detector import _to_dt
+
+    print("micro:")
+    messages = [log["message"] for log in logs]
+    best_parse = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        parsed = [extract_fields(m) for m in messages]
+        best_parse = min(best_parse, time.perf_counter() - t0)
+    res.add("parse.extract_fields", best_parse / len(messages) * 1e6, "us/log", LOWER)
+
+    items = [({**log, **fields}, _to_dt(log["timestamp"])) for log, fields in zip(logs, parsed)]
+    best_eps = 0.0
+    rule_us: Dict[str, float] = {}
+    alerts = 0
+    for _ in range(rounds):
+        alerts = 0
+
+        async def _count(**_: Any) -> None:
+            nonlocal alerts
+            alerts += 1
+
+        engine = RuleEngine(settings.RULES_DIR, _count, reload_seconds=float("inf"), timed=True)
+        engine.load()
+
+        async def _run() -> float:
+            start = time.perf_counter()
+            for log, ts in items:
+                await engine.evaluate(log, ts)
+            return time.perf_counter() - start
+
+        best_eps = max(best_eps, len(items) / asyncio.run(_run()))
+        for name, s in engine.dispatcher.stats().items():
+            rule_us[name] = min(rule_us.get(name, float("inf")), s["avg_us"])
+
+    res.add("engine.events_per_sec", best_eps, "logs/s", HIGHER)
+    res.add("engine.alerts", alerts, "alerts", EXACT)
+    for name, us in rule_us.items():
+        res.add(f"rule.{name}", us, "us/eval", LOWER)
+    bench_anchor_scan(res, messages[:5000], rounds)
+
+
+def bench_anchor_scan(res: Results, messages: List[str], rounds: int) -> None:
+    """
+    Anchor scan cost as the rule set grows: without pyahocorasick
+    (fallback: regex scan up to 16 anchors, Python automaton above) and
+    with it, when installed.
+    """
+    import random
+    import string
+    from backend import dispatch
+
+    rng = random.Random(0)
+    words = ["union", "select", "failed password", "accepted", "port", "root"]
+    while len(words) < 1000:
+        words.append("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+
+    backends = ["fallback"] + (["pyahocorasick"] if dispatch.ahocorasick is not None else [])
+    for backend in backends:
+        for n in (10, 100, 1000):
+            module = dispatch.ahocorasick
+            if backend == "fallback":
+                dispatch.ahocorasick = None
+            try:
+                scanner = dispatch.AnchorScanner(words[:n])
+            finally:
+                dispatch.ahocorasick = module
+            best = float("inf")
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                for m in messages:
+                    scanner.scan(m)
+                best = min(best, time.perf_counter() - t0)
+            res.add(f"scan.{backend}.{n}_anchors", best / len(messages) * 1e6, "us/log", LOWER)
+
+
+# ---------- end to end ----------
+
+def bench_e2e(res: Results, logs: List[Dict[str, Any]], requests: int, batch_size: int, reps: int) -> None:
+    from fastapi.testclient import TestClient
+    from backend.app import app, ingest_queue
+    from backend.cache import response_cache
+    from backend.config import settings
+    from backend.database import sync_db
+
+    print("end-to-end:")
+    key = {"x-api-key": settings.API_KEY}
+    with TestClient(app) as client:
+        # POST /logs: per-request latency, then time until every log is stored
+        single = logs[:requests]
+        lat: List[float] = []
+        start = time.perf_counter()
+        for log in single:
+            t0 = time.perf_counter()
+            r = client.post("/logs", json=log, headers=key)
+            lat.append(time.perf_counter() - t0)
+            if r.status_code != 201:
+                sys.exit(f"POST /logs failed: {r.status_code} {r.text}")
+        _wait_for(lambda: sync_db["logs"].count_documents({}) >= len(single) and ingest_queue.depth() == 0)
+        elapsed = time.perf_counter() - start
+        res.add("post_logs.p50_ms", statistics.median(lat) * 1000, "ms", LOWER)
+        res.add("post_logs.p99_ms", _pct(lat, 0.99) * 1000, "ms", LOWER)
+        res.add("post_logs.stored_per_sec", len(single) / elapsed, "logs/s", HIGHER)
+
+        # POST /logs/batch
+        rest = logs[requests:]
+        start = time.perf_counter()
+        for i in range(0, len(rest), batch_size):
+            r = client.post("/logs/batch", json=rest[i:i + batch_size], headers=key)
+            if r.status_code != 200 or r.json()["rejected"]:
+                sys.exit(f"POST /logs/batch failed: {r.status_code} {r.text[:200]}")
+        if rest:
+            res.add("post_logs_batch.logs_per_sec", len(rest) / (time.perf_counter() - start), "logs/s", HIGHER)
+
+        token = client.post("/auth/login", json=_credentials()).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        # .best_ms is the computing path (response cache off), .cached_best_ms a cache hit
+        ttl = response_cache.ttl
+        for suffix, cache_ttl in (("best_ms", 0.0), ("cached_best_ms", ttl)):
+            response_cache.ttl = cache_ttl
+            for path in ("/stats", "/stats/alerts-over-time", "/stats/severity-distribution", "/stats/top-source-ips"):
+                times = []
+                for _ in range(reps):
+                    t0 = time.perf_counter()
+                    r = client.get(path, headers=auth)
+                    times.append(time.perf_counter() - t0)
+                    if r.status_code != 200:
+                        sys.exit(f"GET {path} failed: {r.status_code}")
+                # best-of: the median of a few ms-long requests is at the mercy of the scheduler
+                res.add(f"get{path.replace('/', '.')}.{suffix}", min(times) * 1000, "ms", LOWER)
+        response_cache.ttl = ttl
+
+
+# ---------- detection pipeline ----------
+
+def _fresh_detector() -> None:
+    """Empty window, aggregation and correlation state, as after a restart."""
+    from backend import detector
+    from backend.alerting import AlertAggregator
+    from backend.config import settings
+    from backend.correlation import CorrelationEngine
+    from backend.rule_engine import RuleEngine
+
+    detector.engine = RuleEngine(settings.RULES_DIR, detector._emit_alert, reload_seconds=float("inf"))
+    detector.engine.load()
+    detector.aggregator = AlertAggregator(
+        detector._open_alert, detector._update_alert_counts, window_seconds=settings.ALERT_SUPPRESS_SECONDS,
+    ) if settings.ALERT_SUPPRESS_SECONDS > 0 else None
+    detector.correlator = CorrelationEngine(os.path.join(settings.RULES_DIR, "correlation"), reload_seconds=float("inf"))
+    detector.correlator.load()
+    detector.settle()
+
+
+def bench_pipeline(res: Results, logs: List[Dict[str, Any]]) -> None:
+    """
+    Correctness of the detection stage, checked against a clean run:
+      - a batch whose alert writes fail now and then must record every rule
+        hit exactly once (retries resume, windows are not fed twice)
+      - a seq stored after the gap timeout must still be analysed
+    """
+    from backend import detector
+    from backend.database import sync_db
+    from backend.parsing import extract_fields
+    from backend.pipeline import DetectionStage
+
+    print("pipeline:")
+    docs = []
+    for seq, log in enumerate(logs, 1):
+        doc = {**log, "seq": seq, "timestamp": detector._to_dt(log["timestamp"])}
+        doc.update(extract_fields(doc["message"]))
+        docs.append(doc)
+
+    create, record = detector._create_alert, detector._record_alert
+    hits = 0
+
+    async def _counted(**kwargs: Any) -> None:
+        nonlocal hits
+        await record(**kwargs)
+        hits += 1
+
+    def _reset() -> None:
+        nonlocal hits
+        hits = 0
+        for name in ("logs", "alerts", "pipeline", "pipeline_failures"):
+            sync_db[name].delete_many({})
+        _fresh_detector()
+
+    def _alert_count() -> int:
+        return sum(a.get("count", 1) for a in sync_db["alerts"].find({}, {"count": 1}))
+
+    async def _run(stage: DetectionStage, batch_size: int) -> None:
+        for i in range(0, len(docs), batch_size):
+            await stage._process([dict(d) for d in docs[i:i + batch_size]])
+        if detector.aggregator is not None:
+            await detector.aggregator.flush()
+
+    detector._record_alert = _counted
+    try:
+        # clean run
+        _reset()
+        asyncio.run(_run(DetectionStage(max_retries=3), 500))
+        clean_hits, clean_count = hits, _alert_count()
+
+        # every 7th alert insert fails once; each failure costs a retry
+        _reset()
+        calls = 0
+
+        async def _flaky(**kwargs: Any) -> Any:
+            nonlocal calls
+            calls += 1
+            if calls % 7 == 0:
+                raise RuntimeError("injected write failure")
+            return await create(**kwargs)
+
+        detector._create_alert = _flaky
+        stage = DetectionStage(max_retries=3)
+        asyncio.run(_run(stage, 500))
+        detector._create_alert = create
+        if (hits, _alert_count()) != (clean_hits, clean_count):
+            sys.exit(f"retried batches recorded {hits} hits / count {_alert_count()}, "
+                     f"clean run {clean_hits} / {clean_count}")
+        res.add("pipeline.retry.hits", hits, "hits", EXACT)
+        res.add("pipeline.retry.alert_count", _alert_count(), "hits", EXACT)
+        res.add("pipeline.retry.retries", stage.retries, "retries", EXACT)
+
+        # seq 2 is written only after the stage has stepped over it
+        _reset()
+        stage = DetectionStage(poll_interval=0.01, gap_timeout=0.05, recheck_seconds=60)
+
+        async def _late() -> None:
+            sync_db["logs"].insert_many([d for d in docs[:200] if d["seq"] != 2])
+            await stage.start()
+            stage.notify(200)
+            while stage.gaps_skipped == 0:
+                await asyncio.sleep(0.01)
+            sync_db["logs"].insert_one(docs[1])
+            while stage.late_processed == 0:
+                await asyncio.sleep(0.01)
+            await stage.stop()
+
+        asyncio.run(asyncio.wait_for(_late(), 60))
+        if stage.processed != 200:
+            sys.exit(f"late seq: {stage.processed} of 200 logs analysed")
+        res.add("pipeline.gap.late_processed", stage.late_processed, "logs", EXACT)
+        res.add("pipeline.gap.processed", stage.processed, "logs", EXACT)
+    finally:
+        detector._create_alert, detector._record_alert = create, record
+
+
+def _credentials() -> Dict[str, str]:
+    return {
+        "username": os.getenv("BENCH_USER", "admin"),
+        "password": os.getenv("BENCH_PASSWORD", "admin123"),
+    }
+
+
+def _wait_for(cond: Callable[[], bool], timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            sys.exit("timed out waiting for the ingest queue to drain")
+        time.sleep(0.01)
+
+
+# ---------- baselines ----------
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """Print a baseline comparison; returns the names of regressed metrics."""
+    regressed = []
+    print(f"\n{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            print(f"{name:<40} {'-':>12} {cur['value']:>12.3f} {'new':>9}")
+            continue
+        change = (cur["value"] - base["value"]) / base["value"]
+        if cur["better"] == EXACT:
+            worse = change != 0
+        elif cur["better"] == LOWER:
+            worse = change > threshold
+        else:
+            worse = change < -threshold
+        flag = "  REGRESSION" if worse else ""
+        if worse:
+            regressed.append(name)
+        print(f"{name:<40} {base['value']:>12.3f} {cur['value']:>12.3f} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="mini-siem benchmarks")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--memory", action="store_true", help="in-memory Mongo stand-in (mongomock)")
+    target.add_argument("--mongo", help="MongoDB URI (default: MONGO_URI from the environment)")
+    parser.add_argument("--db", default="mini_siem_bench", help="database to use (dropped first)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--logs", type=int, default=20000, help="logs for the micro-benchmarks")
+    parser.add_argument("--requests", type=int, default=1000, help="single POST /logs requests")
+    parser.add_argument("--batch-logs", type=int, default=5000, help="logs sent via POST /logs/batch")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pipeline-logs", type=int, default=3000, help="logs for the detection pipeline checks")
+    parser.add_argument("--rounds", type=int, default=3, help="micro-benchmark rounds (best is kept)")
+    parser.add_argument("--reps", type=int, default=20, help="repetitions per /stats* endpoint")
+    parser.add_argument("--only", choices=["micro", "e2e", "pipeline"])
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = args.db
+    if args.mongo:
+        os.environ["MONGO_URI"] = args.mongo
+    if args.memory:
+        _use_memory_backend()
+    profile = "memory" if args.memory else "mongod"
+
+    from bench.generator import TrafficGenerator
+    from backend.database import sync_client
+
+    sync_client.drop_database(args.db)
+    res = Results()
+    if args.only in (None, "micro"):
+        bench_micro(res, TrafficGenerator(args.seed).logs(args.logs), args.rounds)
+    if args.only in (None, "e2e"):
+        logs = TrafficGenerator(args.seed + 1).logs(args.requests + args.batch_logs)
+        bench_e2e(res, logs, args.requests, args.batch_size, args.reps)
+    if args.only in (None, "pipeline"):
+        bench_pipeline(res, TrafficGenerator(args.seed + 2).logs(args.pipeline_logs))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res.metrics, f, indent=2)
+
+    baselines: Dict[str, Any] = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[profile] = {**baselines.get(profile, {}), **res.metrics}
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nsaved {profile} baseline to {BASELINES}")
+        return
+
+    regressed = compare(res.metrics, baselines.get(profile, {}), args.threshold)
+    if regressed:
+        print(f"\n{len(regressed)} metric(s) regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+    print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 // src/components/LiveStreamPanel.jsx
 import { useEffect, useState } from "react";
-import { getLogs } from "../services/api";
+import { getLogsPage } from "../services/api";
 import { formatDateTime } from "../utils";
 
 export default function LiveStreamPanel({ token }) {
@@ -8,11 +8,17 @@ export default function LiveStreamPanel({ token }) {
 
   useEffect(() => {
     let cancelled = false;
+    let since = null;
 
     async function load() {
       try {
-        const data = await getLogs(token, { limit: 10, page: 1 });
-        if (!cancelled) setEvents(data);
+        // first poll loads the top 10, later polls only fetch rows added since
+        const page = await getLogsPage(token, { limit: 10, since });
+        if (cancelled) return;
+        if (page.prev) since = page.prev;
+        if (page.items.length) {
+          setEvents((prev) => [...page.items, ...prev].slice(0, 10));
+        }
       } catch (err) {
         console.error("Failed to load live stream", err);
       }
@@ -3,7 +3,7 @@
 export const API_BASE = "http://127.0.0.1:8000";
 const TOKEN_KEY = "access_token";
 
-async function apiRequest(path, { method = "GET", token, body, params } = {}) {
+async function apiRequest(path, { method = "GET", token, body, params, withCursors = false } = {}) {
   const url = new URL(API_BASE + path);
 
   if (params) {
@@ -50,6 +50,13 @@ async function apiRequest(path, { method = "GET", token, body, params } = {}) {
   }
 
   if (res.status === 204) return null;
+  if (withCursors) {
+    return {
+      items: await res.json(),
+      next: res.headers.get("X-Next-Cursor"),
+      prev: res.headers.get("X-Prev-Cursor"),
+    };
+  }
   return res.json();
 }
 
@@ -81,6 +88,16 @@ export async function getLogs(token, { limit = 20, page = 1, ip, source, contain
   });
 }
 
+// Keyset paging: pass `next` back as cursor for older rows, `prev` as
+// since for rows added after this page.
+export async function getLogsPage(token, { limit = 20, cursor, since, ip, source, contains } = {}) {
+  return apiRequest("/logs", {
+    token,
+    params: { limit, cursor, since, ip, source, contains },
+    withCursors: true,
+  });
+}
+
 export async function getAlerts(token, { limit = 20, page = 1, ip, source, type, severity } = {}) {
   return apiRequest("/alerts", {
     token,